@@ -0,0 +1,53 @@
+# Bytes per AST node for a large generated program, measured with
+# tracemalloc: the tree as built by the parser, and the same tree in the
+# flat arena form (when pebble.ast provides it).
+#
+#     python benchmarks/bench_ast_memory.py [functions]
+import gc
+import os
+import sys
+import tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pebble.ast
+from pebble.lexer import RegexLexer
+from pebble.parser import Parser
+from generate import generate_program
+
+def count_nodes(tree):
+    # Written against plain attributes so it also runs on older trees.
+    count = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, pebble.ast.AST):
+            count += 1
+            names = getattr(node, '_fields', None) or vars(node)
+            stack.extend(getattr(node, name) for name in names)
+    return count
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+def main():
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    text = generate_program(functions)
+    tree, size = measure(lambda: Parser(RegexLexer(text)).program())
+    nodes = count_nodes(tree)
+    print(f"source: {len(text) / 1024:.0f} KB, {nodes} nodes")
+    print(f"    tree: {size / 1024 / 1024:.1f} MB ({size / nodes:.0f} bytes/node)")
+    if hasattr(pebble.ast, 'Arena'):
+        arena, size = measure(lambda: pebble.ast.Arena.from_tree(tree))
+        print(f"   arena: {size / 1024 / 1024:.1f} MB ({size / nodes:.0f} bytes/node)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Run time of each execution engine on a few small, hot programs: recursive
+# calls (fib), nested counting loops and array sums. Parsing is excluded;
+# compiling to closures/bytecode/Python is included.
+#
+#     python benchmarks/bench_engines.py [engine ...]
+import contextlib
+import io
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pebble.lexer import RegexLexer
+from pebble.parser import Parser
+from pebble.interpreter import Interpreter
+from pebble.closures import ClosureInterpreter
+from pebble.vm import VM
+from pebble.transpiler import PythonInterpreter
+
+ENGINES = {
+    'tree': Interpreter,
+    'closure': ClosureInterpreter,
+    'vm': VM,
+    'python': PythonInterpreter,
+}
+
+PROGRAMS = {
+    'fib': """
+        int fib(int n) {
+            if (n <= 1) return n;
+            return fib(n - 1) + fib(n - 2);
+        }
+        void main() { print(fib(22)); }
+    """,
+    'loops': """
+        void main() {
+            int sum = 0;
+            for (int i = 0; i < 300; i = i + 1) {
+                for (int j = 0; j < 300; j = j + 1) {
+                    sum = sum + i * j % 7;
+                }
+            }
+            print(sum);
+        }
+    """,
+    'arrays': """
+        void main() {
+            int[1000] a;
+            for (int i = 0; i < 1000; i = i + 1) {
+                a[i] = i;
+            }
+            int sum = 0;
+            for (int k = 0; k < 100; k = k + 1) {
+                for (int i = 0; i < 1000; i = i + 1) {
+                    sum = sum + a[i];
+                }
+            }
+            print(sum);
+        }
+    """,
+}
+
+def bench(engine, text, repeat=3):
+    best = None
+    for _ in range(repeat):
+        tree = Parser(RegexLexer(text)).program()
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            start = time.perf_counter()
+            engine(None).interpret(tree)
+            elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, out.getvalue().strip()
+
+def main():
+    names = sys.argv[1:] or list(ENGINES)
+    for program, text in PROGRAMS.items():
+        baseline = None
+        for name in names:
+            elapsed, output = bench(ENGINES[name], text)
+            if baseline is None:
+                baseline = elapsed
+            print(f"{program:>8} {name:>8}: {elapsed:.3f}s ({baseline / elapsed:.1f}x) -> {output}")
+
+if __name__ == '__main__':
+    main()
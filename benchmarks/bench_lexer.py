@@ -0,0 +1,45 @@
+# Tokens/sec of the character lexer versus the regex master-pattern lexer,
+# one get_next_token() at a time and through the bulk tokenize() stream.
+#
+#     python benchmarks/bench_lexer.py [functions]
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pebble.lexer import Lexer, RegexLexer, TokenType
+from generate import generate_program
+
+def count_tokens(lexer_class, text):
+    lexer = lexer_class(text)
+    count = 0
+    while lexer.get_next_token().type != TokenType.EOF:
+        count += 1
+    return count
+
+def count_stream(lexer_class, text):
+    return len(lexer_class(text).tokenize()) - 1
+
+def bench(counter, lexer_class, text, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = counter(lexer_class, text)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count, best
+
+def main():
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    text = generate_program(functions)
+    print(f"source: {len(text) / 1024:.0f} KB")
+    for counter, label in ((count_tokens, 'get_next_token'), (count_stream, 'tokenize')):
+        for lexer_class in (Lexer, RegexLexer):
+            tokens, elapsed = bench(counter, lexer_class, text)
+            name = f"{lexer_class.__name__}.{label}"
+            print(f"{name:>26}: {tokens} tokens in {elapsed:.3f}s "
+                  f"({tokens / elapsed:,.0f} tokens/sec)")
+
+if __name__ == '__main__':
+    main()
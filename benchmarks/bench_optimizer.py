@@ -0,0 +1,99 @@
+# Run time of each execution engine on call-heavy programs, with and without
+# the -O pass (pebble.optimizer), which inlines the small helpers. The
+# programs are typechecked either way. Parsing, checking and optimizing are
+# excluded; compiling is included.
+#
+#     python benchmarks/bench_optimizer.py [engine ...]
+import contextlib
+import io
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pebble.lexer import RegexLexer
+from pebble.parser import Parser
+from pebble.typechecker import typecheck
+from pebble.optimizer import optimize
+from pebble.interpreter import Interpreter
+from pebble.closures import ClosureInterpreter
+from pebble.vm import VM
+from pebble.transpiler import PythonInterpreter
+
+ENGINES = {
+    'tree': Interpreter,
+    'closure': ClosureInterpreter,
+    'vm': VM,
+    'python': PythonInterpreter,
+}
+
+PROGRAMS = {
+    'helpers': """
+        int sq(int x) { return x * x; }
+        int max(int a, int b) { if (a > b) return a; return b; }
+        int dist(int x, int y) { return sq(x) + sq(y); }
+        void main() {
+            int total = 0;
+            for (int i = 0; i < 200; i = i + 1) {
+                for (int j = 0; j < 100; j = j + 1) {
+                    total = max(total, dist(i - 100, j - 50) % 1000) + 1;
+                }
+            }
+            print(total);
+        }
+    """,
+    'strings': """
+        string s = "the quick brown fox jumps over the lazy dog";
+        bool is_vowel(string c) { return instr("aeiou", c) >= 0; }
+        string at(int i) { return mid(s, i, 1); }
+        void main() {
+            int vowels = 0;
+            for (int k = 0; k < 300; k = k + 1) {
+                for (int i = 0; i < length(s); i = i + 1) {
+                    if (is_vowel(at(i))) vowels = vowels + 1;
+                }
+            }
+            print(vowels);
+        }
+    """,
+    'arrays': """
+        int get(int xs[], int i) { return xs[i]; }
+        void swap(int xs[], int i, int j) { int t = xs[i]; xs[i] = xs[j]; xs[j] = t; }
+        void main() {
+            int[200] a;
+            for (int i = 0; i < 200; i = i + 1) a[i] = (i * 7919) % 200;
+            for (int i = 0; i < 200; i = i + 1) {
+                for (int j = 0; j < 199 - i; j = j + 1) {
+                    if (get(a, j) > get(a, j + 1)) swap(a, j, j + 1);
+                }
+            }
+            print(a[0] + a[199]);
+        }
+    """,
+}
+
+def bench(engine, text, optimized, repeat=3):
+    best = None
+    for _ in range(repeat):
+        tree = typecheck(Parser(RegexLexer(text)).program())
+        if optimized:
+            optimize(tree, typed=True)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            start = time.perf_counter()
+            engine(None).interpret(tree)
+            elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, out.getvalue().strip()
+
+def main():
+    names = sys.argv[1:] or list(ENGINES)
+    for program, text in PROGRAMS.items():
+        for name in names:
+            plain, output = bench(ENGINES[name], text, False)
+            optimized, optimized_output = bench(ENGINES[name], text, True)
+            assert optimized_output == output
+            print(f"{program:>8} {name:>8}: {plain:.3f}s, -O {optimized:.3f}s ({plain / optimized:.1f}x) -> {output}")
+
+if __name__ == '__main__':
+    main()
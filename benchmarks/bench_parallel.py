@@ -0,0 +1,37 @@
+# Wall time of the parallel front-end with 1/2/4/8 workers against a plain
+# serial parse of the same multi-megabyte source. Speedup is bounded by the
+# number of CPUs available (printed first).
+#
+#     python benchmarks/bench_parallel.py [functions]
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pebble.lexer import RegexLexer
+from pebble.parser import Parser
+from pebble.parallel import parse_parallel
+from generate import generate_program
+
+def bench(parse, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main():
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    text = generate_program(functions)
+    print(f"source: {len(text) / 1024 / 1024:.1f} MB, {os.cpu_count()} CPUs")
+    serial = bench(lambda: Parser(RegexLexer(text)).program())
+    print(f"     serial: {serial:.3f}s")
+    for workers in (1, 2, 4, 8):
+        elapsed = bench(lambda: parse_parallel(text, workers))
+        print(f"  {workers} workers: {elapsed:.3f}s ({serial / elapsed:.2f}x)")
+
+if __name__ == '__main__':
+    main()
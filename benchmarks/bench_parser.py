@@ -0,0 +1,37 @@
+# Parse throughput (tokens/sec of Parser.program(), lexing excluded) on
+# expression-heavy sources and on the usual generated program.
+#
+#     python benchmarks/bench_parser.py [statements]
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pebble.lexer import RegexLexer
+from pebble.parser import Parser
+from generate import generate_expressions, generate_program
+
+def bench(text, repeat=10):
+    best = None
+    for _ in range(repeat):
+        parser = Parser(RegexLexer(text))
+        start = time.perf_counter()
+        parser.program()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(parser.kinds) - 1, best
+
+def main():
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    sources = [
+        ('expressions', generate_expressions(statements)),
+        ('program', generate_program(statements // 5)),
+    ]
+    for label, text in sources:
+        tokens, elapsed = bench(text)
+        print(f"{label:>12}: {tokens} tokens in {elapsed:.3f}s "
+              f"({tokens / elapsed:,.0f} tokens/sec)")
+
+if __name__ == '__main__':
+    main()
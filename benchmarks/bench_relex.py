@@ -0,0 +1,46 @@
+# Per-edit cost of re-lexing the whole source versus relex() on the
+# previous token stream, for single-character insertions typed in bursts at
+# random places in the file (as in an editor).
+#
+#     python benchmarks/bench_relex.py [functions]
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pebble.lexer import RegexLexer, relex
+from generate import generate_program
+
+def main():
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    text = generate_program(functions)
+    print(f"source: {len(text) / 1024:.0f} KB")
+    random.seed(0)
+    edits = 200
+
+    start = time.perf_counter()
+    for _ in range(5):
+        RegexLexer(text).tokenize()
+    full = (time.perf_counter() - start) / 5
+
+    stream = RegexLexer(text).tokenize()
+    changed = 0
+    incremental = 0
+    for edit in range(edits):
+        if edit % 10 == 0:
+            # Move to another identifier.
+            offset = text.find('total', random.randrange(len(text) - 100))
+        text = text[:offset] + 'z' + text[offset:]
+        start = time.perf_counter()
+        stream, first, old_stop, new_stop = relex(stream, text, offset, 0, 'z')
+        incremental += (time.perf_counter() - start) / edits
+        changed += new_stop - first
+        offset += 1
+
+    print(f"  full re-lex: {full * 1000:.2f} ms per edit")
+    print(f"        relex: {incremental * 1000:.3f} ms per edit "
+          f"({changed / edits:.1f} tokens re-scanned)")
+
+if __name__ == '__main__':
+    main()
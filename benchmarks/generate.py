@@ -0,0 +1,56 @@
+# Synthetic Pebble sources shaped like our machine-generated programs:
+# many small functions with arithmetic, loops, strings and arrays.
+
+FUNCTION_TEMPLATE = """
+// generated helper {i}
+int helper_{i}(int a, int b) {{
+    int total = 0;
+    int[] scratch = {{{i}, a, b, a * b}};
+    for (int k = 0; k < 4; k = k + 1) {{
+        total = total + scratch[k] * (a - b) / (k + 1) % 97;
+    }}
+    if (total > {i} && a != b || !(b <= 0)) {{
+        string label = "helper {i}: " + total;
+        total = total + length(label);
+    }}
+    while (total >= 1000) {{
+        total = total - 1000;
+    }}
+    return total;
+}}
+"""
+
+MAIN_TEMPLATE = """
+void main() {{
+    int sum = 0;
+    for (int i = 0; i < {n}; i = i + 1) {{
+        sum = sum + i;
+    }}
+    print(sum);
+}}
+"""
+
+def generate_program(functions):
+    parts = [FUNCTION_TEMPLATE.format(i=i) for i in range(functions)]
+    parts.append(MAIN_TEMPLATE.format(n=functions))
+    return ''.join(parts)
+
+EXPRESSION_OPERATORS = ['+', '-', '*', '/', '%', '<', '<=', '>', '>=', '==', '!=', '&&', '||']
+
+def generate_expression(rng, depth):
+    if depth == 0 or rng.random() < 0.3:
+        return rng.choice(['x', 'y', 'n', '1', '42', 'true', 'arr[i]', 'f(x, 2)'])
+    if rng.random() < 0.15:
+        return rng.choice(['-', '!']) + generate_expression(rng, depth - 1)
+    if rng.random() < 0.2:
+        return f"({generate_expression(rng, depth - 1)})"
+    left = generate_expression(rng, depth - 1)
+    right = generate_expression(rng, depth - 1)
+    return f"{left} {rng.choice(EXPRESSION_OPERATORS)} {right}"
+
+def generate_expressions(statements, seed=0):
+    # One function full of long mixed-precedence expression statements.
+    import random
+    rng = random.Random(seed)
+    lines = [f"    x = {generate_expression(rng, 6)};\n" for _ in range(statements)]
+    return "void main() {\n    int x = 0;\n" + ''.join(lines) + "}\n"
@@ -1,34 +1,177 @@
+import argparse
+import io
 import sys
 import os
 
 # Add current directory to path so we can import pebble package
 sys.path.append(os.getcwd())
 
-from pebble.lexer import Lexer, LexerError
+from pebble import cache
+from pebble.lexer import StreamLexer, LexerError
 from pebble.parser import Parser
-from pebble.interpreter import Interpreter, ReturnException
+from pebble.ast import FunctionDecl
+from pebble.interpreter import Interpreter
+from pebble.closures import ClosureInterpreter
+from pebble.compiler import compile_program, disassemble
+from pebble.vm import VM, DEFAULT_MAX_DEPTH
+from pebble.tiered import TieredInterpreter, CALL_THRESHOLD, LOOP_THRESHOLD
+from pebble.transpiler import PythonInterpreter, transpile
+from pebble.typechecker import typecheck
+from pebble.optimizer import Optimizer
+from pebble.memo import memoize
+
+ENGINES = {
+    'tree': Interpreter,
+    'closure': ClosureInterpreter,
+    'vm': VM,
+    'python': PythonInterpreter,
+    'tiered': TieredInterpreter,
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a Pebble program.")
+    parser.add_argument('file', nargs='?', help="the .pebble source file")
+    parser.add_argument('--engine', choices=ENGINES, default='tree',
+                        help="how to run the program: walk the tree (default), compile it to closures, "
+                             "compile it to bytecode for the VM, translate it to Python, or walk the tree "
+                             "and compile hot functions to closures (tiered)")
+    parser.add_argument('--disassemble', action='store_true',
+                        help="print the program's bytecode (the generated Python with --engine python) "
+                             "instead of running it")
+    parser.add_argument('--typecheck', action='store_true',
+                        help="check the program's types before running it, and use operations "
+                             "specialized to them")
+    parser.add_argument('-O', dest='optimize', action='store_true',
+                        help="fold constant expressions, remove dead code and bounds checks that "
+                             "can't fail, inline small functions and hoist loop-invariant "
+                             "expressions before running, "
+                             "and report what changed on stderr")
+    parser.add_argument('--memoize', action='store_true',
+                        help="cache the results of pure functions, and report on stderr which "
+                             "qualified and how often their cache was hit")
+    parser.add_argument('--memoize-function', action='append', metavar='NAME',
+                        help="like --memoize, for the function NAME only (may be repeated)")
+    parser.add_argument('--max-depth', type=int,
+                        help="with --engine vm, how many calls may be in progress at once before "
+                             f"the program fails with a stack overflow (default {DEFAULT_MAX_DEPTH})")
+    parser.add_argument('--tier-calls', type=int, metavar='N',
+                        help="with --engine tiered, compile a function on its Nth call "
+                             f"(default {CALL_THRESHOLD})")
+    parser.add_argument('--tier-loops', type=int, metavar='N',
+                        help="with --engine tiered, compile a function on the first call after its "
+                             f"loops have run N iterations (default {LOOP_THRESHOLD})")
+    parser.add_argument('--tier-log', action='store_true',
+                        help="with --engine tiered, report each function compiled, and why, on stderr")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="neither read nor write the parsed-AST cache")
+    parser.add_argument('--clear-cache', action='store_true',
+                        help="remove the cached AST of <file> (or every entry in --cache-dir) and exit")
+    parser.add_argument('--lazy', action='store_true',
+                        help="parse function bodies on first call (syntax errors in a body are reported then)")
+    parser.add_argument('--cache-dir',
+                        help="keep .pebblec files here instead of next to the source")
+    args = parser.parse_args()
+    if args.file is None and not (args.clear_cache and args.cache_dir):
+        parser.error("the following arguments are required: file")
+    if args.max_depth is not None and args.engine != 'vm':
+        parser.error("--max-depth requires --engine vm")
+    if args.max_depth is not None and args.max_depth < 1:
+        parser.error("--max-depth must be at least 1")
+    if (args.tier_calls is not None or args.tier_loops is not None or args.tier_log) and args.engine != 'tiered':
+        parser.error("--tier-calls, --tier-loops and --tier-log require --engine tiered")
+    if args.tier_calls is not None and args.tier_calls < 1:
+        parser.error("--tier-calls must be at least 1")
+    if args.tier_loops is not None and args.tier_loops < 1:
+        parser.error("--tier-loops must be at least 1")
+    return args
+
+def parse(f, lazy):
+    # The lexer streams the file, decoding it exactly as opening it in text
+    # mode would; the parser has tokenized all of it once it is constructed.
+    with io.TextIOWrapper(f) as text:
+        parser = Parser(StreamLexer(text), lazy=lazy)
+    return parser.program()
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python pebble.py <file.pebble>")
-        sys.exit(1)
+    args = parse_args()
+
+    if args.clear_cache:
+        path = None if args.file is None else cache.cache_path(args.file, args.cache_dir)
+        cache.clear(path, args.cache_dir)
+        return
 
-    filepath = sys.argv[1]
+    filepath = args.file
     try:
-        with open(filepath, 'r') as f:
-            text = f.read()
+        f = open(filepath, 'rb')
     except FileNotFoundError:
         print(f"Error: File '{filepath}' not found.")
         sys.exit(1)
 
     try:
-        lexer = Lexer(text)
-        parser = Parser(lexer)
-        interpreter = Interpreter(parser)
-        interpreter.interpret()
+        if args.no_cache or not f.seekable():
+            # A pipe can't be read again after hashing it.
+            tree = parse(f, args.lazy)
+        else:
+            with f:
+                path = cache.cache_path(filepath, args.cache_dir)
+                digest = cache.digest(f)
+                tree = cache.load(path, digest)
+                if tree is None:
+                    f.seek(0)
+                    tree = parse(f, args.lazy)
+                    # Storing would have to parse every body, which is what
+                    # --lazy avoids (and it would report errors in dead code).
+                    if not args.lazy:
+                        cache.store(path, digest, tree)
+        if args.typecheck:
+            typecheck(tree)
+        if args.optimize:
+            optimizer = Optimizer(tree, typed=args.typecheck)
+            optimizer.optimize()
+            for line in optimizer.report():
+                print(f"optimizer: {line}", file=sys.stderr)
+        if args.memoize or args.memoize_function:
+            names = None if args.memoize else set(args.memoize_function)
+            report = memoize(tree, names)
+            for name in sorted(names or ()):
+                if name not in report:
+                    print(f"memoize: there is no function {name}", file=sys.stderr)
+            for name, reason in report.items():
+                if reason is None:
+                    print(f"memoize: {name} is pure", file=sys.stderr)
+                elif names:
+                    print(f"memoize: {name} is not memoized: {reason}", file=sys.stderr)
+        if args.disassemble:
+            if args.engine == 'python':
+                print(transpile(tree)[0], end='')
+            else:
+                print(disassemble(compile_program(tree)))
+            return
+        if args.max_depth is not None:
+            interpreter = VM(None, max_depth=args.max_depth)
+        elif args.engine == 'tiered':
+            log = None
+            if args.tier_log:
+                log = lambda message: print(f"tier-up: {message}", file=sys.stderr)
+            interpreter = TieredInterpreter(None,
+                call_threshold=args.tier_calls or CALL_THRESHOLD,
+                loop_threshold=args.tier_loops or LOOP_THRESHOLD,
+                log=log)
+        else:
+            interpreter = ENGINES[args.engine](None)
+        interpreter.interpret(tree)
+        for decl in tree.declarations:
+            if isinstance(decl, FunctionDecl) and decl.memo is not None:
+                memo = decl.memo
+                print(f"memoize: {memo.name}: {memo.hits} hit(s), {memo.misses} miss(es)", file=sys.stderr)
     except LexerError as e:
         print(f"Lexer Error: {e}")
         sys.exit(1)
+    except RecursionError:
+        # The other engines nest Python calls for each Pebble call.
+        print(f"Runtime Error: Stack overflow: the program nests too deeply for the {args.engine} engine"
+              + (" (--engine vm allows deeper recursion)" if args.engine != 'vm' else ""))
+        sys.exit(1)
     except Exception as e:
         print(f"Runtime Error: {e}")
         sys.exit(1)
@@ -1,104 +1,323 @@
+from array import array
+
+# Nodes use __slots__ and hold plain values (names, type names, literal
+# values) rather than lexer tokens. `_fields` lists each node's attributes in
+# constructor order; other slots hold annotations added after parsing (see
+# pebble.resolver, pebble.typechecker, pebble.bounds and pebble.memo).
 class AST:
-    pass
+    __slots__ = ()
+    _fields = ()
 
 class Program(AST):
+    __slots__ = ('declarations', 'spans')
+    _fields = ('declarations',)
+
     def __init__(self, declarations):
         self.declarations = declarations
+        # Set by parser.reparse(): (digest, start, declarations) for each
+        # declaration span of the source.
+        self.spans = None
 
 class VarDecl(AST):
+    _fields = ('type_node', 'name', 'value')
+    __slots__ = _fields + ('slot',)
+
     def __init__(self, type_node, name, value=None):
         self.type_node = type_node
         self.name = name
         self.value = value
+        self.slot = None # Set by the resolver
 
 class ArrayDecl(AST):
+    _fields = ('type_node', 'name', 'size', 'values')
+    __slots__ = _fields + ('slot',)
+
     def __init__(self, type_node, name, size, values=None):
         self.type_node = type_node
         self.name = name
         self.size = size # Integer literal or None if initialized with values
         self.values = values # List of expressions
+        self.slot = None # Set by the resolver
 
 class FunctionDecl(AST):
-    def __init__(self, type_node, name, params, block):
+    __slots__ = ('type_node', 'name', 'params', '_block', 'parse_block', 'varnames', 'memo')
+    _fields = ('type_node', 'name', 'params', 'block')
+
+    def __init__(self, type_node, name, params, block, parse_block=None):
         self.type_node = type_node
         self.name = name
         self.params = params
-        self.block = block
+        self._block = block
+        # Set instead of `block` when the body is parsed lazily: called (once)
+        # on first access to `block`.
+        self.parse_block = parse_block
+        self.varnames = None # Set by the resolver: the name of each frame slot
+        self.memo = None # Set by pebble.memo: the cache of its results
+
+    @property
+    def block(self):
+        if self.parse_block is not None:
+            self._block = self.parse_block()
+            self.parse_block = None
+        return self._block
+
+    @block.setter
+    def block(self, block):
+        self._block = block
+        self.parse_block = None
+
+    def __getstate__(self):
+        # The parser behind a lazy body can't be pickled; parse it now.
+        self.block
+        return super().__getstate__()
 
 class Param(AST):
+    __slots__ = _fields = ('type_node', 'name', 'is_array')
+
     def __init__(self, type_node, name, is_array=False):
         self.type_node = type_node
         self.name = name
         self.is_array = is_array
 
 class Block(AST):
+    _fields = ('statements',)
+    __slots__ = _fields + ('unset',)
+
     def __init__(self, statements):
         self.statements = statements
+        self.unset = () # Set by the resolver
 
 class Assign(AST):
+    _fields = ('name', 'value', 'index')
+    __slots__ = _fields + ('slot', 'in_bounds')
+
     def __init__(self, name, value, index=None):
         self.name = name
         self.value = value
         self.index = index # For array assignment
+        self.slot = None # Set by the resolver
+        # Set by pebble.bounds: the variable is a local array and the index
+        # a local in its range
+        self.in_bounds = False
 
 class If(AST):
+    __slots__ = _fields = ('condition', 'then_stmt', 'else_stmt')
+
     def __init__(self, condition, then_stmt, else_stmt=None):
         self.condition = condition
         self.then_stmt = then_stmt
         self.else_stmt = else_stmt
 
 class While(AST):
+    __slots__ = _fields = ('condition', 'body')
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
 
 class For(AST):
+    _fields = ('init', 'condition', 'update', 'body')
+    __slots__ = _fields + ('unset',)
+
     def __init__(self, init, condition, update, body):
         self.init = init
         self.condition = condition
         self.update = update
         self.body = body
+        self.unset = () # Set by the resolver
 
 class Return(AST):
+    __slots__ = _fields = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 class ExprStmt(AST):
+    __slots__ = _fields = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
+class Operator:
+    # The `op` of a BinOp or UnaryOp. It has the `type` and `value` of the
+    # operator token but no position, so nodes share one instance per
+    # operator (see get_operator()).
+    __slots__ = ('type', 'value')
+
+    def __init__(self, type, value):
+        self.type = type
+        self.value = value
+
+    def __repr__(self):
+        return f"Operator({self.type}, {self.value!r})"
+
+    def __reduce__(self):
+        return (get_operator, (self.type, self.value))
+
+OPERATORS = {}
+
+def get_operator(type, value):
+    op = OPERATORS.get(type)
+    if op is None:
+        op = OPERATORS[type] = Operator(type, value)
+    return op
+
 class BinOp(AST):
+    _fields = ('left', 'op', 'right')
+    __slots__ = _fields + ('spec',)
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
+        self.spec = None # Set by the type checker
 
 class UnaryOp(AST):
+    __slots__ = _fields = ('op', 'expr')
+
     def __init__(self, op, expr):
         self.op = op
         self.expr = expr
 
 class Literal(AST):
+    __slots__ = _fields = ('value', 'type_name')
+
     def __init__(self, value, type_name):
         self.value = value
         self.type_name = type_name # 'int', 'string', 'bool'
 
 class Var(AST):
-    def __init__(self, token):
-        self.token = token
-        self.value = token.value
+    _fields = ('value',)
+    __slots__ = _fields + ('slot',)
+
+    def __init__(self, value):
+        self.value = value # The variable name
+        self.slot = None # Set by the resolver
 
 class ArrayAccess(AST):
+    _fields = ('name', 'index')
+    __slots__ = _fields + ('slot', 'in_bounds')
+
     def __init__(self, name, index):
         self.name = name
         self.index = index
+        self.slot = None # Set by the resolver
+        self.in_bounds = False # As for Assign
 
 class Call(AST):
+    _fields = ('name', 'args')
+    __slots__ = _fields + ('target',)
+
     def __init__(self, name, args):
         self.name = name
         self.args = args
+        self.target = None # Set by the resolver
 
 class Type(AST):
-    def __init__(self, token):
-        self.token = token
-        self.value = token.value
+    __slots__ = _fields = ('value',)
+
+    def __init__(self, value):
+        self.value = value # 'int', 'string', 'bool' or 'void'
+
+def iter_child_nodes(node):
+    # Direct children of `node`, including the elements of list fields.
+    for name in node._fields:
+        value = getattr(node, name)
+        if isinstance(value, AST):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, AST):
+                    yield item
+
+def walk(node):
+    # `node` and all its descendants, parents before children.
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        children = list(iter_child_nodes(node))
+        children.reverse()
+        stack.extend(children)
+
+def dump(node):
+    # A string form of the tree, for comparing trees in tests and debugging.
+    if isinstance(node, list):
+        return '[' + ', '.join(dump(item) for item in node) + ']'
+    if isinstance(node, AST):
+        fields = ', '.join(f"{name}={dump(getattr(node, name))}" for name in node._fields)
+        return f"{type(node).__name__}({fields})"
+    return repr(node)
+
+# Node classes in Arena.kinds order; LIST stands for a list of nodes.
+NODE_CLASSES = [
+    Program, VarDecl, ArrayDecl, FunctionDecl, Param, Block, Assign, If, While, For,
+    Return, ExprStmt, BinOp, UnaryOp, Literal, Var, ArrayAccess, Call, Type,
+]
+NODE_KINDS = {cls: kind for kind, cls in enumerate(NODE_CLASSES)}
+LIST = len(NODE_CLASSES)
+
+class Arena:
+    # A tree flattened into arrays: node i has kind kinds[i] and its fields
+    # (in `_fields` order; for LIST, its items) in slots[starts[i]:starts[i + 1]].
+    # A slot is a node index (>= 0), -1 for None, or -2 - k for values[k]
+    # (a name, literal, type name or Operator). Children come before their
+    # parents, so the root is the last node.
+    def __init__(self):
+        self.kinds = array('B')
+        self.starts = array('i', [0])
+        self.slots = array('i')
+        self.values = []
+        self.value_slots = {} # (type, value) -> slot, so each value is stored once
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @classmethod
+    def from_tree(cls, tree):
+        arena = cls()
+        arena.add(tree)
+        return arena
+
+    def add(self, node):
+        # Append `node` and its descendants, returning its index.
+        if isinstance(node, list):
+            kind = LIST
+            items = node
+        else:
+            kind = NODE_KINDS[type(node)]
+            items = [getattr(node, name) for name in node._fields]
+        encoded = []
+        for item in items:
+            if isinstance(item, (AST, list)):
+                encoded.append(self.add(item))
+            elif item is None:
+                encoded.append(-1)
+            else:
+                key = (type(item), item)
+                slot = self.value_slots.get(key)
+                if slot is None:
+                    self.values.append(item)
+                    slot = self.value_slots[key] = -1 - len(self.values)
+                encoded.append(slot)
+        self.kinds.append(kind)
+        self.slots.extend(encoded)
+        self.starts.append(len(self.slots))
+        return len(self.kinds) - 1
+
+    def to_tree(self, index=None):
+        # Rebuild the tree rooted at node `index` (by default the root).
+        if index is None:
+            index = len(self.kinds) - 1
+        items = []
+        for slot in self.slots[self.starts[index]:self.starts[index + 1]]:
+            if slot >= 0:
+                items.append(self.to_tree(slot))
+            elif slot == -1:
+                items.append(None)
+            else:
+                items.append(self.values[-2 - slot])
+        kind = self.kinds[index]
+        if kind == LIST:
+            return items
+        return NODE_CLASSES[kind](*items)
@@ -0,0 +1,125 @@
+from pebble.lexer import TokenType
+from pebble.ast import *
+from pebble.builtins import Builtin
+from pebble.hoister import is_int
+
+# Array bounds-check elimination, run by pebble.optimizer on a resolved tree.
+# In a counted loop such as
+#
+#     for (int i = 0; i < length(a); i = i + 1) ... a[i] ...
+#
+# i starts at a non-negative int, only grows and is less than the length of
+# `a` whenever the body runs, so a[i] in the body is in range. Such accesses
+# and assignments get `in_bounds` set, and the engines index the list
+# without testing that it is one or the index.
+#
+# The loop's init must set a local to an int literal >= 0, its update (if
+# any) must add a positive int literal to it, and nothing else in the loop
+# may assign it. Its condition is `i < length(a)` or `i < N` for an int
+# literal N, or a chain of &&s with one of them. The index must be `i`
+# itself, and `a` a local the loop doesn't assign. Unless the program was
+# typechecked (`typed`), `a` could be a string, so it must be declared by
+# the only declaration of its slot in the function, an array declaration,
+# and never assigned; so must it for `i < N`, where the declaration has at
+# least N elements.
+#
+# Nothing in Pebble changes the length of an array; builtins are assumed not
+# to either.
+
+class BoundsChecks:
+    def __init__(self, typed=False):
+        self.typed = typed
+        self.removed = 0
+        self.sizes = None # Slot -> length of the arrays known in the function
+
+    def function(self, node):
+        self.sizes = self.array_sizes(node)
+        for child in walk(node.block):
+            if isinstance(child, For):
+                self.loop(child)
+        self.sizes = None
+
+    def array_sizes(self, node):
+        # The locals that only an array declaration assigns, and its length.
+        writes = {}
+        sizes = {}
+        for child in walk(node.block):
+            if isinstance(child, (VarDecl, ArrayDecl)):
+                slots = (child.slot,)
+            elif isinstance(child, Assign) and not child.index:
+                slots = child.slot if type(child.slot) is tuple else (child.slot,)
+            else:
+                continue
+            for slot in slots:
+                writes[slot] = writes.get(slot, 0) + 1
+            if isinstance(child, ArrayDecl):
+                sizes[child.slot] = len(child.values) if child.values is not None else child.size or 0
+        return {slot: size for slot, size in sizes.items()
+                if type(slot) is int and slot >= len(node.params) and writes[slot] == 1}
+
+    def loop(self, node):
+        counter = self.counter(node)
+        if counter is None:
+            return
+        assigned = set()
+        for part in (node.condition, node.update, node.body):
+            for child in walk(part) if part else ():
+                if isinstance(child, (VarDecl, ArrayDecl)):
+                    assigned.add(child.slot)
+                elif isinstance(child, Assign) and not child.index and child is not node.update:
+                    assigned.update(child.slot if type(child.slot) is tuple else (child.slot,))
+        if counter in assigned:
+            return
+
+        # The arrays the counter is an index of
+        arrays = set()
+        for bound in self.bounds(node.condition, counter):
+            if is_int(bound):
+                arrays.update(slot for slot, size in self.sizes.items() if size >= bound.value)
+            elif (isinstance(bound, Call) and isinstance(bound.target, Builtin) and
+                  bound.target.handler is len and isinstance(bound.args[0], Var)):
+                slot = bound.args[0].slot
+                if type(slot) is int and slot not in assigned and (self.typed or slot in self.sizes):
+                    arrays.add(slot)
+        if not arrays:
+            return
+
+        for child in walk(node.body):
+            if (isinstance(child, (ArrayAccess, Assign)) and child.slot in arrays and
+                    type(child.slot) is int and isinstance(child.index, Var) and
+                    child.index.slot == counter and not child.in_bounds):
+                child.in_bounds = True
+                self.removed += 1
+
+    def counter(self, node):
+        # The slot of the loop's counter, or None if it isn't counted.
+        init = node.init
+        if isinstance(init, VarDecl) or isinstance(init, Assign) and not init.index:
+            slot = init.slot
+            start = init.value
+        else:
+            return None
+        if type(slot) is not int or not is_int(start) or start.value < 0:
+            return None
+        update = node.update
+        if update is None:
+            return slot
+        if not isinstance(update, Assign) or update.index or update.slot != slot:
+            return None
+        step = update.value
+        if (isinstance(step, BinOp) and step.op.type == TokenType.PLUS and
+                isinstance(step.left, Var) and step.left.slot == slot and
+                is_int(step.right) and step.right.value > 0):
+            return slot
+        return None
+
+    def bounds(self, condition, counter):
+        # The X of each `counter < X` that the condition implies.
+        if not isinstance(condition, BinOp):
+            return []
+        if condition.op.type == TokenType.AND:
+            return self.bounds(condition.left, counter) + self.bounds(condition.right, counter)
+        if (condition.op.type == TokenType.LT and isinstance(condition.left, Var) and
+                condition.left.slot == counter):
+            return [condition.right]
+        return []
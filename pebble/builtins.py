@@ -0,0 +1,85 @@
+import sys
+
+# The built-in functions, by name. The resolver binds each call to its
+# Builtin (Call.target) before the program runs and checks the number of
+# arguments; builtins take precedence over user functions of the same name.
+# Embedders can add their own:
+#
+#     register_builtin('square', 1, lambda x: x * x, pure=True, total=True,
+#                      types=(('int',), 'int'))
+#
+# A handler is called with the evaluated arguments, in order. A `pure`
+# builtin only computes its result from its arguments (no I/O or other
+# effects), so optimizations may reorder, hoist or skip calls to it. A
+# `total` builtin also never fails on arguments of its declared types, so a
+# typechecked call may be moved before code that would have run first, or
+# hoisted out of a loop that might not run. `types`,
+# (parameter types, result type), is what pebble.typechecker checks calls
+# against; None for a parameter accepts any value.
+
+class Builtin:
+    def __init__(self, name, arity, handler, pure=False, types=None, total=False):
+        self.name = name
+        self.arity = arity
+        self.handler = handler
+        self.pure = pure
+        self.total = total
+        self.types = types
+
+    def __repr__(self):
+        return f"<builtin {self.name}>"
+
+    def __reduce__(self):
+        # Trees refer to builtins by name, so they can be pickled whatever
+        # the handler is.
+        return (get_builtin, (self.name,))
+
+BUILTINS = {}
+
+def register_builtin(name, arity, handler, pure=False, types=None, total=False):
+    builtin = BUILTINS[name] = Builtin(name, arity, handler, pure, types, total)
+    return builtin
+
+def get_builtin(name):
+    return BUILTINS[name]
+
+def print_value(value):
+    print(value) # prints to stdout with newline
+
+def read_int():
+    try:
+        # Use sys.stdin.readline() to allow mocking in tests
+        line = sys.stdin.readline()
+        if not line:
+            raise Exception("End of input")
+        return int(line.strip())
+    except ValueError:
+        return 0
+
+def read_line():
+    line = sys.stdin.readline()
+    if not line:
+        raise Exception("End of input")
+    return line.strip()
+
+def left(s, n):
+    return s[:n]
+
+def right(s, n):
+    return s[-n:]
+
+def mid(s, start, length):
+    return s[start:start + length]
+
+def instr(s, sub):
+    return s.find(sub)
+
+register_builtin('print', 1, print_value, types=((None,), 'void'))
+register_builtin('read_int', 0, read_int, types=((), 'int'))
+register_builtin('read_line', 0, read_line, types=((), 'string'))
+# length() also takes arrays (see TypeChecker.visit_Call).
+register_builtin('length', 1, len, pure=True, total=True, types=(('string',), 'int'))
+register_builtin('left', 2, left, pure=True, total=True, types=(('string', 'int'), 'string'))
+register_builtin('right', 2, right, pure=True, total=True, types=(('string', 'int'), 'string'))
+register_builtin('mid', 3, mid, pure=True, total=True, types=(('string', 'int', 'int'), 'string'))
+register_builtin('instr', 2, instr, pure=True, total=True, types=(('string', 'string'), 'int'))
@@ -0,0 +1,142 @@
+import array
+import gc
+import hashlib
+import io
+import os
+import pickle
+
+from pebble import __version__, ast, builtins, lexer
+
+# A .pebblec file is a header followed by the pickled Program:
+#
+#     MAGIC, FORMAT, one length byte + the interpreter version, sha256 of the source
+#
+# load() and store() take that digest (see digest()) rather than the source,
+# so pebble.py can hash the file in chunks and still stream it to the lexer
+# on a miss.
+#
+# A cached tree is only used when the whole header matches, so editing the
+# source or upgrading the interpreter invalidates it automatically.
+#
+# Entries aren't trusted. Anyone can compute the digest in the header, and
+# by default an entry sits next to the source, where anyone who can write
+# to that directory can replace it. So load() only lets the pickle create
+# what a tree is made of (ALLOWED: node classes, operators, builtins by name,
+# tokens and line indexes), and an entry that refers to anything else is a
+# miss. A crafted entry can still make a program behave unlike its source:
+# use --cache-dir or --no-cache for scripts in directories others can write.
+MAGIC = b'PEBBLEC\x01'
+# Bump whenever the pickled classes (pebble.ast, Token, LineIndex) change
+# shape, so trees cached by an older checkout are not loaded.
+FORMAT = 9
+SUFFIX = '.pebblec'
+CHUNK_SIZE = 65536
+
+# (module, name) -> what a pickled tree may refer to
+ALLOWED = {('pebble.ast', 'get_operator'): ast.get_operator,
+           ('pebble.builtins', 'get_builtin'): builtins.get_builtin,
+           ('pebble.lexer', 'Token'): lexer.Token,
+           ('pebble.lexer', 'LineIndex'): lexer.LineIndex,
+           ('array', '_array_reconstructor'): array._array_reconstructor}
+for name, value in vars(ast).items():
+    if isinstance(value, type) and issubclass(value, ast.AST):
+        ALLOWED['pebble.ast', name] = value
+
+class TreeUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        try:
+            return ALLOWED[module, name]
+        except KeyError:
+            raise pickle.UnpicklingError(f"{module}.{name} is not part of a tree") from None
+
+def cache_path(source_path, cache_dir=None):
+    if cache_dir is None:
+        # foo.pebble -> foo.pebblec, next to the source.
+        return os.path.splitext(source_path)[0] + SUFFIX
+    # Sources with the same name in different directories get separate entries.
+    source_path = os.path.abspath(source_path)
+    key = hashlib.sha256(source_path.encode()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(cache_dir, f"{name}.{key}{SUFFIX}")
+
+def digest(source):
+    # The sha256 of `source`: bytes, or a binary file read in chunks from its
+    # current position.
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).digest()
+    sha = hashlib.sha256()
+    while chunk := source.read(CHUNK_SIZE):
+        sha.update(chunk)
+    return sha.digest()
+
+def header(source_digest):
+    version = __version__.encode()
+    return MAGIC + bytes([FORMAT, len(version)]) + version + source_digest
+
+def load(path, source_digest):
+    # Returns the cached Program for the source with digest() `source_digest`,
+    # or None if there is no valid entry. Unreadable or stale files are
+    # treated as a miss.
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    expected = header(source_digest)
+    if not data.startswith(expected):
+        return None
+    # Unpickling allocates the whole tree at once, which would otherwise set
+    # off many collections that find nothing to free.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return TreeUnpickler(io.BytesIO(data[len(expected):])).load()
+    except Exception:
+        return None
+    finally:
+        if enabled:
+            gc.enable()
+
+def store(path, source_digest, tree):
+    # Write to a temporary file in the same directory and rename it over the
+    # entry, so readers never see a partial file. Failing to write the cache
+    # (read-only directory, a tree too deep to pickle) is not an error.
+    try:
+        payload = pickle.dumps(tree, pickle.HIGHEST_PROTOCOL)
+    except (RecursionError, pickle.PicklingError):
+        return False
+    directory = os.path.dirname(path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(header(source_digest))
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+def clear(path=None, cache_dir=None):
+    # Remove one entry, or every entry in `cache_dir`. Returns the number of
+    # files removed.
+    if path is not None:
+        paths = [path]
+    elif not os.path.isdir(cache_dir):
+        return 0
+    else:
+        paths = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+                 if name.endswith(SUFFIX)]
+    removed = 0
+    for path in paths:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
@@ -0,0 +1,510 @@
+from pebble.lexer import TokenType
+from pebble.ast import *
+from pebble.interpreter import Environment
+from pebble.resolver import Resolver, UNSET
+from pebble.builtins import Builtin
+
+# An alternative to Interpreter that turns each node into a Python closure
+# once and then runs the closures, instead of dispatching on the node type
+# every time a node is evaluated. Expression closures take the frame of the
+# running call (its locals, in the slots assigned by pebble.resolver) and
+# return a value; statement closures take the frame they run in and, like
+# Interpreter's visit methods, return None or the (value,) of a return
+# statement. Behaviour (scoping, errors, evaluation order) is the same as
+# Interpreter's.
+
+DEFAULT_VALUES = {'int': 0, 'string': "", 'bool': False}
+
+class ClosureCompiler:
+    # Compiles function bodies on their first call and caches them, so
+    # functions can be compiled one at a time (and called from elsewhere
+    # through call_function()).
+    def __init__(self, functions, globals, resolver=None):
+        self.functions = functions # Name -> FunctionDecl, shared with the caller
+        self.globals = globals
+        self.resolver = resolver # Resolves functions not resolved yet
+        self.compiled = {} # FunctionDecl -> compiled function
+
+    def call_function(self, func_decl, args):
+        function = self.compiled.get(func_decl)
+        if function is None:
+            function = self.compile_function(func_decl)
+        return function(args)
+
+    def compile_function(self, func_decl):
+        if func_decl.varnames is None:
+            self.resolver.resolve_function(func_decl)
+        name = func_decl.name
+        count = len(func_decl.params)
+        body = self.compile(func_decl.block)
+        unset = [UNSET] * (len(func_decl.varnames) - count)
+
+        def function(args):
+            if len(args) != count:
+                raise Exception(f"Function {name} expects {count} arguments, got {len(args)}")
+            result = body(args + unset)
+            if result is not None:
+                return result[0]
+            return None
+
+        memo = func_decl.memo
+        if memo is not None:
+            run = function
+            def function(args):
+                return memo.call(run, args)
+
+        self.compiled[func_decl] = function
+        return function
+
+    def compile(self, node):
+        method = getattr(self, 'compile_' + type(node).__name__, None)
+        if method is None:
+            message = f'No visit_{type(node).__name__} method'
+            def fail(frame):
+                raise Exception(message)
+            return fail
+        return method(node)
+
+    # Statements
+
+    def statement(self, node):
+        # A closure for `node` whose result can be passed on as the
+        # statement's completion: expression statements return None.
+        compiled = self.compile(node)
+        if not isinstance(node, ExprStmt):
+            return compiled
+        def expr_stmt(frame):
+            compiled(frame)
+        return expr_stmt
+
+    def compile_Block(self, node):
+        unset = node.unset
+
+        if returns(node):
+            statements = [self.statement(stmt) for stmt in node.statements]
+            def block(frame):
+                for slot in unset:
+                    frame[slot] = UNSET
+                for stmt in statements:
+                    result = stmt(frame)
+                    if result is not None:
+                        return result
+            return block
+
+        # Nothing in here returns, so the results can be ignored.
+        statements = [self.compile(stmt) for stmt in node.statements]
+        if unset:
+            def block(frame):
+                # Declarations made conditionally in this scope start out unset
+                for slot in unset:
+                    frame[slot] = UNSET
+                for stmt in statements:
+                    stmt(frame)
+        else:
+            def block(frame):
+                for stmt in statements:
+                    stmt(frame)
+        return block
+
+    def define(self, node):
+        # A closure storing its argument in the variable `node` declares.
+        slot = node.slot
+        if slot is None:
+            define = self.globals.define
+            name = node.name
+            def store(frame, value):
+                define(name, value)
+        else:
+            def store(frame, value):
+                frame[slot] = value
+        return store
+
+    def variable(self, slot, name):
+        # A closure reading the variable `name` resolved to `slot`.
+        if type(slot) is int:
+            def load(frame):
+                return frame[slot]
+        elif slot is None:
+            get = self.globals.get
+            def load(frame):
+                return get(name)
+        else:
+            get = self.globals.get
+            def load(frame):
+                for candidate in slot:
+                    if candidate is None:
+                        return get(name)
+                    value = frame[candidate]
+                    if value is not UNSET:
+                        return value
+                raise Exception(f"Undefined variable '{name}'")
+        return load
+
+    def compile_VarDecl(self, node):
+        store = self.define(node)
+        slot = node.slot
+        if node.value:
+            value = self.compile(node.value)
+            if slot is None:
+                def var_decl(frame):
+                    store(frame, value(frame))
+            else:
+                def var_decl(frame):
+                    frame[slot] = value(frame)
+        else:
+            default = DEFAULT_VALUES.get(node.type_node.value)
+            def var_decl(frame):
+                store(frame, default)
+        return var_decl
+
+    def compile_ArrayDecl(self, node):
+        store = self.define(node)
+        if node.values:
+            values = [self.compile(value) for value in node.values]
+            def array_decl(frame):
+                store(frame, [value(frame) for value in values])
+        else:
+            size = node.size
+            if size is None: # Should be caught by parser
+                size = 0
+            default = DEFAULT_VALUES.get(node.type_node.value, 0)
+            def array_decl(frame):
+                store(frame, [default] * size)
+        return array_decl
+
+    def compile_FunctionDecl(self, node):
+        # Functions are registered before main runs
+        def function_decl(frame):
+            pass
+        return function_decl
+
+    def compile_Assign(self, node):
+        name = node.name
+        slot = node.slot
+        value = self.compile(node.value)
+        if not node.index:
+            if type(slot) is int:
+                def assign(frame):
+                    frame[slot] = value(frame)
+            elif slot is None:
+                set_global = self.globals.assign
+                def assign(frame):
+                    set_global(name, value(frame))
+            else:
+                set_global = self.globals.assign
+                def assign(frame):
+                    item = value(frame)
+                    for candidate in slot:
+                        if candidate is None:
+                            set_global(name, item)
+                            return
+                        if frame[candidate] is not UNSET:
+                            frame[candidate] = item
+                            return
+            return assign
+
+        if node.in_bounds:
+            # See pebble.bounds
+            i = node.index.slot
+            def assign_item(frame):
+                frame[slot][frame[i]] = value(frame)
+            return assign_item
+
+        index = self.compile(node.index)
+        load = self.variable(slot, name)
+        def assign_item(frame):
+            item = value(frame)
+            i = index(frame)
+            arr = load(frame)
+            if not isinstance(arr, list):
+                raise Exception(f"Variable {name} is not an array")
+            if i < 0 or i >= len(arr):
+                raise Exception(f"Array index out of bounds: {i}")
+            arr[i] = item
+        return assign_item
+
+    def compile_If(self, node):
+        condition = self.compile(node.condition)
+        if returns(node):
+            then_stmt = self.statement(node.then_stmt)
+            else_stmt = self.statement(node.else_stmt) if node.else_stmt else None
+            def if_return(frame):
+                if condition(frame):
+                    return then_stmt(frame)
+                elif else_stmt:
+                    return else_stmt(frame)
+            return if_return
+
+        then_stmt = self.compile(node.then_stmt)
+        if not node.else_stmt:
+            def if_stmt(frame):
+                if condition(frame):
+                    then_stmt(frame)
+            return if_stmt
+
+        else_stmt = self.compile(node.else_stmt)
+        def if_else(frame):
+            if condition(frame):
+                then_stmt(frame)
+            else:
+                else_stmt(frame)
+        return if_else
+
+    def compile_While(self, node):
+        condition = self.compile(node.condition)
+        if returns(node.body):
+            body = self.statement(node.body)
+            def while_return(frame):
+                while condition(frame):
+                    result = body(frame)
+                    if result is not None:
+                        return result
+            return while_return
+
+        body = self.compile(node.body)
+        def while_stmt(frame):
+            while condition(frame):
+                body(frame)
+        return while_stmt
+
+    def compile_For(self, node):
+        init = self.compile(node.init) if node.init else None
+        condition = self.compile(node.condition) if node.condition else None
+        update = self.compile(node.update) if node.update else None
+        check = returns(node.body)
+        body = self.statement(node.body) if check else self.compile(node.body)
+        unset = node.unset
+
+        def for_stmt(frame):
+            # The loop variable declared in init has its own slot
+            for slot in unset:
+                frame[slot] = UNSET
+            if init:
+                init(frame)
+            while True:
+                if condition and not condition(frame):
+                    break
+                result = body(frame)
+                if check and result is not None:
+                    return result
+                if update:
+                    update(frame)
+        return for_stmt
+
+    def compile_Return(self, node):
+        if not node.value:
+            def return_none(frame):
+                return (None,)
+            return return_none
+
+        value = self.compile(node.value)
+        def return_stmt(frame):
+            return (value(frame),)
+        return return_stmt
+
+    def compile_ExprStmt(self, node):
+        # The expression closure works as a statement as it is, where its
+        # result is ignored (see statement()).
+        return self.compile(node.expr)
+
+    # Expressions
+
+    def compile_BinOp(self, node):
+        op = node.op.type
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+
+        if node.spec == 'int_add' or node.spec == 'str_concat':
+            # The type checker found no string conversion is needed.
+            def binop(frame):
+                return left(frame) + right(frame)
+        elif op == TokenType.AND:
+            def binop(frame):
+                if not left(frame): return False
+                return right(frame)
+        elif op == TokenType.OR:
+            def binop(frame):
+                if left(frame): return True
+                return right(frame)
+        elif op == TokenType.PLUS:
+            def binop(frame):
+                a = left(frame)
+                b = right(frame)
+                # String concatenation
+                if isinstance(a, str) or isinstance(b, str):
+                    return str(a) + str(b)
+                return a + b
+        elif op == TokenType.MINUS:
+            def binop(frame):
+                return left(frame) - right(frame)
+        elif op == TokenType.MUL:
+            def binop(frame):
+                return left(frame) * right(frame)
+        elif op == TokenType.DIV:
+            def binop(frame):
+                return int(left(frame) / right(frame)) # Integer division
+        elif op == TokenType.MOD:
+            def binop(frame):
+                return left(frame) % right(frame)
+        elif op == TokenType.EQ:
+            def binop(frame):
+                return left(frame) == right(frame)
+        elif op == TokenType.NEQ:
+            def binop(frame):
+                return left(frame) != right(frame)
+        elif op == TokenType.LT:
+            def binop(frame):
+                return left(frame) < right(frame)
+        elif op == TokenType.GT:
+            def binop(frame):
+                return left(frame) > right(frame)
+        elif op == TokenType.LTE:
+            def binop(frame):
+                return left(frame) <= right(frame)
+        elif op == TokenType.GTE:
+            def binop(frame):
+                return left(frame) >= right(frame)
+        else:
+            def binop(frame):
+                left(frame)
+                right(frame)
+                raise Exception(f"Unknown operator {op}")
+        return binop
+
+    def compile_UnaryOp(self, node):
+        op = node.op.type
+        expr = self.compile(node.expr)
+        if op == TokenType.MINUS:
+            def unary(frame):
+                return -expr(frame)
+        elif op == TokenType.NOT:
+            def unary(frame):
+                return not expr(frame)
+        elif op == TokenType.PLUS:
+            def unary(frame):
+                return +expr(frame)
+        else:
+            def unary(frame):
+                expr(frame)
+        return unary
+
+    def compile_Literal(self, node):
+        value = node.value
+        def literal(frame):
+            return value
+        return literal
+
+    def compile_Var(self, node):
+        return self.variable(node.slot, node.value)
+
+    def compile_ArrayAccess(self, node):
+        name = node.name
+        if node.in_bounds:
+            slot = node.slot
+            i = node.index.slot
+            def array_access(frame):
+                return frame[slot][frame[i]]
+            return array_access
+
+        index = self.compile(node.index)
+        load = self.variable(node.slot, name)
+
+        def array_access(frame):
+            i = index(frame)
+            arr = load(frame)
+            if not isinstance(arr, list):
+                raise Exception(f"Variable {name} is not an array")
+            if i < 0 or i >= len(arr):
+                raise Exception(f"Array index out of bounds: {i}")
+            return arr[i]
+        return array_access
+
+    def compile_Call(self, node):
+        # The resolver bound the call to its target and checked the number
+        # of arguments.
+        target = node.target
+        args = [self.compile(arg) for arg in node.args]
+        if target.__class__ is Builtin:
+            return builtin_call(target.handler, args)
+
+        # User defined functions. Until all declarations have run, a global's
+        # initializer can only call the functions declared before it, so the
+        # function is looked up by name until that finds the target.
+        name = node.name
+        functions = self.functions
+        call_function = self.call_function
+        compiled = self.compiled
+        compile_function = self.compile_function
+        bound = None
+
+        def call(frame):
+            nonlocal bound
+            if bound is None:
+                func = functions.get(name)
+                if func is not target:
+                    if not func:
+                        raise Exception(f"Undefined function '{name}'")
+                    return call_function(func, [arg(frame) for arg in args])
+                bound = compiled.get(target) or compile_function(target)
+            return bound([arg(frame) for arg in args])
+        return call
+
+def returns(stmt):
+    # Whether `stmt` can complete with a return statement.
+    if isinstance(stmt, Return):
+        return True
+    if isinstance(stmt, Block):
+        return any(returns(s) for s in stmt.statements)
+    if isinstance(stmt, If):
+        return returns(stmt.then_stmt) or (stmt.else_stmt is not None and returns(stmt.else_stmt))
+    if isinstance(stmt, (While, For)):
+        return returns(stmt.body)
+    return False
+
+def builtin_call(handler, args):
+    # A closure calling a builtin's handler with the values of `args`.
+    if len(args) == 0:
+        def call(frame):
+            return handler()
+    elif len(args) == 1:
+        a, = args
+        def call(frame):
+            return handler(a(frame))
+    elif len(args) == 2:
+        a, b = args
+        def call(frame):
+            return handler(a(frame), b(frame))
+    else:
+        def call(frame):
+            return handler(*[arg(frame) for arg in args])
+    return call
+
+class ClosureInterpreter:
+    # Drop-in replacement for Interpreter running on compiled closures.
+    def __init__(self, parser):
+        self.parser = parser
+        self.globals = Environment()
+        self.functions = {}
+        self.compiler = ClosureCompiler(self.functions, self.globals)
+
+    def interpret(self, tree=None):
+        # `tree` is an already parsed Program, e.g. one loaded from the cache.
+        if tree is None:
+            tree = self.parser.program()
+        self.compiler.resolver = Resolver(tree)
+        self.compiler.resolver.resolve()
+        # First pass: register all functions and global variables
+        for decl in tree.declarations:
+            if isinstance(decl, FunctionDecl):
+                self.functions[decl.name] = decl
+            elif isinstance(decl, VarDecl) or isinstance(decl, ArrayDecl):
+                self.compiler.compile(decl)(None)
+
+        # Look for main function
+        main = self.functions.get('main')
+        if not main:
+            raise Exception("No main function found")
+        self.call_function(main, [])
+
+    def call_function(self, func_decl, args):
+        return self.compiler.call_function(func_decl, args)
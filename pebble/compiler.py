@@ -0,0 +1,397 @@
+from array import array
+
+from pebble.lexer import TokenType
+from pebble.ast import *
+from pebble.resolver import resolve
+from pebble import builtins
+
+# Lowers a Program to bytecode for pebble.vm. Each function becomes a Code
+# object: a flat list of instructions, each an opcode (in `ops`) and one
+# operand (in `args`, 0 if unused). Operands are local slot numbers, jump
+# targets (instruction indices), counts, or indices into `consts` (literals,
+# names, nested Code objects).
+#
+# Locals live in the frame slots assigned by pebble.resolver; globals are
+# looked up by name at run time. A name that a conditional declaration may
+# shadow is loaded with LOAD_CHECKED, which tries each candidate slot.
+
+CONST = 0           # push consts[arg]
+LOAD = 1            # push locals[arg]
+STORE = 2           # pop into locals[arg]
+LOAD_GLOBAL = 3     # push the global consts[arg]
+STORE_GLOBAL = 4    # pop into the existing global consts[arg]
+DEFINE_GLOBAL = 5   # pop into the global consts[arg], creating it if needed
+LOAD_CHECKED = 6    # consts[arg] is (slots, name): push the first slot that is
+STORE_CHECKED = 7   # set, else the global `name` (None: the last slot is always set)
+UNSET = 8           # mark locals[arg] as not declared
+POP = 9
+JUMP = 10           # jump to arg
+JUMP_IF_FALSE = 11  # pop; jump to arg if false
+AND = 12            # pop; if false push False and jump to arg
+OR = 13             # pop; if true push True and jump to arg
+ADD = 14
+SUB = 15
+MUL = 16
+DIV = 17
+MOD = 18
+EQ = 19
+NE = 20
+LT = 21
+GT = 22
+LE = 23
+GE = 24
+NEG = 25
+NOT = 26
+POS = 27
+INDEX = 28          # pop array, index; push the element (consts[arg] is the name)
+STORE_INDEX = 29    # pop array, index, value
+BUILD_ARRAY = 30    # pop arg values into a new array
+NEW_ARRAY = 31      # consts[arg] is (default, size)
+FUNCTION = 32       # push the function called consts[arg]
+CALL = 33           # pop arg arguments and the function; call it
+RETURN = 34         # pop the return value
+RETURN_NONE = 35
+REGISTER = 36       # declare the function consts[arg] (a Code)
+PRINT = 37          # the built-ins, taking their arguments from the stack
+READ_INT = 38
+READ_LINE = 39
+LENGTH = 40
+LEFT = 41
+RIGHT = 42
+MID = 43
+INSTR = 44
+CALL_BUILTIN = 45   # call the Builtin consts[arg] with its arguments from the stack
+LOAD_ITEM = 46      # pop index; push locals[arg][index] (see pebble.bounds)
+STORE_ITEM = 47     # pop index, value into locals[arg][index]
+TAIL_CALL = 48      # like CALL, but the callee's frame replaces the caller's
+STORE_MEMO = 49     # store the value on top of the stack in a Memo (see pebble.vm)
+
+OPNAMES = [
+    'CONST', 'LOAD', 'STORE', 'LOAD_GLOBAL', 'STORE_GLOBAL', 'DEFINE_GLOBAL',
+    'LOAD_CHECKED', 'STORE_CHECKED', 'UNSET', 'POP', 'JUMP', 'JUMP_IF_FALSE',
+    'AND', 'OR', 'ADD', 'SUB', 'MUL', 'DIV', 'MOD', 'EQ', 'NE', 'LT', 'GT',
+    'LE', 'GE', 'NEG', 'NOT', 'POS', 'INDEX', 'STORE_INDEX', 'BUILD_ARRAY',
+    'NEW_ARRAY', 'FUNCTION', 'CALL', 'RETURN', 'RETURN_NONE', 'REGISTER',
+    'PRINT', 'READ_INT', 'READ_LINE', 'LENGTH', 'LEFT', 'RIGHT', 'MID',
+    'INSTR', 'CALL_BUILTIN', 'LOAD_ITEM', 'STORE_ITEM', 'TAIL_CALL',
+    'STORE_MEMO',
+]
+
+JUMPS = (JUMP, JUMP_IF_FALSE, AND, OR)
+
+BINARY_OPS = {
+    TokenType.PLUS: ADD,
+    TokenType.MINUS: SUB,
+    TokenType.MUL: MUL,
+    TokenType.DIV: DIV,
+    TokenType.MOD: MOD,
+    TokenType.EQ: EQ,
+    TokenType.NEQ: NE,
+    TokenType.LT: LT,
+    TokenType.GT: GT,
+    TokenType.LTE: LE,
+    TokenType.GTE: GE,
+}
+
+UNARY_OPS = {
+    TokenType.MINUS: NEG,
+    TokenType.NOT: NOT,
+    TokenType.PLUS: POS,
+}
+
+# Handlers of the standard builtins -> their opcodes. Others (or standard
+# names registered again with another handler) use CALL_BUILTIN.
+BUILTIN_OPS = {
+    builtins.print_value: PRINT,
+    builtins.read_int: READ_INT,
+    builtins.read_line: READ_LINE,
+    len: LENGTH,
+    builtins.left: LEFT,
+    builtins.right: RIGHT,
+    builtins.mid: MID,
+    builtins.instr: INSTR,
+}
+
+DEFAULT_VALUES = {'int': 0, 'string': "", 'bool': False}
+
+class Code:
+    def __init__(self, name, argcount):
+        self.name = name
+        self.argcount = argcount
+        self.nlocals = argcount
+        self.varnames = [] # Slot -> variable name, for disassemble()
+        self.ops = array('B')
+        self.args = array('i')
+        self.consts = []
+        self.const_indices = {} # (type, value) -> index, for literals and names
+        self.memo = None # The function's pebble.memo.Memo, if it is memoized
+
+    def __repr__(self):
+        return f"<code {self.name}>"
+
+class Compiler:
+    def __init__(self):
+        self.code = None
+
+    def compile_program(self, tree):
+        # Returns the Code for the top level: it defines the globals and
+        # registers the functions in declaration order, as Interpreter does.
+        # The caller then runs `main`.
+        resolve(tree)
+        program = self.code = Code('<program>', 0)
+        for decl in tree.declarations:
+            if isinstance(decl, FunctionDecl):
+                code = self.compile_function(decl)
+                self.code = program
+                self.emit(REGISTER, self.const(code))
+            elif isinstance(decl, (VarDecl, ArrayDecl)):
+                self.compile(decl)
+        self.emit(RETURN_NONE)
+        return program
+
+    def compile_function(self, node):
+        self.code = Code(node.name, len(node.params))
+        self.code.varnames = node.varnames
+        self.code.nlocals = len(node.varnames)
+        self.code.memo = node.memo
+        self.compile(node.block)
+        self.emit(RETURN_NONE)
+        return self.code
+
+    def emit(self, op, arg=0):
+        self.code.ops.append(op)
+        self.code.args.append(arg)
+        return len(self.code.ops) - 1
+
+    def here(self):
+        return len(self.code.ops)
+
+    def patch(self, index, target=None):
+        self.code.args[index] = self.here() if target is None else target
+
+    def const(self, value):
+        # Literals and names are stored once per Code; `True` and `1` are
+        # different constants.
+        code = self.code
+        key = (type(value), value) if isinstance(value, (int, str)) or value is None else id(value)
+        index = code.const_indices.get(key)
+        if index is None:
+            code.consts.append(value)
+            index = code.const_indices[key] = len(code.consts) - 1
+        return index
+
+    def compile(self, node):
+        method = getattr(self, 'compile_' + type(node).__name__, None)
+        if method is None:
+            raise Exception(f'No visit_{type(node).__name__} method')
+        method(node)
+
+    # Variables
+
+    def unset(self, slots):
+        for slot in slots:
+            self.emit(UNSET, slot)
+
+    def variable(self, slot, name, op, global_op, checked_op):
+        # Emit the access to variable `name` resolved to `slot`.
+        if slot is None:
+            self.emit(global_op, self.const(name))
+        elif isinstance(slot, int):
+            self.emit(op, slot)
+        elif slot[-1] is None:
+            self.emit(checked_op, self.const((slot[:-1], name)))
+        else:
+            self.emit(checked_op, self.const((slot, None)))
+
+    def load(self, slot, name):
+        self.variable(slot, name, LOAD, LOAD_GLOBAL, LOAD_CHECKED)
+
+    def store(self, slot, name):
+        self.variable(slot, name, STORE, STORE_GLOBAL, STORE_CHECKED)
+
+    def define(self, node):
+        # Store the value on the stack in the variable `node` declares.
+        if node.slot is None:
+            self.emit(DEFINE_GLOBAL, self.const(node.name))
+        else:
+            self.emit(STORE, node.slot)
+
+    # Statements
+
+    def compile_Block(self, node):
+        self.unset(node.unset)
+        for stmt in node.statements:
+            self.compile(stmt)
+
+    def compile_VarDecl(self, node):
+        if node.value:
+            self.compile(node.value)
+        else:
+            self.emit(CONST, self.const(DEFAULT_VALUES.get(node.type_node.value)))
+        self.define(node)
+
+    def compile_ArrayDecl(self, node):
+        if node.values:
+            for value in node.values:
+                self.compile(value)
+            self.emit(BUILD_ARRAY, len(node.values))
+        else:
+            size = node.size
+            if size is None: # Should be caught by parser
+                size = 0
+            default = DEFAULT_VALUES.get(node.type_node.value, 0)
+            self.emit(NEW_ARRAY, self.const((default, size)))
+        self.define(node)
+
+    def compile_FunctionDecl(self, node):
+        # Only valid at the top level; see compile_program()
+        pass
+
+    def compile_Assign(self, node):
+        self.compile(node.value)
+        if node.in_bounds:
+            self.compile(node.index)
+            self.emit(STORE_ITEM, node.slot)
+        elif node.index:
+            self.compile(node.index)
+            self.load(node.slot, node.name)
+            self.emit(STORE_INDEX, self.const(node.name))
+        else:
+            self.store(node.slot, node.name)
+
+    def compile_If(self, node):
+        self.compile(node.condition)
+        jump = self.emit(JUMP_IF_FALSE)
+        self.compile(node.then_stmt)
+        if node.else_stmt:
+            end = self.emit(JUMP)
+            self.patch(jump)
+            self.compile(node.else_stmt)
+            self.patch(end)
+        else:
+            self.patch(jump)
+
+    def compile_While(self, node):
+        top = self.here()
+        self.compile(node.condition)
+        jump = self.emit(JUMP_IF_FALSE)
+        self.compile(node.body)
+        self.emit(JUMP, top)
+        self.patch(jump)
+
+    def compile_For(self, node):
+        self.unset(node.unset)
+        if node.init:
+            self.compile(node.init)
+        top = self.here()
+        jump = None
+        if node.condition:
+            self.compile(node.condition)
+            jump = self.emit(JUMP_IF_FALSE)
+        self.compile(node.body)
+        if node.update:
+            self.compile(node.update)
+        self.emit(JUMP, top)
+        if jump is not None:
+            self.patch(jump)
+
+    def compile_Return(self, node):
+        value = node.value
+        if (isinstance(value, Call) and not isinstance(value.target, builtins.Builtin) and
+                value.target.memo is None):
+            # Nothing is left to do in this frame once the callee returns.
+            # (A memoized callee has to return through its own frame.)
+            self.compile_Call(value, TAIL_CALL)
+        elif value:
+            self.compile(value)
+            self.emit(RETURN)
+        else:
+            self.emit(RETURN_NONE)
+
+    def compile_ExprStmt(self, node):
+        self.compile(node.expr)
+        self.emit(POP)
+
+    # Expressions
+
+    def compile_BinOp(self, node):
+        op = node.op.type
+        self.compile(node.left)
+        if op == TokenType.AND or op == TokenType.OR:
+            jump = self.emit(AND if op == TokenType.AND else OR)
+            self.compile(node.right)
+            self.patch(jump)
+            return
+        self.compile(node.right)
+        if op not in BINARY_OPS:
+            raise Exception(f"Unknown operator {op}")
+        self.emit(BINARY_OPS[op])
+
+    def compile_UnaryOp(self, node):
+        self.compile(node.expr)
+        self.emit(UNARY_OPS[node.op.type])
+
+    def compile_Literal(self, node):
+        self.emit(CONST, self.const(node.value))
+
+    def compile_Var(self, node):
+        self.load(node.slot, node.value)
+
+    def compile_ArrayAccess(self, node):
+        self.compile(node.index)
+        if node.in_bounds:
+            self.emit(LOAD_ITEM, node.slot)
+            return
+        self.load(node.slot, node.name)
+        self.emit(INDEX, self.const(node.name))
+
+    def compile_Call(self, node, call=CALL):
+        # The resolver bound the call to its target and checked the number
+        # of arguments.
+        target = node.target
+        if isinstance(target, builtins.Builtin):
+            for arg in node.args:
+                self.compile(arg)
+            op = BUILTIN_OPS.get(target.handler)
+            if op is None:
+                self.emit(CALL_BUILTIN, self.const(target))
+            else:
+                self.emit(op)
+            return
+
+        # User defined functions are looked up (and may be undefined) before
+        # the arguments are evaluated.
+        self.emit(FUNCTION, self.const(node.name))
+        for arg in node.args:
+            self.compile(arg)
+        self.emit(call, len(node.args))
+
+def compile_program(tree):
+    return Compiler().compile_program(tree)
+
+def disassemble(code):
+    # A listing of `code` and the functions it registers, for debugging:
+    #
+    #     pc  >>  OPNAME  arg  (what the operand refers to)
+    #
+    # `>>` marks jump targets.
+    lines = [f"{code.name} (args={code.argcount}, locals={code.nlocals}):"]
+    targets = {code.args[i] for i, op in enumerate(code.ops) if op in JUMPS}
+    nested = []
+    for i, (op, arg) in enumerate(zip(code.ops, code.args)):
+        marker = '>>' if i in targets else '  '
+        line = f"{i:6} {marker} {OPNAMES[op]:<14}"
+        if op in (CONST, LOAD_GLOBAL, STORE_GLOBAL, DEFINE_GLOBAL, LOAD_CHECKED, STORE_CHECKED,
+                  INDEX, STORE_INDEX, NEW_ARRAY, FUNCTION, REGISTER):
+            line += f"{arg:<6}({code.consts[arg]!r})"
+            if op == REGISTER:
+                nested.append(code.consts[arg])
+        elif op in (LOAD, STORE, UNSET, LOAD_ITEM, STORE_ITEM):
+            line += f"{arg:<6}({code.varnames[arg]})"
+        elif op in JUMPS or op in (BUILD_ARRAY, CALL, TAIL_CALL):
+            line += f"{arg}"
+        lines.append(line.rstrip())
+    for function in nested:
+        lines.append('')
+        lines.append(disassemble(function))
+    return '\n'.join(lines)
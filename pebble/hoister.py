@@ -0,0 +1,261 @@
+from pebble.lexer import TokenType
+from pebble.ast import *
+from pebble.builtins import Builtin
+from pebble.resolver import conditional_declarations
+
+# Loop-invariant code motion, run by pebble.optimizer on a resolved tree.
+# An expression in a while or for loop whose variables aren't assigned in the
+# loop, and which calls only pure builtins, is evaluated once into a
+# temporary before the loop:
+#
+#     while (i < length(s) * 2) ...
+#
+# becomes
+#
+#     { int $1 = length(s) * 2; while (i < $1) ... }
+#
+# The temporaries are named with a `$`, which no Pebble identifier has. What
+# a loop's condition evaluates first, up to anything that could fail or have
+# an effect, already ran once before the first iteration, so moving it is
+# exact. Anything else is only hoisted if evaluating it can't fail: the loop
+# may not run it at all. Without the typechecker's annotations most
+# operations might fail on values of the wrong type, so a checked program
+# (`typed`) gets more hoisted.
+#
+# Loops that call user functions are left alone, as the callee may change
+# globals or the contents of arrays, and so are loops that are the whole body
+# of another statement and declare a variable (see
+# resolver.conditional_declarations), as they can't be moved into a block.
+
+SPECIALIZED_TYPES = {
+    'int_add': 'int', 'int_sub': 'int', 'int_mul': 'int', 'int_div': 'int', 'int_mod': 'int',
+    'str_concat': 'string', 'concat': 'string',
+}
+
+def result_type(node):
+    # The type of a hoisted expression, as far as it can be told without the
+    # variables' types. Only the typechecker looks at it, and the program was
+    # checked (if at all) before it was optimized.
+    if isinstance(node, Call):
+        return node.target.types[1] if node.target.types else 'int'
+    if isinstance(node, BinOp):
+        if node.spec is not None:
+            return SPECIALIZED_TYPES.get(node.spec, 'bool')
+        if node.op.type in (TokenType.PLUS, TokenType.MINUS, TokenType.MUL, TokenType.DIV, TokenType.MOD):
+            return 'int'
+        return 'bool'
+    if isinstance(node, UnaryOp):
+        return 'bool' if node.op.type == TokenType.NOT else 'int'
+    return node.type_name
+
+class Hoister:
+    def __init__(self, typed=False):
+        self.typed = typed
+        self.initialized = False # Whether every global is defined
+        self.hoisted = 0
+        self.temporaries = 0
+        # For the loop being optimized
+        self.assigned = None # Slots and global names assigned
+        self.modified = None # Those assigned an element
+        self.found = None # Key -> (name, VarDecl) of each temporary
+
+    def function(self, node, initialized):
+        # `initialized`: whether the function only runs once every global
+        # is defined.
+        self.initialized = initialized
+        node.block = self.statement(node.block)
+
+    # Statements. Inner loops are optimized before the loops around them.
+
+    def statement(self, node):
+        if isinstance(node, Block):
+            node.statements = [self.statement(stmt) for stmt in node.statements]
+        elif isinstance(node, If):
+            node.then_stmt = self.statement(node.then_stmt)
+            if node.else_stmt:
+                node.else_stmt = self.statement(node.else_stmt)
+        elif isinstance(node, While):
+            node.body = self.statement(node.body)
+            return self.loop(node)
+        elif isinstance(node, For):
+            node.body = self.statement(node.body)
+            return self.loop(node)
+        return node
+
+    def loop(self, node):
+        if any(conditional_declarations(node)):
+            return node
+        parts = [node.condition, node.body]
+        if isinstance(node, For):
+            parts.append(node.update)
+        self.assigned, self.modified = set(), set()
+        for part in parts:
+            for child in walk(part) if part else ():
+                if isinstance(child, Call) and not isinstance(child.target, Builtin):
+                    return node
+                if isinstance(child, (VarDecl, ArrayDecl)):
+                    self.assigned.add(child.name if child.slot is None else child.slot)
+                elif isinstance(child, Assign):
+                    self.assign(child)
+
+        self.found = {}
+        if node.condition:
+            node.condition = self.expr(node.condition, True)[0]
+        node.body = self.rewrite(node.body)
+        if isinstance(node, For) and node.update:
+            node.update = self.rewrite(node.update)
+        declarations = [decl for _, decl in self.found.values()]
+        self.found = self.assigned = self.modified = None
+        if not declarations:
+            return node
+
+        self.hoisted += len(declarations)
+        if isinstance(node, For) and node.init:
+            # The init runs first, and may declare what's hoisted.
+            declarations.insert(0, node.init)
+            node.init = None
+        return Block(declarations + [node])
+
+    def assign(self, node):
+        names = self.modified if node.index else self.assigned
+        if type(node.slot) is int:
+            names.add(node.slot)
+        elif node.slot is None:
+            names.add(node.name)
+        else:
+            names.update(node.name if slot is None else slot for slot in node.slot)
+
+    def rewrite(self, node):
+        # Hoist what can't fail from the statement `node`, wherever it is.
+        if isinstance(node, Block):
+            node.statements = [self.rewrite(stmt) for stmt in node.statements]
+        elif isinstance(node, If):
+            node.condition = self.expr(node.condition, False)[0]
+            node.then_stmt = self.rewrite(node.then_stmt)
+            if node.else_stmt:
+                node.else_stmt = self.rewrite(node.else_stmt)
+        elif isinstance(node, While):
+            node.condition = self.expr(node.condition, False)[0]
+            node.body = self.rewrite(node.body)
+        elif isinstance(node, For):
+            for field in ('init', 'update', 'body'):
+                if getattr(node, field):
+                    setattr(node, field, self.rewrite(getattr(node, field)))
+            if node.condition:
+                node.condition = self.expr(node.condition, False)[0]
+        elif isinstance(node, VarDecl):
+            if node.value:
+                node.value = self.expr(node.value, False)[0]
+        elif isinstance(node, ArrayDecl):
+            if node.values:
+                node.values = [self.expr(value, False)[0] for value in node.values]
+        elif isinstance(node, Assign):
+            node.value = self.expr(node.value, False)[0]
+            if node.index:
+                node.index = self.expr(node.index, False)[0]
+        elif isinstance(node, Return):
+            if node.value:
+                node.value = self.expr(node.value, False)[0]
+        elif isinstance(node, ExprStmt):
+            node.expr = self.expr(node.expr, False)[0]
+        return node
+
+    # Expressions
+
+    def expr(self, node, exact):
+        # Returns what replaces `node`, and whether evaluation is still exact
+        # after it. `exact`: whether nothing evaluated before `node` in the
+        # loop's first iteration could have failed or had an effect, other
+        # than what's already hoisted, in the same order.
+        if self.invariant(node) and (exact or not self.can_fail(node)):
+            if isinstance(node, (Var, Literal)):
+                return node, exact and not self.can_fail(node)
+            return self.temporary(node), exact
+
+        if isinstance(node, BinOp):
+            node.left, exact = self.expr(node.left, exact)
+            if node.op.type == TokenType.AND or node.op.type == TokenType.OR:
+                node.right, _ = self.expr(node.right, False)
+                return node, exact and not self.can_fail(node.right)
+            node.right, exact = self.expr(node.right, exact)
+        elif isinstance(node, UnaryOp):
+            node.expr, exact = self.expr(node.expr, exact)
+        elif isinstance(node, ArrayAccess):
+            node.index, exact = self.expr(node.index, exact)
+        elif isinstance(node, Call):
+            args = []
+            for arg in node.args:
+                arg, exact = self.expr(arg, exact)
+                args.append(arg)
+            node.args = args
+        return node, exact and not self.fails(node)
+
+    def temporary(self, node):
+        key = dump(node)
+        if key not in self.found:
+            self.temporaries += 1
+            name = f"${self.temporaries}"
+            self.found[key] = (name, VarDecl(Type(result_type(node)), name, node))
+        return Var(self.found[key][0])
+
+    def invariant(self, node, length=False):
+        # `length`: node is the argument of length(), which doesn't change
+        # when an element is assigned.
+        if isinstance(node, Literal):
+            return True
+        if isinstance(node, Var):
+            if node.slot is None or type(node.slot) is int:
+                names = [node.value if node.slot is None else node.slot]
+            else:
+                names = [node.value if slot is None else slot for slot in node.slot]
+            return not any(name in self.assigned or (not length and name in self.modified)
+                           for name in names)
+        if isinstance(node, BinOp):
+            return self.invariant(node.left) and self.invariant(node.right)
+        if isinstance(node, UnaryOp):
+            return self.invariant(node.expr)
+        if isinstance(node, Call):
+            target = node.target
+            if not isinstance(target, Builtin) or not target.pure:
+                return False
+            return all(self.invariant(arg, target.handler is len) for arg in node.args)
+        return False
+
+    def can_fail(self, node):
+        # Whether evaluating `node` might raise (or have an effect).
+        for child in walk(node):
+            if self.fails(child):
+                return True
+        return False
+
+    def fails(self, node):
+        return fails(node, self.typed, self.initialized)
+
+def is_int(node):
+    return isinstance(node, Literal) and node.type_name == 'int'
+
+def fails(node, typed, initialized):
+    # Whether the operation of `node` itself might raise (or have an
+    # effect), given its operands. `typed`: the program was typechecked.
+    # `initialized`: every global is defined.
+    if isinstance(node, Literal):
+        return False
+    if isinstance(node, Var):
+        # A global may not be initialized yet, and a conditional
+        # declaration may not have run.
+        if node.slot is None:
+            return not initialized
+        return type(node.slot) is not int
+    if isinstance(node, BinOp):
+        op = node.op.type
+        if op in (TokenType.AND, TokenType.OR, TokenType.EQ, TokenType.NEQ):
+            return False
+        if node.spec == 'int_div' or node.spec == 'int_mod':
+            return not (is_int(node.right) and node.right.value != 0)
+        return node.spec is None
+    if isinstance(node, UnaryOp):
+        return node.op.type != TokenType.NOT and not typed
+    if isinstance(node, Call):
+        # A total builtin doesn't fail on arguments of its declared types.
+        return not (typed and isinstance(node.target, Builtin) and node.target.total)
+    return True
@@ -0,0 +1,359 @@
+from pebble.lexer import TokenType
+from pebble.ast import *
+from pebble.builtins import Builtin
+from pebble.resolver import Resolver, conditional_declarations
+from pebble.typechecker import always_returns
+from pebble.hoister import fails
+
+# Inlining of small functions, run by pebble.optimizer on a resolved tree.
+# Pebble has no expressions that contain statements, so a call is inlined by
+# running the function's body just before the statement it is in, and using
+# the result in its place:
+#
+#     int sq(int x) { return x * x; }
+#     ... print(sq(a + 1) + 1); ...
+#
+# becomes
+#
+#     int $sq.1;
+#     { int $sq.1.x = a + 1; { $sq.1 = $sq.1.x * $sq.1.x; } }
+#     print($sq.1 + 1);
+#
+# The parameters and locals of each copy get names of their own, with a `$`
+# as no Pebble identifier has, so they can't clash with the caller's. A
+# return becomes an assignment to the result, and a return that isn't the
+# last thing to run (`if (c) return a; return b;`) takes what follows it
+# into the else branch of its if; a function that returns from inside a
+# loop isn't inlined.
+#
+# A call is only moved ahead of its statement if nothing the statement
+# evaluates before it can fail, have an effect or read a global (which the
+# callee might assign), and not at all from the
+# condition of a loop, which runs more than once. Calls in the functions
+# the globals' initializers call (`early`) stay, as a function isn't
+# defined there until its declaration has run.
+#
+# Only functions declared once, whose body has at most MAX_INLINE_SIZE
+# nodes, and that can't call themselves, even through other functions, are
+# inlined. Inlining stops when it has added MAX_GROWTH times the program's
+# size.
+
+MAX_INLINE_SIZE = 40
+MAX_GROWTH = 2
+
+def size(node):
+    return sum(1 for _ in walk(node))
+
+def returns_within(node):
+    return any(isinstance(child, Return) for child in walk(node))
+
+def clone(node, rename, values={}):
+    # A copy of the tree `node` with its annotations (but the same Call
+    # targets), where `rename` gives the new name of each local variable,
+    # and a local whose new name is in `values` is replaced by a copy of
+    # that node (which is a Var where the local is indexed).
+    if isinstance(node, Var) and type(node.slot) is int and rename(node.value) in values:
+        return clone(values[rename(node.value)], lambda name: name)
+    copy = object.__new__(type(node))
+    for cls in type(node).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            value = getattr(node, name)
+            if name in node._fields:
+                if isinstance(value, AST):
+                    value = clone(value, rename, values)
+                elif isinstance(value, list):
+                    value = [clone(item, rename, values) if isinstance(item, AST) else item for item in value]
+            setattr(copy, name, value)
+    if isinstance(copy, (VarDecl, ArrayDecl)):
+        copy.name = rename(copy.name)
+    elif isinstance(node, Var) and node.slot is not None:
+        copy.value = rename(copy.value)
+    elif isinstance(node, (Assign, ArrayAccess)) and node.slot is not None:
+        copy.name = rename(copy.name)
+        if copy.name in values:
+            copy.name, copy.slot = values[copy.name].value, values[copy.name].slot
+    return copy
+
+class Inliner:
+    def __init__(self, program, typed=False, early=()):
+        self.program = program
+        self.typed = typed
+        self.early = early
+        self.resolver = Resolver(program)
+        self.inlinable = {} # Name -> FunctionDecl
+        self.globals = {} # Name -> the globals an inlinable function uses
+        self.copies = 0
+        self.inlined = 0 # Calls inlined
+        self.budget = size(program) * MAX_GROWTH
+        self.function = None # The FunctionDecl being inlined into
+
+    def inline(self):
+        functions = {}
+        for decl in self.program.declarations:
+            if isinstance(decl, FunctionDecl):
+                functions.setdefault(decl.name, []).append(decl)
+        calls = {name: {node.name for node in walk(decls[-1].block)
+                        if isinstance(node, Call) and isinstance(node.target, FunctionDecl)}
+                 for name, decls in functions.items()}
+
+        # Callees come before their callers, so what is inlined has had its
+        # own calls inlined.
+        order, seen = [], set()
+        def visit(name):
+            seen.add(name)
+            for callee in calls[name]:
+                if callee not in seen:
+                    visit(callee)
+            order.append(name)
+        for name in functions:
+            if name not in seen:
+                visit(name)
+
+        for name in order:
+            decls = functions[name]
+            for decl in decls:
+                self.into(decl)
+            if len(decls) == 1 and not self.recursive(name, calls):
+                self.consider(decls[0])
+        return self.program
+
+    def recursive(self, name, calls):
+        # Whether the function `name` can call itself.
+        seen, work = set(), list(calls[name])
+        while work:
+            callee = work.pop()
+            if callee == name:
+                return True
+            if callee not in seen:
+                seen.add(callee)
+                work.extend(calls[callee])
+        return False
+
+    def consider(self, decl):
+        # Whether calls to `decl` can be inlined.
+        if size(decl.block) > MAX_INLINE_SIZE:
+            return
+        if decl.type_node.value != 'void' and (not always_returns(decl.block) or any(
+                isinstance(node, Return) and node.value is None for node in walk(decl.block))):
+            return # It could end without a value
+        used = set()
+        for node in walk(decl.block):
+            if isinstance(node, (Var, Assign, ArrayAccess)):
+                # Errors name the variable, which the copies rename: looking
+                # up a conditional declaration can fail, and so can
+                # indexing a local in a program that isn't typechecked.
+                if isinstance(node.slot, tuple):
+                    return
+                if (not self.typed and node.slot is not None and
+                        (isinstance(node, ArrayAccess) or isinstance(node, Assign) and node.index)):
+                    return
+                if node.slot is None:
+                    used.add(node.value if isinstance(node, Var) else node.name)
+        if self.tail(decl.block.statements, None) is None:
+            return
+        self.inlinable[decl.name] = decl
+        self.globals[decl.name] = used
+
+    def into(self, decl):
+        # Inline what can be in `decl`.
+        if decl.name in self.early:
+            return
+        self.function = decl
+        before = self.inlined
+        decl.block = self.statement(decl.block)
+        if self.inlined != before:
+            # The copies need their own slots before they are copied again.
+            self.resolver.resolve_function(decl)
+        self.function = None
+
+    # Statements
+
+    def statement(self, node, listed=False):
+        # `node`, or the statements that replace it. `listed`: it is in a
+        # block's list of statements, so several can replace it.
+        if isinstance(node, Block):
+            statements = []
+            for stmt in node.statements:
+                stmt = self.statement(stmt, True)
+                statements.extend(stmt if isinstance(stmt, list) else [stmt])
+            node.statements = statements
+            return node
+        if isinstance(node, If):
+            node.then_stmt = self.statement(node.then_stmt)
+            if node.else_stmt:
+                node.else_stmt = self.statement(node.else_stmt)
+        elif isinstance(node, (While, For)):
+            node.body = self.statement(node.body)
+            return node
+
+        if not listed and (isinstance(node, (VarDecl, ArrayDecl)) or any(conditional_declarations(node))):
+            return node # It can't be moved into a block
+        before = []
+        if isinstance(node, ExprStmt):
+            node.expr = self.extract(node.expr, before, used=False)[0]
+            if node.expr is None:
+                node = None
+        elif isinstance(node, VarDecl) and node.value:
+            node.value = self.extract(node.value, before)[0]
+        elif isinstance(node, ArrayDecl) and node.values:
+            values, exact = [], True
+            for value in node.values:
+                if exact:
+                    value, exact = self.extract(value, before)
+                values.append(value)
+            node.values = values
+        elif isinstance(node, Assign):
+            node.value, exact = self.extract(node.value, before)
+            if node.index and exact:
+                node.index = self.extract(node.index, before)[0]
+        elif isinstance(node, Return) and node.value:
+            node.value = self.extract(node.value, before)[0]
+        elif isinstance(node, If):
+            node.condition = self.extract(node.condition, before)[0]
+
+        if node is not None:
+            if not before:
+                return node
+            before.append(node)
+        if listed:
+            return before
+        return Block(before)
+
+    def tail(self, statements, result):
+        # `statements`, a function's body, with its returns turned into
+        # assignments to `result` (or into the evaluation of the value when
+        # None), or None if that can't be done.
+        out = []
+        for i, stmt in enumerate(statements):
+            rest = statements[i + 1:]
+            if isinstance(stmt, Return):
+                if stmt.value is not None:
+                    out.append(ExprStmt(stmt.value) if result is None else Assign(result, stmt.value))
+                return out
+            if not returns_within(stmt):
+                out.append(stmt)
+                continue
+            if isinstance(stmt, Block):
+                if rest and not always_returns(stmt):
+                    return None
+                inner = self.tail(stmt.statements, result)
+                if inner is None:
+                    return None
+                out.append(Block(inner))
+                return out
+            if not isinstance(stmt, If) or any(conditional_declarations(stmt)):
+                return None # A return in a loop
+            # What follows the if runs after the branches that don't return.
+            then_stmt = self.tail([stmt.then_stmt] + ([] if always_returns(stmt.then_stmt) else rest), result)
+            else_stmts = [stmt.else_stmt] if stmt.else_stmt else []
+            else_stmt = self.tail(else_stmts + ([] if stmt.else_stmt and always_returns(stmt.else_stmt) else rest),
+                                  result)
+            if then_stmt is None or else_stmt is None:
+                return None
+            out.append(If(stmt.condition, Block(then_stmt), Block(else_stmt) if else_stmt else None))
+            return out
+        return out
+
+    # Expressions
+
+    def can_inline(self, node):
+        if not isinstance(node, Call) or node.name not in self.inlinable:
+            return False
+        if node.target is not self.inlinable[node.name]:
+            return False
+        # A global the function uses mustn't be hidden by a local here.
+        if self.globals[node.name] & set(self.function.varnames or ()):
+            return False
+        return size(node.target.block) <= self.budget
+
+    def extract(self, node, before, used=True):
+        # Returns what replaces the expression `node`, after moving the
+        # calls in it that can be to `before`, and whether evaluation is
+        # still exact after it: whether nothing `node` evaluates other than
+        # what moved could fail or have an effect. `used`: whether the value
+        # of `node` is; if not, an inlined call is replaced by None.
+        if isinstance(node, BinOp):
+            node.left, exact = self.extract(node.left, before)
+            if not exact:
+                return node, False
+            if node.op.type == TokenType.AND or node.op.type == TokenType.OR:
+                return node, False # The right side may not run
+            node.right, exact = self.extract(node.right, before)
+        elif isinstance(node, UnaryOp):
+            node.expr, exact = self.extract(node.expr, before)
+        elif isinstance(node, ArrayAccess):
+            node.index, exact = self.extract(node.index, before)
+        elif isinstance(node, Call):
+            args, exact = [], True
+            for arg in node.args:
+                if exact:
+                    arg, exact = self.extract(arg, before)
+                args.append(arg)
+            node.args = args
+            # The arguments move along with the call, so they needn't be
+            # exact.
+            if self.can_inline(node):
+                if not used:
+                    before.extend(self.expand(node, None))
+                    return None, True
+                type_name = node.target.type_node.value
+                if type_name != 'void':
+                    result = f"${node.name}.{self.copies + 1}"
+                    before.extend(self.expand(node, result))
+                    return Var(result), True
+        elif isinstance(node, Var) and type(node.slot) is not int:
+            # A global (or what may be one) read here could be assigned by
+            # a callee moved before it.
+            return node, False
+        else:
+            exact = True
+        return node, exact and not fails(node, self.typed, True)
+
+    def expand(self, node, result):
+        # The statements that run the call `node`, declaring `result` and
+        # assigning its value to it (if not None).
+        decl = node.target
+        self.copies += 1
+        self.inlined += 1
+        prefix = f"${decl.name}.{self.copies}."
+        rename = lambda name: prefix + name
+
+        # A parameter the body doesn't assign, passed a literal or a local,
+        # is replaced by the argument. (An array's elements may be assigned.)
+        written, indexed = set(), set()
+        for child in walk(decl.block):
+            if isinstance(child, (VarDecl, ArrayDecl)) or isinstance(child, Assign) and not child.index:
+                written.add(child.name)
+            elif isinstance(child, (Assign, ArrayAccess)):
+                indexed.add(child.name)
+        params, values = [], {}
+        for param, arg in zip(decl.params, node.args):
+            name = rename(param.name)
+            if param.name not in written and (
+                    isinstance(arg, Literal) and param.name not in indexed or
+                    isinstance(arg, Var) and type(arg.slot) is int):
+                values[name] = arg
+                continue
+            params.append(VarDecl(Type(param.type_node.value), name, arg))
+        statements = self.tail(clone(decl.block, rename, values).statements, result)
+
+        declared = {param.name for param in params}
+        if any(d.name in declared for stmt in statements for d in conditional_declarations(stmt)):
+            # The body redeclares a parameter: keep their scopes apart.
+            statements = [Block(params + [Block(statements)])]
+        else:
+            # The names are the copy's own, so the parameters and the body
+            # can join the caller's statements.
+            statements = params + statements
+        if result is not None:
+            last = statements[-1] if statements else None
+            type_node = Type(decl.type_node.value)
+            if (isinstance(last, Assign) and last.name == result and
+                    sum(isinstance(child, Assign) and child.name == result
+                        for stmt in statements for child in walk(stmt)) == 1):
+                # The value is only computed at the end: declare it there.
+                statements[-1] = VarDecl(type_node, result, last.value)
+            else:
+                statements.insert(0, VarDecl(type_node, result))
+        self.budget -= sum(size(stmt) for stmt in statements)
+        return statements
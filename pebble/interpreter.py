@@ -1,10 +1,36 @@
 from pebble.lexer import TokenType
 from pebble.ast import *
-import sys
-
-class ReturnException(Exception):
-    def __init__(self, value):
-        self.value = value
+from pebble.resolver import Resolver, UNSET
+from pebble.builtins import Builtin
+import operator
+
+# Statements complete normally by returning None. A return statement
+# completes with the 1-tuple (value,), which each enclosing statement passes
+# on until call_function unpacks it.
+
+def concat(left, right):
+    return str(left) + str(right)
+
+def int_div(left, right):
+    return int(left / right) # Integer division
+
+# The operation named by a BinOp's `spec`, which the type checker sets when
+# the operand types are known, so no type tests are needed.
+SPECIALIZED = {
+    'int_add': operator.add,
+    'str_concat': operator.add,
+    'concat': concat,
+    'int_sub': operator.sub,
+    'int_mul': operator.mul,
+    'int_div': int_div,
+    'int_mod': operator.mod,
+    'lt': operator.lt,
+    'gt': operator.gt,
+    'le': operator.le,
+    'ge': operator.ge,
+    'eq': operator.eq,
+    'ne': operator.ne,
+}
 
 class Environment:
     def __init__(self, enclosing=None):
@@ -34,8 +60,10 @@ class Interpreter:
     def __init__(self, parser):
         self.parser = parser
         self.globals = Environment()
-        self.environment = self.globals
+        self.frame = None # Locals of the running call, indexed by slot
         self.functions = {}
+        self.declared = False # Whether all top-level declarations have run
+        self.resolver = None
 
     def visit(self, node):
         method_name = 'visit_' + type(node).__name__
@@ -45,8 +73,12 @@ class Interpreter:
     def generic_visit(self, node):
         raise Exception(f'No visit_{type(node).__name__} method')
 
-    def interpret(self):
-        tree = self.parser.program()
+    def interpret(self, tree=None):
+        # `tree` is an already parsed Program, e.g. one loaded from the cache.
+        if tree is None:
+            tree = self.parser.program()
+        self.resolver = Resolver(tree)
+        self.resolver.resolve()
         return self.visit(tree)
 
     def visit_Program(self, node):
@@ -56,52 +88,67 @@ class Interpreter:
                 self.functions[decl.name] = decl
             elif isinstance(decl, VarDecl) or isinstance(decl, ArrayDecl):
                 self.visit(decl)
+        self.declared = True
 
         # Look for main function
         main = self.functions.get('main')
         if not main:
             raise Exception("No main function found")
 
-        try:
-            self.call_function(main, [])
-        except ReturnException as e:
-            pass # main returned
+        self.call_function(main, [])
 
     def call_function(self, func_decl, args):
         # check args length
         if len(args) != len(func_decl.params):
             raise Exception(f"Function {func_decl.name} expects {len(func_decl.params)} arguments, got {len(args)}")
-
-        previous_env = self.environment
-        new_env = Environment(self.globals) # Functions are closures over globals only in this simple language, or should they be lexical?
-        # Standard procedural languages usually have lexical scope, but if functions are only top-level, then enclosing is globals.
-        # User said: "variables have block scope, and also globals defined at the beginning of the program."
-        # This implies functions can access globals.
-
-        self.environment = new_env
-
-        for param, arg in zip(func_decl.params, args):
-            self.environment.define(param.name, arg)
-
-        try:
-            self.visit(func_decl.block)
-        except ReturnException as r:
-            self.environment = previous_env
-            return r.value
-
-        self.environment = previous_env
+        return self.invoke(func_decl, args)
+
+    def invoke(self, func_decl, args):
+        # call_function() for arguments already known to match.
+        if func_decl.memo is not None:
+            return func_decl.memo.call(lambda args: self.run_function(func_decl, args), args)
+        return self.run_function(func_decl, args)
+
+    def run_function(self, func_decl, args):
+        if func_decl.varnames is None:
+            # A lazily parsed body is resolved on its first call.
+            self.resolver.resolve_function(func_decl)
+
+        # Functions only see their own locals and the globals.
+        previous_frame = self.frame
+        self.frame = list(args) + [UNSET] * (len(func_decl.varnames) - len(args))
+
+        result = self.visit(func_decl.block)
+        self.frame = previous_frame
+        if result is not None:
+            return result[0]
         return None
 
-    def visit_Block(self, node):
-        # Create new scope
-        previous_env = self.environment
-        self.environment = Environment(previous_env)
+    def define(self, node, value):
+        if node.slot is None:
+            self.globals.define(node.name, value)
+        else:
+            self.frame[node.slot] = value
+
+    def lookup(self, slot, name):
+        if slot is None:
+            return self.globals.get(name)
+        for candidate in slot:
+            if candidate is None:
+                return self.globals.get(name)
+            value = self.frame[candidate]
+            if value is not UNSET:
+                return value
+        raise Exception(f"Undefined variable '{name}'")
 
-        try:
-            for stmt in node.statements:
-                self.visit(stmt)
-        finally:
-            self.environment = previous_env
+    def visit_Block(self, node):
+        # Declarations made conditionally in this scope start out unset
+        for slot in node.unset:
+            self.frame[slot] = UNSET
+        for stmt in node.statements:
+            result = self.visit(stmt)
+            if result is not None:
+                return result
 
     def visit_VarDecl(self, node):
         value = None
@@ -112,12 +159,12 @@ class Interpreter:
              if node.type_node.value == 'int': value = 0
              elif node.type_node.value == 'string': value = ""
              elif node.type_node.value == 'bool': value = False
-        self.environment.define(node.name, value)
+        self.define(node, value)
 
     def visit_ArrayDecl(self, node):
         if node.values:
             values = [self.visit(v) for v in node.values]
-            self.environment.define(node.name, values)
+            self.define(node, values)
         else:
             size = node.size
             if size is None: # Should be caught by parser
@@ -125,7 +172,7 @@ class Interpreter:
             default_val = 0
             if node.type_node.value == 'string': default_val = ""
             elif node.type_node.value == 'bool': default_val = False
-            self.environment.define(node.name, [default_val] * size)
+            self.define(node, [default_val] * size)
 
     def visit_FunctionDecl(self, node):
         # Already handled in visit_Program
@@ -136,60 +183,80 @@ class Interpreter:
         if node.index:
             # Array assignment
             index = self.visit(node.index)
-            arr = self.environment.get(node.name)
+            if node.in_bounds:
+                self.frame[node.slot][index] = value
+                return
+            if type(node.slot) is int:
+                arr = self.frame[node.slot]
+            else:
+                arr = self.lookup(node.slot, node.name)
             if not isinstance(arr, list):
                 raise Exception(f"Variable {node.name} is not an array")
             if index < 0 or index >= len(arr):
                 raise Exception(f"Array index out of bounds: {index}")
             arr[index] = value
+        elif type(node.slot) is int:
+            self.frame[node.slot] = value
+        elif node.slot is None:
+            self.globals.assign(node.name, value)
         else:
-            self.environment.assign(node.name, value)
+            for slot in node.slot:
+                if slot is None:
+                    self.globals.assign(node.name, value)
+                    return
+                if self.frame[slot] is not UNSET:
+                    self.frame[slot] = value
+                    return
 
     def visit_If(self, node):
         if self.visit(node.condition):
-            self.visit(node.then_stmt)
+            return self.visit(node.then_stmt)
         elif node.else_stmt:
-            self.visit(node.else_stmt)
+            return self.visit(node.else_stmt)
 
     def visit_While(self, node):
         while self.visit(node.condition):
-            self.visit(node.body)
+            result = self.visit(node.body)
+            if result is not None:
+                return result
 
     def visit_For(self, node):
-        # Create a scope for the loop variable if declared in init
-        previous_env = self.environment
-        self.environment = Environment(previous_env) # Loop scope? Usually for loop variable scope depends on language.
-        # C99 allows `for (int i=...)` which is block scoped to the loop.
-
-        try:
-            if node.init:
-                self.visit(node.init)
-
-            while True:
-                if node.condition:
-                    if not self.visit(node.condition):
-                        break
-                else:
-                    # Infinite loop if no condition? Standard C behavior.
-                    pass
-
-                self.visit(node.body)
-
-                if node.update:
-                    self.visit(node.update)
-        finally:
-            self.environment = previous_env
+        # The loop variable declared in init is scoped to the loop
+        # (C99 style); the resolver gave it its own slot.
+        for slot in node.unset:
+            self.frame[slot] = UNSET
+
+        if node.init:
+            self.visit(node.init)
+
+        while True:
+            if node.condition:
+                if not self.visit(node.condition):
+                    break
+            else:
+                # Infinite loop if no condition? Standard C behavior.
+                pass
+
+            result = self.visit(node.body)
+            if result is not None:
+                return result
+
+            if node.update:
+                self.visit(node.update)
 
     def visit_Return(self, node):
         value = None
         if node.value:
             value = self.visit(node.value)
-        raise ReturnException(value)
+        return (value,)
 
     def visit_ExprStmt(self, node):
         self.visit(node.expr)
 
     def visit_BinOp(self, node):
+        if node.spec is not None:
+            return SPECIALIZED[node.spec](self.visit(node.left), self.visit(node.right))
+
         left = self.visit(node.left)
 
         # Short-circuit logical operators
@@ -243,11 +310,18 @@ class Interpreter:
         return node.value
 
     def visit_Var(self, node):
-        return self.environment.get(node.value)
+        if type(node.slot) is int:
+            return self.frame[node.slot]
+        return self.lookup(node.slot, node.value)
 
     def visit_ArrayAccess(self, node):
         index = self.visit(node.index)
-        arr = self.environment.get(node.name)
+        if node.in_bounds:
+            return self.frame[node.slot][index]
+        if type(node.slot) is int:
+            arr = self.frame[node.slot]
+        else:
+            arr = self.lookup(node.slot, node.name)
         if not isinstance(arr, list):
             raise Exception(f"Variable {node.name} is not an array")
         if index < 0 or index >= len(arr):
@@ -255,50 +329,19 @@ class Interpreter:
         return arr[index]
 
     def visit_Call(self, node):
-        # Handle built-ins first
-        if node.name == 'print':
-            val = self.visit(node.args[0])
-            print(val) # prints to stdout with newline
-            return None
-        elif node.name == 'read_int':
-            try:
-                # Use sys.stdin.readline() to allow mocking in tests
-                line = sys.stdin.readline()
-                if not line:
-                    raise Exception("End of input")
-                return int(line.strip())
-            except ValueError:
-                return 0
-        elif node.name == 'read_line':
-            line = sys.stdin.readline()
-            if not line:
-                 raise Exception("End of input")
-            return line.strip()
-        elif node.name == 'length':
-            s = self.visit(node.args[0])
-            return len(s)
-        elif node.name == 'left':
-            s = self.visit(node.args[0])
-            n = self.visit(node.args[1])
-            return s[:n]
-        elif node.name == 'right':
-            s = self.visit(node.args[0])
-            n = self.visit(node.args[1])
-            return s[-n:]
-        elif node.name == 'mid':
-            s = self.visit(node.args[0])
-            start = self.visit(node.args[1])
-            length = self.visit(node.args[2])
-            return s[start:start+length]
-        elif node.name == 'instr':
-            s = self.visit(node.args[0])
-            sub = self.visit(node.args[1])
-            return s.find(sub)
-
-        # User defined functions
-        func = self.functions.get(node.name)
-        if not func:
-            raise Exception(f"Undefined function '{node.name}'")
-
-        args = [self.visit(arg) for arg in node.args]
-        return self.call_function(func, args)
+        # The resolver bound the call to its target and checked the number
+        # of arguments.
+        target = node.target
+        if target.__class__ is Builtin:
+            return target.handler(*[self.visit(arg) for arg in node.args])
+
+        if not self.declared:
+            # A global's initializer can only call the functions declared
+            # before it.
+            func = self.functions.get(node.name)
+            if not func:
+                raise Exception(f"Undefined function '{node.name}'")
+            args = [self.visit(arg) for arg in node.args]
+            return self.call_function(func, args)
+
+        return self.invoke(target, [self.visit(arg) for arg in node.args])
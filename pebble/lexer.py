@@ -1,4 +1,8 @@
+import codecs
+import re
 import sys
+from array import array
+from bisect import bisect_left, bisect_right
 
 class TokenType:
     # Keywords
@@ -68,12 +72,186 @@ KEYWORDS = {
     'false': TokenType.FALSE,
 }
 
+# Fixed-lexeme tokens, keyed by lexeme.
+OPERATORS = {
+    '&&': TokenType.AND,
+    '||': TokenType.OR,
+    '==': TokenType.EQ,
+    '!=': TokenType.NEQ,
+    '<=': TokenType.LTE,
+    '>=': TokenType.GTE,
+    '+': TokenType.PLUS,
+    '-': TokenType.MINUS,
+    '*': TokenType.MUL,
+    '/': TokenType.DIV,
+    '%': TokenType.MOD,
+    '=': TokenType.ASSIGN,
+    '!': TokenType.NOT,
+    '<': TokenType.LT,
+    '>': TokenType.GT,
+    '(': TokenType.LPAREN,
+    ')': TokenType.RPAREN,
+    '{': TokenType.LBRACE,
+    '}': TokenType.RBRACE,
+    '[': TokenType.LBRACKET,
+    ']': TokenType.RBRACKET,
+    ';': TokenType.SEMI,
+    ',': TokenType.COMMA,
+}
+
+class TokenKind:
+    # Small-int counterparts of TokenType, used by TokenStream and the Parser.
+    # Keywords
+    IF = 0
+    ELSE = 1
+    WHILE = 2
+    FOR = 3
+    RETURN = 4
+    INT = 5
+    STRING = 6
+    BOOL = 7
+    VOID = 8
+    TRUE = 9
+    FALSE = 10
+
+    # Literals
+    INTEGER_LIT = 11
+    STRING_LIT = 12
+
+    # Identifiers
+    IDENTIFIER = 13
+
+    # Operators
+    PLUS = 14
+    MINUS = 15
+    MUL = 16
+    DIV = 17
+    MOD = 18
+    ASSIGN = 19
+    EQ = 20
+    NEQ = 21
+    LT = 22
+    GT = 23
+    LTE = 24
+    GTE = 25
+    AND = 26
+    OR = 27
+    NOT = 28
+
+    # Delimiters
+    LPAREN = 29
+    RPAREN = 30
+    LBRACE = 31
+    RBRACE = 32
+    LBRACKET = 33
+    RBRACKET = 34
+    SEMI = 35
+    COMMA = 36
+
+    EOF = 37
+
+# KIND_TYPES[kind] is the TokenType string for a TokenKind; TYPE_KINDS is the reverse.
+KIND_TYPES = [None] * (TokenKind.EOF + 1)
+for _name, _kind in vars(TokenKind).items():
+    if not _name.startswith('_'):
+        KIND_TYPES[_kind] = getattr(TokenType, _name)
+TYPE_KINDS = {token_type: kind for kind, token_type in enumerate(KIND_TYPES)}
+
+KEYWORD_KINDS = {lexeme: TYPE_KINDS[token_type] for lexeme, token_type in KEYWORDS.items()}
+OPERATOR_KINDS = {lexeme: TYPE_KINDS[token_type] for lexeme, token_type in OPERATORS.items()}
+
+# Token values implied by the kind alone. TokenStream only stores values for
+# identifiers and literals; everything else is recovered from this table.
+KIND_VALUES = [None] * len(KIND_TYPES)
+for _lexeme, _kind in KEYWORD_KINDS.items():
+    KIND_VALUES[_kind] = _lexeme
+for _lexeme, _kind in OPERATOR_KINDS.items():
+    KIND_VALUES[_kind] = _lexeme
+KIND_VALUES[TokenKind.TRUE] = True
+KIND_VALUES[TokenKind.FALSE] = False
+VALUE_KINDS = (TokenKind.IDENTIFIER, TokenKind.INTEGER_LIT, TokenKind.STRING_LIT)
+
+# One alternation over the whole grammar. `\s` and `\w` follow str.isspace() and
+# str.isalnum() exactly, so whitespace and identifiers match the character lexer.
+# Numbers are restricted to ASCII digits; anything the pattern cannot decide
+# (non-ASCII digits or letters, lone '&'/'|', unterminated strings, invalid
+# characters) is left to the character lexer so results and errors are identical.
+# Leading whitespace and comments are folded into the token match so each token
+# costs a single match call.
+SKIP_PATTERN = re.compile(r'(?:\s+|//[^\n]*)*')
+TOKEN_PATTERN = re.compile(r'''
+    (?=(?P<SKIP>(?:\s+|//[^\n]*)*))(?P=SKIP)  # atomic: never re-lex inside a comment
+    (?:
+    (?P<NAME>[A-Za-z_]\w*)
+  | (?P<OP>&&|\|\||[=!<>]=?|[-+*/%(){}\[\];,])
+  | (?P<NUMBER>[0-9]+(?![0-9]|[^\x00-\x7f]))
+  | (?P<STRING>"[^"]*")
+    )
+''', re.VERBOSE)
+
+class LineIndex:
+    # Offsets of every line start in a source, built on first use, so tokens
+    # only need to remember an offset. Lines and columns are 1-based.
+    def __init__(self, text):
+        self.text = text
+        self.length = len(text)
+        self.starts = None
+
+    def build(self):
+        self.starts = array('q', [0])
+        self.add_lines(self.text, 0)
+
+    def add_lines(self, text, offset):
+        starts = self.starts
+        find = text.find
+        pos = find('\n')
+        while pos != -1:
+            starts.append(offset + pos + 1)
+            pos = find('\n', pos + 1)
+
+    def feed(self, chunk):
+        # Extend the index with source that follows what it has seen so far,
+        # for sources that are never held in memory as a whole.
+        if self.starts is None:
+            self.build()
+        self.add_lines(chunk, self.length)
+        self.length += len(chunk)
+
+    def position(self, pos):
+        if self.starts is None:
+            self.build()
+        line = bisect_right(self.starts, pos)
+        column = pos - self.starts[line - 1] + 1
+        if pos >= self.length and pos:
+            # The end of input sits on the last character (column 0 after a
+            # trailing newline), which is where the character lexer left it.
+            column -= 1
+        return line, column
+
+    def __getstate__(self):
+        # Pickle only the line starts; the source itself is not needed to
+        # resolve positions once they are known.
+        if self.starts is None:
+            self.build()
+        return {'text': None, 'length': self.length, 'starts': self.starts}
+
 class Token:
-    def __init__(self, type, value, line, column):
+    def __init__(self, type, value, pos, line_index):
         self.type = type
         self.value = value
-        self.line = line
-        self.column = column
+        self.pos = pos # Offset of the first character in the source
+        self.line_index = line_index
+
+    @property
+    def line(self):
+        if self.type == TokenType.STRING_LIT:
+            # A string literal reports the line of its closing quote.
+            return self.line_index.position(self.pos + len(self.value) + 1)[0]
+        return self.line_index.position(self.pos)[0]
+
+    @property
+    def column(self):
+        return self.line_index.position(self.pos)[1]
 
     def __repr__(self):
         return f"Token({self.type}, {repr(self.value)}, line={self.line}, col={self.column})"
@@ -83,6 +261,41 @@ class Token:
             return self.type == other.type and self.value == other.value
         return False
 
+class TokenStream:
+    # A whole token stream as parallel arrays instead of one Token per token.
+    # kinds[i] is a TokenKind, offsets[i] its source offset and values[i] the
+    # literal or identifier value (None where KIND_VALUES already says what it
+    # is). The last token is always EOF.
+    def __init__(self, line_index):
+        self.kinds = array('B')
+        self.offsets = array('q')
+        self.values = []
+        self.line_index = line_index
+        # After relex(), offsets[gap:] are stored relative to the end of the
+        # source so edits do not have to shift them; use offset() to read them.
+        self.gap = None
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def append(self, token):
+        kind = TYPE_KINDS[token.type]
+        self.kinds.append(kind)
+        self.offsets.append(token.pos)
+        self.values.append(token.value if kind in VALUE_KINDS else None)
+
+    def offset(self, index):
+        if self.gap is not None and index >= self.gap:
+            return self.offsets[index] + self.line_index.length
+        return self.offsets[index]
+
+    def token(self, index):
+        kind = self.kinds[index]
+        value = self.values[index]
+        if value is None:
+            value = KIND_VALUES[kind]
+        return Token(KIND_TYPES[kind], value, self.offset(index), self.line_index)
+
 class LexerError(Exception):
     pass
 
@@ -90,26 +303,29 @@ class Lexer:
     def __init__(self, text):
         self.text = text
         self.pos = 0
-        self.line = 1
-        self.column = 1
+        self.line_index = LineIndex(text)
         self.current_char = self.text[self.pos] if self.text else None
 
+    # Positions are only worked out when an error message needs them.
+    @property
+    def line(self):
+        return self.line_index.position(self.pos)[0]
+
+    @property
+    def column(self):
+        return self.line_index.position(self.pos)[1]
+
     def error(self, msg=None):
         if msg is None:
             msg = f"Invalid character '{self.current_char}'"
         raise LexerError(f"{msg} at line {self.line}, column {self.column}")
 
     def advance(self):
-        if self.current_char == '\n':
-            self.line += 1
-            self.column = 0
-
         self.pos += 1
         if self.pos > len(self.text) - 1:
             self.current_char = None
         else:
             self.current_char = self.text[self.pos]
-            self.column += 1
 
     def peek(self):
         peek_pos = self.pos + 1
@@ -130,15 +346,15 @@ class Lexer:
 
     def number(self):
         result = ''
-        start_col = self.column
+        start_pos = self.pos
         while self.current_char is not None and self.current_char.isdigit():
             result += self.current_char
             self.advance()
-        return Token(TokenType.INTEGER_LIT, int(result), self.line, start_col)
+        return Token(TokenType.INTEGER_LIT, int(result), start_pos, self.line_index)
 
     def string(self):
         result = ''
-        start_col = self.column
+        start_pos = self.pos
         self.advance()  # Skip opening quote
         while self.current_char is not None and self.current_char != '"':
             result += self.current_char
@@ -148,11 +364,11 @@ class Lexer:
             raise LexerError(f"Unterminated string literal at line {self.line}")
 
         self.advance()  # Skip closing quote
-        return Token(TokenType.STRING_LIT, result, self.line, start_col)
+        return Token(TokenType.STRING_LIT, result, start_pos, self.line_index)
 
     def _id(self):
         result = ''
-        start_col = self.column
+        start_pos = self.pos
         while self.current_char is not None and (self.current_char.isalnum() or self.current_char == '_'):
             result += self.current_char
             self.advance()
@@ -164,7 +380,7 @@ class Lexer:
         elif token_type == TokenType.FALSE:
             value = False
 
-        return Token(token_type, value, self.line, start_col)
+        return Token(token_type, value, start_pos, self.line_index)
 
     def get_next_token(self):
         while self.current_char is not None:
@@ -187,7 +403,7 @@ class Lexer:
 
             if self.current_char == '&':
                 if self.peek() == '&':
-                    token = Token(TokenType.AND, '&&', self.line, self.column)
+                    token = Token(TokenType.AND, '&&', self.pos, self.line_index)
                     self.advance()
                     self.advance()
                     return token
@@ -196,7 +412,7 @@ class Lexer:
 
             if self.current_char == '|':
                 if self.peek() == '|':
-                    token = Token(TokenType.OR, '||', self.line, self.column)
+                    token = Token(TokenType.OR, '||', self.pos, self.line_index)
                     self.advance()
                     self.advance()
                     return token
@@ -204,114 +420,342 @@ class Lexer:
                     self.error("Expected '|'")
 
             if self.current_char == '+':
-                token = Token(TokenType.PLUS, '+', self.line, self.column)
+                token = Token(TokenType.PLUS, '+', self.pos, self.line_index)
                 self.advance()
                 return token
 
             if self.current_char == '-':
-                token = Token(TokenType.MINUS, '-', self.line, self.column)
+                token = Token(TokenType.MINUS, '-', self.pos, self.line_index)
                 self.advance()
                 return token
 
             if self.current_char == '*':
-                token = Token(TokenType.MUL, '*', self.line, self.column)
+                token = Token(TokenType.MUL, '*', self.pos, self.line_index)
                 self.advance()
                 return token
 
             if self.current_char == '/':
-                token = Token(TokenType.DIV, '/', self.line, self.column)
+                token = Token(TokenType.DIV, '/', self.pos, self.line_index)
                 self.advance()
                 return token
 
             if self.current_char == '%':
-                token = Token(TokenType.MOD, '%', self.line, self.column)
+                token = Token(TokenType.MOD, '%', self.pos, self.line_index)
                 self.advance()
                 return token
 
             if self.current_char == '(':
-                token = Token(TokenType.LPAREN, '(', self.line, self.column)
+                token = Token(TokenType.LPAREN, '(', self.pos, self.line_index)
                 self.advance()
                 return token
 
             if self.current_char == ')':
-                token = Token(TokenType.RPAREN, ')', self.line, self.column)
+                token = Token(TokenType.RPAREN, ')', self.pos, self.line_index)
                 self.advance()
                 return token
 
             if self.current_char == '{':
-                token = Token(TokenType.LBRACE, '{', self.line, self.column)
+                token = Token(TokenType.LBRACE, '{', self.pos, self.line_index)
                 self.advance()
                 return token
 
             if self.current_char == '}':
-                token = Token(TokenType.RBRACE, '}', self.line, self.column)
+                token = Token(TokenType.RBRACE, '}', self.pos, self.line_index)
                 self.advance()
                 return token
 
             if self.current_char == '[':
-                token = Token(TokenType.LBRACKET, '[', self.line, self.column)
+                token = Token(TokenType.LBRACKET, '[', self.pos, self.line_index)
                 self.advance()
                 return token
 
             if self.current_char == ']':
-                token = Token(TokenType.RBRACKET, ']', self.line, self.column)
+                token = Token(TokenType.RBRACKET, ']', self.pos, self.line_index)
                 self.advance()
                 return token
 
             if self.current_char == ';':
-                token = Token(TokenType.SEMI, ';', self.line, self.column)
+                token = Token(TokenType.SEMI, ';', self.pos, self.line_index)
                 self.advance()
                 return token
 
             if self.current_char == ',':
-                token = Token(TokenType.COMMA, ',', self.line, self.column)
+                token = Token(TokenType.COMMA, ',', self.pos, self.line_index)
                 self.advance()
                 return token
 
             if self.current_char == '=':
                 if self.peek() == '=':
-                    token = Token(TokenType.EQ, '==', self.line, self.column)
+                    token = Token(TokenType.EQ, '==', self.pos, self.line_index)
                     self.advance()
                     self.advance()
                     return token
                 else:
-                    token = Token(TokenType.ASSIGN, '=', self.line, self.column)
+                    token = Token(TokenType.ASSIGN, '=', self.pos, self.line_index)
                     self.advance()
                     return token
 
             if self.current_char == '!':
                 if self.peek() == '=':
-                    token = Token(TokenType.NEQ, '!=', self.line, self.column)
+                    token = Token(TokenType.NEQ, '!=', self.pos, self.line_index)
                     self.advance()
                     self.advance()
                     return token
                 else:
-                    token = Token(TokenType.NOT, '!', self.line, self.column)
+                    token = Token(TokenType.NOT, '!', self.pos, self.line_index)
                     self.advance()
                     return token
 
             if self.current_char == '<':
                 if self.peek() == '=':
-                    token = Token(TokenType.LTE, '<=', self.line, self.column)
+                    token = Token(TokenType.LTE, '<=', self.pos, self.line_index)
                     self.advance()
                     self.advance()
                     return token
                 else:
-                    token = Token(TokenType.LT, '<', self.line, self.column)
+                    token = Token(TokenType.LT, '<', self.pos, self.line_index)
                     self.advance()
                     return token
 
             if self.current_char == '>':
                 if self.peek() == '=':
-                    token = Token(TokenType.GTE, '>=', self.line, self.column)
+                    token = Token(TokenType.GTE, '>=', self.pos, self.line_index)
                     self.advance()
                     self.advance()
                     return token
                 else:
-                    token = Token(TokenType.GT, '>', self.line, self.column)
+                    token = Token(TokenType.GT, '>', self.pos, self.line_index)
                     self.advance()
                     return token
 
             self.error()
 
-        return Token(TokenType.EOF, None, self.line, self.column)
+        return Token(TokenType.EOF, None, self.pos, self.line_index)
+
+    def tokenize(self):
+        stream = TokenStream(self.line_index)
+        while True:
+            token = self.get_next_token()
+            stream.append(token)
+            if token.type == TokenType.EOF:
+                return stream
+
+class RegexLexer(Lexer):
+    # Scans with TOKEN_PATTERN and slices lexemes out of the text instead of
+    # walking it one character at a time. Produces the same tokens and the
+    # same LexerError messages as Lexer.
+    def __init__(self, text):
+        super().__init__(text)
+        self.base = 0 # Source offset of text[0]
+        self.eof = True # Whether text runs to the end of the source
+
+    @property
+    def line(self):
+        return self.line_index.position(self.base + self.pos)[0]
+
+    @property
+    def column(self):
+        return self.line_index.position(self.base + self.pos)[1]
+
+    def get_next_token(self):
+        text = self.text
+        base = self.base
+        match = TOKEN_PATTERN.match(text, self.pos)
+        if match is None:
+            self.pos = pos = SKIP_PATTERN.match(text, self.pos).end()
+            if pos >= len(text):
+                self.current_char = None
+                return Token(TokenType.EOF, None, base + pos, self.line_index)
+            # Let the character lexer handle the token (or raise the error).
+            self.current_char = text[pos]
+            token = super().get_next_token()
+            token.pos += base
+            return token
+
+        kind = match.lastgroup
+        pos, end = match.span(kind)
+        self.pos = end
+        if kind == 'OP':
+            lexeme = text[pos:end]
+            return Token(OPERATORS[lexeme], lexeme, base + pos, self.line_index)
+        if kind == 'NAME':
+            lexeme = text[pos:end]
+            token_type = KEYWORDS.get(lexeme, TokenType.IDENTIFIER)
+            if token_type == TokenType.TRUE:
+                lexeme = True
+            elif token_type == TokenType.FALSE:
+                lexeme = False
+            return Token(token_type, lexeme, base + pos, self.line_index)
+        if kind == 'NUMBER':
+            return Token(TokenType.INTEGER_LIT, int(text[pos:end]), base + pos, self.line_index)
+        return Token(TokenType.STRING_LIT, text[pos + 1:end - 1], base + pos, self.line_index)
+
+    def tokenize(self):
+        # Same tokens as repeated get_next_token() calls, written straight into
+        # the stream's arrays without building a Token for each one.
+        stream = TokenStream(self.line_index)
+        kinds = stream.kinds
+        offsets = stream.offsets
+        values = stream.values
+        match = TOKEN_PATTERN.match
+        keyword_kinds = KEYWORD_KINDS
+        operator_kinds = OPERATOR_KINDS
+        identifier = TokenKind.IDENTIFIER
+        text = self.text
+        base = self.base
+        pos = self.pos
+        # A match running into the end of a partial buffer may continue past it.
+        limit = len(text) + 1 if self.eof else len(text)
+        while True:
+            m = match(text, pos)
+            if m is None or m.end() >= limit:
+                # End of input, end of the buffer or a token for the character lexer.
+                self.pos = pos
+                token = self.get_next_token()
+                stream.append(token)
+                if token.type == TokenType.EOF:
+                    return stream
+                text = self.text
+                base = self.base
+                pos = self.pos
+                limit = len(text) + 1 if self.eof else len(text)
+                continue
+            group = m.lastgroup
+            start, pos = m.span(group)
+            offsets.append(base + start)
+            if group == 'NAME':
+                lexeme = text[start:pos]
+                kind = keyword_kinds.get(lexeme)
+                if kind is None:
+                    kinds.append(identifier)
+                    values.append(lexeme)
+                else:
+                    kinds.append(kind)
+                    values.append(None)
+            elif group == 'OP':
+                kinds.append(operator_kinds[text[start:pos]])
+                values.append(None)
+            elif group == 'NUMBER':
+                kinds.append(TokenKind.INTEGER_LIT)
+                values.append(int(text[start:pos]))
+            else:
+                kinds.append(TokenKind.STRING_LIT)
+                values.append(text[start + 1:pos - 1])
+
+class StreamLexer(RegexLexer):
+    # RegexLexer over a file object or mmap instead of a str. The source is
+    # pulled through a buffer of roughly chunk_size characters, so memory is
+    # bounded by the buffer (plus the longest token or line) rather than by
+    # the source. Binary sources and mmaps are decoded as UTF-8.
+    def __init__(self, source, chunk_size=65536):
+        super().__init__('')
+        self.source = source
+        self.chunk_size = chunk_size
+        self.decoder = None
+        self.eof = False
+        self.line_index.build()
+
+    def read(self):
+        chunk = self.source.read(self.chunk_size)
+        if isinstance(chunk, str):
+            return chunk
+        if self.decoder is None:
+            self.decoder = codecs.getincrementaldecoder('utf-8')()
+        text = self.decoder.decode(chunk, final=not chunk)
+        if chunk and not text:
+            return self.read() # Only part of a multi-byte character so far
+        return text
+
+    def fill(self):
+        # Drop what has been consumed and append the next chunk.
+        chunk = self.read()
+        if self.pos:
+            self.text = self.text[self.pos:]
+            self.base += self.pos
+            self.pos = 0
+        if chunk:
+            self.text += chunk
+            self.line_index.feed(chunk)
+        else:
+            self.eof = True
+        self.current_char = self.text[0] if self.text else None
+
+    def needs_more(self):
+        # Whether the next token might straddle the end of the buffer.
+        text = self.text
+        match = TOKEN_PATTERN.match(text, self.pos)
+        if match is not None:
+            if match.end() < len(text):
+                return False
+            self.pos = match.start(match.lastgroup)
+            return True
+        start = SKIP_PATTERN.match(text, self.pos).end()
+        if start == len(text):
+            # Whitespace or a comment up to the end: keep only its last line.
+            newline = text.rfind('\n', self.pos, start)
+            if newline != -1:
+                self.pos = newline + 1
+            return True
+        # An unterminated string may be closed by a later chunk. Anything else
+        # goes to the character lexer, whose tokens never cross a line.
+        return text[start] == '"' or text.find('\n', start) == -1
+
+    def get_next_token(self):
+        while not self.eof and self.needs_more():
+            self.fill()
+        return super().get_next_token()
+
+def relex(stream, text, offset, deleted, inserted):
+    # Update `stream` in place after an edit that replaced `deleted` characters
+    # at `offset` with `inserted`; `text` is the source after the edit. Tokens
+    # are re-scanned from the last token starting before the edit (any token
+    # start is a safe restart point) until a new token starts where an old one
+    # did past the edit; from there on the old tokens are kept.
+    # Returns (stream, start, old_stop, new_stop): old tokens [start:old_stop]
+    # were replaced by new tokens [start:new_stop].
+    #
+    # Offsets behind the edit are kept relative to the end of the source (a
+    # gap buffer), so they stay valid without being shifted; only the tokens
+    # between the previous edit and this one are converted.
+    kinds = stream.kinds
+    offsets = stream.offsets
+    old_length = stream.line_index.length
+    length = len(text)
+    gap = len(offsets) if stream.gap is None else stream.gap
+
+    start = bisect_left(offsets, offset, 0, gap)
+    if start == gap:
+        start = bisect_left(offsets, offset - old_length, gap)
+    start = max(start - 1, 0)
+    if gap > start:
+        offsets[start:gap] = array('q', map((-old_length).__add__, offsets[start:gap]))
+    elif gap < start:
+        offsets[gap:start] = array('q', map(old_length.__add__, offsets[gap:start]))
+    stream.gap = start
+
+    lexer = RegexLexer(text)
+    if offset > offsets[start] + old_length:
+        lexer.pos = offsets[start] + old_length
+    edit_end = offset + len(inserted)
+    new_kinds = array('B')
+    new_offsets = array('q')
+    new_values = []
+    old_stop = start
+    while True:
+        token = lexer.get_next_token()
+        if token.pos >= edit_end:
+            # Old tokens past the edit sit at the same distance from the end.
+            old_stop = bisect_left(offsets, token.pos - length, old_stop)
+            if old_stop < len(offsets) and offsets[old_stop] == token.pos - length:
+                break
+        kind = TYPE_KINDS[token.type]
+        new_kinds.append(kind)
+        new_offsets.append(token.pos)
+        new_values.append(token.value if kind in VALUE_KINDS else None)
+
+    kinds[start:old_stop] = new_kinds
+    offsets[start:old_stop] = new_offsets
+    stream.values[start:old_stop] = new_values
+    stream.gap = start + len(new_kinds)
+    stream.line_index = LineIndex(text)
+    return stream, start, old_stop, stream.gap
@@ -0,0 +1,173 @@
+from collections import OrderedDict
+
+from pebble.ast import *
+from pebble.builtins import Builtin
+from pebble.resolver import resolve
+
+# Memoization of pure functions (`pebble.py --memoize`). memoize() gives
+# each function whose result only depends on its arguments a Memo
+# (FunctionDecl.memo), and the engines look a call's arguments up in it
+# before running the body. A function is pure when:
+#
+# - it isn't main, and is declared once (before all declarations have run,
+#   a call may mean another function of the same name);
+# - its parameters are all scalars;
+# - it assigns no global, and only reads globals that are declared once as
+#   scalars and never assigned;
+# - it only indexes (or assigns elements of) arrays it declares itself,
+#   since an array another function can reach may change between calls;
+# - it only calls pure builtins (not print, read_int or read_line) and pure
+#   functions.
+#
+# Without the typechecker a scalar parameter may still be passed an array,
+# and a function may return one; such calls aren't cached. A call that fails
+# isn't either, so it fails again the next time.
+
+# How many results each function keeps
+DEFAULT_CACHE_SIZE = 10000
+
+MISSING = object()
+
+class Memo:
+    # The results of one function by argument values, keeping the `size`
+    # most recently used.
+    def __init__(self, name, size=DEFAULT_CACHE_SIZE):
+        self.name = name
+        self.size = size
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, args):
+        # None if the arguments can't be cached. The types are part of the
+        # key, as `true` and 1 (which are equal in Python) aren't the same
+        # argument.
+        types = tuple(arg.__class__ for arg in args)
+        if list in types:
+            return None
+        return (*args, *types)
+
+    def lookup(self, key):
+        # The cached result for `key`, or MISSING.
+        result = self.results.get(key, MISSING)
+        if result is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.results.move_to_end(key)
+        return result
+
+    def store(self, key, result):
+        if result.__class__ is list:
+            return # The caller may change its elements
+        self.results[key] = result
+        if len(self.results) > self.size:
+            self.results.popitem(last=False)
+
+    def call(self, function, args):
+        # function(args), or its cached result.
+        key = self.key(args)
+        if key is None:
+            return function(args)
+        result = self.lookup(key)
+        if result is MISSING:
+            result = function(args)
+            self.store(key, result)
+        return result
+
+def impurity(program):
+    # {FunctionDecl: why it isn't pure, or None if it is} for the functions
+    # of a resolved program.
+    functions = [decl for decl in program.declarations if isinstance(decl, FunctionDecl)]
+    counts = {}
+    for decl in program.declarations:
+        if isinstance(decl, (FunctionDecl, VarDecl, ArrayDecl)):
+            counts[decl.name] = counts.get(decl.name, 0) + 1
+    constants = {decl.name for decl in program.declarations
+                 if isinstance(decl, VarDecl) and counts[decl.name] == 1}
+    for decl in functions:
+        if decl.parse_block is not None:
+            constants = set() # Its body might assign any of them
+            break
+        for node in walk(decl.block):
+            if isinstance(node, Assign) and not is_local(node.slot):
+                constants.discard(node.name)
+
+    reasons = {}
+    calls = {} # FunctionDecl -> the FunctionDecls it calls
+    for decl in functions:
+        if decl.parse_block is not None:
+            reasons[decl] = "its body hasn't been parsed" # With --lazy
+        elif decl.name == 'main':
+            reasons[decl] = "it is main"
+        elif counts[decl.name] > 1:
+            reasons[decl] = "it is declared more than once"
+        elif any(param.is_array for param in decl.params):
+            reasons[decl] = "it has an array parameter"
+        else:
+            reasons[decl], calls[decl] = body_impurity(decl, constants)
+
+    # A function calling one that isn't pure isn't either.
+    changed = True
+    while changed:
+        changed = False
+        for decl, called in calls.items():
+            if reasons[decl] is None:
+                for target in called:
+                    if reasons[target] is not None:
+                        reasons[decl] = f"it calls {target.name}, which isn't pure"
+                        changed = True
+                        break
+    return reasons
+
+def is_local(slot):
+    return slot is not None and (type(slot) is int or slot[-1] is not None)
+
+def body_impurity(decl, constants):
+    # Why the body of `decl` isn't pure (None if it is), and the user
+    # functions it calls.
+    arrays = set() # The slots only array declarations assign
+    written = set()
+    for node in walk(decl.block):
+        if isinstance(node, ArrayDecl):
+            arrays.add(node.slot)
+        elif isinstance(node, VarDecl) or isinstance(node, Assign) and not node.index:
+            written.update(node.slot if type(node.slot) is tuple else (node.slot,))
+    arrays -= written
+
+    called = set()
+    for node in walk(decl.block):
+        if isinstance(node, Assign):
+            if not is_local(node.slot):
+                return f"it assigns the global {node.name}", called
+            if node.index and node.slot not in arrays:
+                return f"it assigns an element of {node.name}, which may be shared", called
+        elif isinstance(node, ArrayAccess):
+            if node.slot not in arrays:
+                return f"it indexes {node.name}, which may be shared", called
+        elif isinstance(node, Var):
+            if not is_local(node.slot) and node.value not in constants:
+                return f"it reads the global {node.value}, which may change", called
+        elif isinstance(node, Call):
+            if isinstance(node.target, Builtin):
+                if not node.target.pure:
+                    return f"it calls {node.name}", called
+            else:
+                called.add(node.target)
+    return None, called
+
+def memoize(program, names=None, size=DEFAULT_CACHE_SIZE):
+    # Give the pure functions of `program` (of those called `names`, if
+    # given) a Memo of `size` results. Returns {function name: why it isn't
+    # pure, or None} for those functions.
+    resolve(program)
+    report = {}
+    for decl, reason in impurity(program).items():
+        if names is not None and decl.name not in names:
+            continue
+        if reason is None and decl.type_node.value == 'void':
+            reason = "it returns nothing"
+        if reason is None:
+            decl.memo = Memo(decl.name, size)
+        report[decl.name] = reason
+    return report
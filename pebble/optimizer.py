@@ -0,0 +1,308 @@
+from pebble.lexer import TokenType
+from pebble.ast import *
+from pebble.builtins import Builtin
+from pebble.resolver import conditional_declarations, resolve
+from pebble.interpreter import Interpreter
+from pebble.hoister import Hoister
+from pebble.inliner import Inliner
+from pebble.bounds import BoundsChecks
+
+# An AST-to-AST pass run before execution (`pebble.py -O`). It rewrites the
+# tree in place:
+#
+# - BinOps and UnaryOps whose operands are literals become literals. The
+#   value is computed by Interpreter itself, so folding can't change what
+#   the program does; an operation that would fail (1 / 0, "a" - 1) is left
+#   to fail at run time. `false && x` and `true || x` fold whatever x is, as
+#   x is never evaluated, and `true && x`/`false || x` become x.
+# - Ifs, whiles and fors whose condition is a literal lose the branch or loop
+#   that can't run, and statements after a return in the same block go.
+# - Functions that can't be called, starting from main and the globals'
+#   initializers, are removed.
+# - Calls to small functions are inlined (see pebble.inliner), and the
+#   functions no longer called removed.
+# - Array accesses indexed by the counter of a loop that keeps it in range
+#   are marked as not needing a bounds check (see pebble.bounds).
+# - Loop-invariant expressions are evaluated once before their loop (see
+#   pebble.hoister). `typed`: the program has been typechecked, which lets
+#   more of them move.
+#
+# Branches and loops that are the whole body of another statement and
+# declare a variable (`if (false) int x = 1;`) are kept, because the
+# declaration changes how names resolve around it.
+#
+# The program is resolved first, so errors the resolver reports (undefined
+# names, wrong argument counts) are still reported for code that is removed.
+
+# Folded strings and ints are kept about as small as the source could have
+# written them.
+MAX_FOLDED_SIZE = 1000
+
+def is_literal(node):
+    return isinstance(node, Literal)
+
+def literal(value):
+    if type(value) is bool:
+        return Literal(value, 'bool')
+    if type(value) is int:
+        return Literal(value, 'int')
+    return Literal(value, 'string')
+
+class Optimizer:
+    def __init__(self, program, typed=False):
+        self.program = program
+        self.evaluator = Interpreter(None)
+        self.typed = typed
+        self.hoister = Hoister(typed)
+        self.bounds = BoundsChecks(typed)
+        self.inlined = 0
+        self.folded = 0
+        self.branches = 0 # Branches of ifs removed
+        self.loops = 0
+        self.statements = 0 # Unreachable statements removed
+        self.functions = [] # Names of the functions removed as never called
+        self.inlined_functions = [] # And as inlined wherever they were
+
+    def optimize(self):
+        resolve(self.program)
+        for decl in self.program.declarations:
+            if isinstance(decl, FunctionDecl):
+                decl.block = self.statement(decl.block)
+            else:
+                self.visit(decl)
+        self.functions = self.remove_unused_functions()
+        # Only the functions the globals' initializers call may run before
+        # every global is defined.
+        early = self.called([decl for decl in self.program.declarations
+                             if not isinstance(decl, FunctionDecl)])
+        inliner = Inliner(self.program, self.typed, early)
+        inliner.inline()
+        self.inlined = inliner.inlined
+        self.inlined_functions = self.remove_unused_functions()
+        if self.inlined:
+            # Arguments put in place of parameters may fold in turn.
+            for decl in self.program.declarations:
+                if isinstance(decl, FunctionDecl):
+                    decl.block = self.statement(decl.block)
+            resolve(self.program)
+        for decl in self.program.declarations:
+            if isinstance(decl, FunctionDecl):
+                self.bounds.function(decl)
+                self.hoister.function(decl, decl.name not in early)
+        # Annotate what was added or moved.
+        return resolve(self.program)
+
+    def report(self):
+        # What optimize() changed, one line per kind of change.
+        lines = []
+        if self.folded:
+            lines.append(f"folded {self.folded} constant expression(s)")
+        if self.branches:
+            lines.append(f"removed {self.branches} dead branch(es)")
+        if self.loops:
+            lines.append(f"removed {self.loops} loop(s) that never run")
+        if self.statements:
+            lines.append(f"removed {self.statements} unreachable statement(s)")
+        if self.inlined:
+            lines.append(f"inlined {self.inlined} call(s)")
+        if self.hoister.hoisted:
+            lines.append(f"hoisted {self.hoister.hoisted} loop-invariant expression(s)")
+        if self.bounds.removed:
+            lines.append(f"removed {self.bounds.removed} array bounds check(s)")
+        for name in self.functions:
+            lines.append(f"removed function {name}, which is never called")
+        for name in self.inlined_functions:
+            lines.append(f"removed function {name}, which is inlined wherever it was called")
+        return lines
+
+    def called(self, nodes):
+        # The names of the functions that running `nodes` may call. They are
+        # followed by name: while the globals are being initialized, a name
+        # may still mean an earlier declaration.
+        functions = {}
+        for decl in self.program.declarations:
+            if isinstance(decl, FunctionDecl):
+                functions.setdefault(decl.name, []).append(decl)
+        names = set()
+        work = list(nodes)
+        while work:
+            for node in walk(work.pop()):
+                if isinstance(node, Call) and not isinstance(node.target, Builtin):
+                    if node.name not in names:
+                        names.add(node.name)
+                        work.extend(functions[node.name])
+        return names
+
+    def remove_unused_functions(self):
+        # Returns the names of the functions removed.
+        declarations = self.program.declarations
+        main = [decl for decl in declarations if isinstance(decl, FunctionDecl) and decl.name == 'main']
+        if not main:
+            return [] # Leave the program to fail as it would have
+
+        used = {'main'} | self.called(main + [decl for decl in declarations
+                                              if not isinstance(decl, FunctionDecl)])
+        kept, removed = [], []
+        for decl in declarations:
+            if isinstance(decl, FunctionDecl) and decl.name not in used:
+                if decl.name not in removed:
+                    removed.append(decl.name)
+            else:
+                kept.append(decl)
+        declarations[:] = kept
+        return removed
+
+    def visit(self, node):
+        return getattr(self, 'visit_' + type(node).__name__)(node)
+
+    # Statements. statement() returns what replaces a statement: itself,
+    # another statement or None.
+
+    def statement(self, node):
+        return getattr(self, 'statement_' + type(node).__name__, self.visit)(node)
+
+    def body(self, node):
+        # The body of an if, while or for: it can't be None.
+        node = self.statement(node)
+        if node is None:
+            return Block([])
+        return node
+
+    def statement_Block(self, node):
+        statements = []
+        for i, stmt in enumerate(node.statements):
+            stmt = self.statement(stmt)
+            if stmt is not None:
+                statements.append(stmt)
+            if isinstance(stmt, Return):
+                self.statements += len(node.statements) - i - 1
+                break
+        node.statements = statements
+        return node
+
+    def statement_If(self, node):
+        node.condition = self.expr(node.condition)
+        node.then_stmt = self.body(node.then_stmt)
+        if node.else_stmt is not None:
+            node.else_stmt = self.body(node.else_stmt)
+            if isinstance(node.else_stmt, Block) and not node.else_stmt.statements:
+                node.else_stmt = None
+        if not is_literal(node.condition) or any(conditional_declarations(node)):
+            return node
+        if node.condition.value:
+            if node.else_stmt is not None:
+                self.branches += 1
+            return node.then_stmt
+        self.branches += 1
+        return node.else_stmt
+
+    def statement_While(self, node):
+        node.condition = self.expr(node.condition)
+        node.body = self.body(node.body)
+        if is_literal(node.condition) and not node.condition.value and not any(conditional_declarations(node)):
+            self.loops += 1
+            return None
+        return node
+
+    def statement_For(self, node):
+        if node.init:
+            node.init = self.statement(node.init)
+        if node.condition:
+            node.condition = self.expr(node.condition)
+        if node.update:
+            node.update = self.statement(node.update)
+        node.body = self.body(node.body)
+        if node.condition is not None and is_literal(node.condition) and not node.condition.value:
+            self.loops += 1
+            # The init still runs, in a scope of its own.
+            return Block([node.init]) if node.init else None
+        return node
+
+    def statement_ExprStmt(self, node):
+        node.expr = self.expr(node.expr)
+        if is_literal(node.expr):
+            self.statements += 1
+            return None
+        return node
+
+    def visit_VarDecl(self, node):
+        if node.value:
+            node.value = self.expr(node.value)
+        return node
+
+    def visit_ArrayDecl(self, node):
+        if node.values:
+            node.values = [self.expr(value) for value in node.values]
+        return node
+
+    def visit_Assign(self, node):
+        node.value = self.expr(node.value)
+        if node.index:
+            node.index = self.expr(node.index)
+        return node
+
+    def visit_Return(self, node):
+        if node.value:
+            node.value = self.expr(node.value)
+        return node
+
+    # Expressions. expr() returns what replaces an expression.
+
+    def expr(self, node):
+        return getattr(self, 'expr_' + type(node).__name__, self.visit)(node)
+
+    def fold(self, node):
+        # A literal of the value of `node`, whose operands are literals, or
+        # `node` itself if evaluating it fails.
+        try:
+            value = self.evaluator.visit(node)
+        except Exception:
+            return node
+        if type(value) not in (bool, int, str):
+            return node
+        if type(value) is str and len(value) > MAX_FOLDED_SIZE:
+            return node
+        if type(value) is int and value.bit_length() > MAX_FOLDED_SIZE:
+            return node
+        self.folded += 1
+        return literal(value)
+
+    def expr_BinOp(self, node):
+        node.left = self.expr(node.left)
+        node.right = self.expr(node.right)
+        op = node.op.type
+        if (op == TokenType.AND or op == TokenType.OR) and is_literal(node.left):
+            if bool(node.left.value) == (op == TokenType.OR):
+                # false && x, true || x: x is never evaluated
+                self.folded += 1
+                return literal(op == TokenType.OR)
+            if not is_literal(node.right):
+                # true && x, false || x: the value of x
+                self.folded += 1
+                return node.right
+        if is_literal(node.left) and is_literal(node.right):
+            return self.fold(node)
+        return node
+
+    def expr_UnaryOp(self, node):
+        node.expr = self.expr(node.expr)
+        if is_literal(node.expr):
+            return self.fold(node)
+        return node
+
+    def expr_Literal(self, node):
+        return node
+
+    def expr_Var(self, node):
+        return node
+
+    def expr_ArrayAccess(self, node):
+        node.index = self.expr(node.index)
+        return node
+
+    def expr_Call(self, node):
+        node.args = [self.expr(arg) for arg in node.args]
+        return node
+
+def optimize(program, typed=False):
+    return Optimizer(program, typed).optimize()
@@ -0,0 +1,73 @@
+import gc
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+from pebble.lexer import RegexLexer, LineIndex
+from pebble.parser import Parser, declaration_spans, parse_span
+from pebble.ast import Program
+
+# Sources smaller than this are not worth starting a pool for.
+MIN_PARALLEL_SIZE = 256 * 1024
+# Each worker gets this many batches, so an uneven split still balances out.
+BATCHES_PER_WORKER = 4
+
+# Set in each worker process by init_worker().
+worker_text = None
+worker_line_index = None
+
+def init_worker(text):
+    global worker_text, worker_line_index
+    worker_text = text
+    worker_line_index = LineIndex(text)
+
+def parse_range(start, end):
+    # Lex and parse worker_text[start:end] as a list of declarations. Returns
+    # the pickled list, or None if the range does not parse on its own.
+    try:
+        declarations = parse_span(worker_text, start, end, worker_line_index)
+    except Exception:
+        return None
+    return pickle.dumps(declarations, pickle.HIGHEST_PROTOCOL)
+
+def batches(spans, count):
+    # Merge consecutive spans into about `count` ranges of similar size.
+    total = spans[-1][1]
+    ranges = []
+    start = 0
+    for _, end in spans:
+        if end - start >= total / count or end == total:
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def parse_parallel(text, workers=None, min_size=MIN_PARALLEL_SIZE):
+    # Parse `text` into a Program by lexing and parsing its top-level
+    # declarations in a process pool. The result is the same as
+    # Parser(RegexLexer(text)).program(); if any range fails, the whole text
+    # is parsed serially so errors are reported exactly as usual.
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if len(text) < min_size:
+        return Parser(RegexLexer(text)).program()
+
+    ranges = batches(declaration_spans(text), workers * BATCHES_PER_WORKER)
+    declarations = []
+    # Results are unpickled as they arrive, while later ranges are still
+    # being parsed. As in cache.load(), collections during the burst of
+    # allocations would only rescan the growing tree.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(text,)) as pool:
+            for data in pool.map(parse_range, *zip(*ranges)):
+                if data is None:
+                    pool.shutdown(cancel_futures=True)
+                    break
+                declarations.extend(pickle.loads(data))
+            else:
+                return Program(declarations)
+    finally:
+        if enabled:
+            gc.enable()
+    return Parser(RegexLexer(text)).program()
@@ -1,36 +1,170 @@
-from pebble.lexer import TokenType
+import re
+from functools import partial
+from hashlib import blake2b
+
+from pebble.lexer import RegexLexer, LineIndex, TokenKind, KIND_TYPES, TYPE_KINDS, OPERATORS
 from pebble.ast import (
     Program, VarDecl, ArrayDecl, FunctionDecl, Param, Block, Assign, If, While, For, Return,
-    ExprStmt, BinOp, UnaryOp, Literal, Var, ArrayAccess, Call, Type
+    ExprStmt, BinOp, UnaryOp, Literal, Var, ArrayAccess, Call, Type, get_operator
 )
 
+# Binary operators from loosest to tightest binding. Unary operators bind
+# tighter than all of them and are handled in factor().
+BINARY_PRECEDENCE = {
+    TokenKind.OR: 1,
+    TokenKind.AND: 2,
+    TokenKind.EQ: 3, TokenKind.NEQ: 3,
+    TokenKind.LT: 4, TokenKind.LTE: 4, TokenKind.GT: 4, TokenKind.GTE: 4,
+    TokenKind.PLUS: 5, TokenKind.MINUS: 5,
+    TokenKind.MUL: 6, TokenKind.DIV: 6, TokenKind.MOD: 6,
+}
+
+# What declaration_spans() looks at. Strings and comments can hold braces
+# and semicolons, so they are matched whole and skipped.
+SPAN_PATTERN = re.compile(r'"[^"]*"|//[^\n]*|[{};]')
+
+def declaration_spans(text):
+    # Split `text` into (start, end) offset ranges that each hold whole
+    # top-level declarations, without lexing it: a declaration ends after a
+    # `;` at brace depth 0, or after a `}` that closes depth 0 and is not
+    # followed by `;` (a function body, not an array initializer). The spans
+    # cover the whole text. This is only exact for valid programs; callers
+    # must fall back to parsing the whole text if a span fails to parse.
+    spans = []
+    start = 0
+    depth = 0
+    closed = None # End of a `}` back at depth 0, if not yet known to be a boundary
+    for match in SPAN_PATTERN.finditer(text):
+        char = match.group()
+        if closed is not None:
+            if char != ';':
+                spans.append((start, closed))
+                start = closed
+            closed = None
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                closed = match.end()
+        elif char == ';' and depth == 0:
+            spans.append((start, match.end()))
+            start = match.end()
+    if closed is not None:
+        spans.append((start, closed))
+        start = closed
+    if start < len(text) or not spans:
+        spans.append((start, len(text)))
+    return spans
+
+def span_digest(text):
+    return blake2b(text.encode(), digest_size=16).digest()
+
+def parse_span(text, start, end, line_index):
+    # Parse the declarations in text[start:end], with token offsets into the
+    # whole text.
+    lexer = RegexLexer(text[start:end])
+    lexer.base = start
+    lexer.line_index = line_index
+    return Parser(lexer).program().declarations
+
+def reparse(program, text):
+    # Parse the new source `text` of `program`, reusing (by identity) the
+    # nodes of every top-level declaration whose text is unchanged; only
+    # declaration spans whose hash changed are parsed again. `program` may
+    # be None, or a Program that did not come from reparse(); then everything
+    # is parsed. Errors are the same as from Parser(RegexLexer(text)).program().
+    old_spans = {}
+    if program is not None and program.spans is not None:
+        for digest, start, declarations in program.spans:
+            old_spans.setdefault(digest, []).append(declarations)
+
+    line_index = LineIndex(text)
+    spans = []
+    declarations = []
+    try:
+        for start, end in declaration_spans(text):
+            digest = span_digest(text[start:end])
+            reused = old_spans.get(digest)
+            if reused:
+                nodes = reused.pop(0)
+            else:
+                nodes = tuple(parse_span(text, start, end, line_index))
+            spans.append((digest, start, nodes))
+            declarations.extend(nodes)
+    except Exception:
+        # A span that doesn't parse on its own: let the whole text report
+        # the error.
+        Parser(RegexLexer(text)).program()
+        raise
+    program = Program(declarations)
+    program.spans = spans
+    return program
+
+# Type keywords by kind.
+TYPE_NAMES = {
+    TokenKind.INT: 'int', TokenKind.STRING: 'string', TokenKind.BOOL: 'bool', TokenKind.VOID: 'void',
+}
+
+# Finds the next LBRACE or RBRACE in the token kinds (as bytes).
+BRACES = re.compile(b'[' + re.escape(bytes([TokenKind.LBRACE, TokenKind.RBRACE])) + b']')
+
+# The shared Operator node for each binary and unary operator kind.
+OPERATOR_NODES = {
+    TYPE_KINDS[type]: get_operator(type, lexeme) for lexeme, type in OPERATORS.items()
+    if TYPE_KINDS[type] in BINARY_PRECEDENCE or TYPE_KINDS[type] == TokenKind.NOT
+}
+
 class Parser:
-    def __init__(self, lexer):
+    def __init__(self, lexer, lazy=False):
         self.lexer = lexer
-        self.current_token = self.lexer.get_next_token()
+        # Cursor over the whole token stream: `kind` is the current TokenKind.
+        self.tokens = self.lexer.tokenize()
+        self.kinds = self.tokens.kinds
+        self.values = self.tokens.values
+        self.pos = 0
+        self.kind = self.kinds[0]
+        # In lazy mode function bodies are only brace-matched, and parsed the
+        # first time FunctionDecl.block is used (see skip_block()).
+        self.lazy = lazy
+        if lazy:
+            self.kind_bytes = self.kinds.tobytes()
+
+    @property
+    def current_token(self):
+        return self.tokens.token(self.pos)
 
     def error(self, msg=None):
         if msg is None:
             msg = f"Invalid syntax at {self.current_token}"
         raise Exception(msg)
 
-    def eat(self, token_type):
-        if self.current_token.type == token_type:
-            self.current_token = self.lexer.get_next_token()
+    def eat(self, kind):
+        if self.kind == kind:
+            self.pos += 1
+            self.kind = self.kinds[self.pos]
         else:
-            self.error(f"Expected {token_type}, got {self.current_token}")
+            self.error(f"Expected {KIND_TYPES[kind]}, got {self.current_token}")
 
     def program(self):
         declarations = []
-        while self.current_token.type != TokenType.EOF:
+        while self.kind != TokenKind.EOF:
             declarations.append(self.declaration())
         return Program(declarations)
 
+    def parse_bodies(self, program):
+        # Validation pass for lazy mode: parse every function body that has not
+        # been parsed yet, raising the first syntax error in source order.
+        for decl in program.declarations:
+            if isinstance(decl, FunctionDecl):
+                decl.block
+        return program
+
     def type_spec(self):
-        token = self.current_token
-        if token.type in (TokenType.INT, TokenType.STRING, TokenType.BOOL, TokenType.VOID):
-            self.eat(token.type)
-            return Type(token)
+        if self.kind in (TokenKind.INT, TokenKind.STRING, TokenKind.BOOL, TokenKind.VOID):
+            value = TYPE_NAMES[self.kind]
+            self.eat(self.kind)
+            return Type(value)
         else:
             self.error("Expected type")
 
@@ -38,392 +172,295 @@ class Parser:
         # Peek ahead logic is simulated by parsing step by step
         type_node = self.type_spec()
 
-        if self.current_token.type == TokenType.LBRACKET:
+        if self.kind == TokenKind.LBRACKET:
             return self.array_decl(type_node)
         else:
-            name = self.current_token.value
-            self.eat(TokenType.IDENTIFIER)
+            name = self.values[self.pos]
+            self.eat(TokenKind.IDENTIFIER)
 
-            if self.current_token.type == TokenType.LPAREN:
+            if self.kind == TokenKind.LPAREN:
                 return self.function_decl(type_node, name)
             else:
                 return self.variable_decl(type_node, name)
 
     def array_decl(self, type_node):
-        self.eat(TokenType.LBRACKET)
-        if self.current_token.type == TokenType.RBRACKET:
+        self.eat(TokenKind.LBRACKET)
+        if self.kind == TokenKind.RBRACKET:
             # type [] name = { ... }
-            self.eat(TokenType.RBRACKET)
-            name = self.current_token.value
-            self.eat(TokenType.IDENTIFIER)
-            self.eat(TokenType.ASSIGN)
-            self.eat(TokenType.LBRACE)
+            self.eat(TokenKind.RBRACKET)
+            name = self.values[self.pos]
+            self.eat(TokenKind.IDENTIFIER)
+            self.eat(TokenKind.ASSIGN)
+            self.eat(TokenKind.LBRACE)
             values = []
-            if self.current_token.type != TokenType.RBRACE:
+            if self.kind != TokenKind.RBRACE:
                 values.append(self.expr())
-                while self.current_token.type == TokenType.COMMA:
-                    self.eat(TokenType.COMMA)
+                while self.kind == TokenKind.COMMA:
+                    self.eat(TokenKind.COMMA)
                     values.append(self.expr())
-            self.eat(TokenType.RBRACE)
-            self.eat(TokenType.SEMI)
+            self.eat(TokenKind.RBRACE)
+            self.eat(TokenKind.SEMI)
             return ArrayDecl(type_node, name, None, values)
         else:
             # type [size] name;
-            size = self.current_token.value
-            self.eat(TokenType.INTEGER_LIT)
-            self.eat(TokenType.RBRACKET)
-            name = self.current_token.value
-            self.eat(TokenType.IDENTIFIER)
-            self.eat(TokenType.SEMI)
+            size = self.values[self.pos]
+            self.eat(TokenKind.INTEGER_LIT)
+            self.eat(TokenKind.RBRACKET)
+            name = self.values[self.pos]
+            self.eat(TokenKind.IDENTIFIER)
+            self.eat(TokenKind.SEMI)
             return ArrayDecl(type_node, name, size, None)
 
     def function_decl(self, type_node, name):
-        self.eat(TokenType.LPAREN)
+        self.eat(TokenKind.LPAREN)
         params = []
-        if self.current_token.type != TokenType.RPAREN:
+        if self.kind != TokenKind.RPAREN:
             params.append(self.param())
-            while self.current_token.type == TokenType.COMMA:
-                self.eat(TokenType.COMMA)
+            while self.kind == TokenKind.COMMA:
+                self.eat(TokenKind.COMMA)
                 params.append(self.param())
-        self.eat(TokenType.RPAREN)
+        self.eat(TokenKind.RPAREN)
+        if self.lazy and self.kind == TokenKind.LBRACE:
+            start = self.skip_block()
+            if start is not None:
+                return FunctionDecl(type_node, name, params, None, partial(self.block_at, start))
         block = self.block()
         return FunctionDecl(type_node, name, params, block)
 
+    def skip_block(self):
+        # Move past the block starting at the current LBRACE by matching braces
+        # and return its first token. If the braces never balance, return
+        # None without moving, so the block is parsed now and reports the
+        # same error as it would without lazy parsing.
+        start = self.pos
+        depth = 0
+        for match in BRACES.finditer(self.kind_bytes, start):
+            if match.group()[0] == TokenKind.LBRACE:
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    self.pos = match.end()
+                    self.kind = self.kinds[self.pos]
+                    return start
+        return None
+
+    def block_at(self, pos):
+        # Parse the block starting at token `pos` without losing our place.
+        saved = self.pos
+        self.pos = pos
+        self.kind = self.kinds[pos]
+        try:
+            return self.block()
+        finally:
+            self.pos = saved
+            self.kind = self.kinds[saved]
+
     def param(self):
         type_node = self.type_spec()
-        name = self.current_token.value
-        self.eat(TokenType.IDENTIFIER)
+        name = self.values[self.pos]
+        self.eat(TokenKind.IDENTIFIER)
         is_array = False
-        if self.current_token.type == TokenType.LBRACKET:
-            self.eat(TokenType.LBRACKET)
-            self.eat(TokenType.RBRACKET)
+        if self.kind == TokenKind.LBRACKET:
+            self.eat(TokenKind.LBRACKET)
+            self.eat(TokenKind.RBRACKET)
             is_array = True
         return Param(type_node, name, is_array)
 
     def variable_decl(self, type_node, name):
         value = None
-        if self.current_token.type == TokenType.ASSIGN:
-            self.eat(TokenType.ASSIGN)
+        if self.kind == TokenKind.ASSIGN:
+            self.eat(TokenKind.ASSIGN)
             value = self.expr()
-        self.eat(TokenType.SEMI)
+        self.eat(TokenKind.SEMI)
         return VarDecl(type_node, name, value)
 
     def block(self):
-        self.eat(TokenType.LBRACE)
+        self.eat(TokenKind.LBRACE)
         statements = []
-        while self.current_token.type != TokenType.RBRACE and self.current_token.type != TokenType.EOF:
+        while self.kind != TokenKind.RBRACE and self.kind != TokenKind.EOF:
             statements.append(self.statement())
-        self.eat(TokenType.RBRACE)
+        self.eat(TokenKind.RBRACE)
         return Block(statements)
 
     def statement(self):
-        if self.current_token.type in (TokenType.INT, TokenType.STRING, TokenType.BOOL, TokenType.VOID):
+        if self.kind in (TokenKind.INT, TokenKind.STRING, TokenKind.BOOL, TokenKind.VOID):
             # Variable declaration inside block
             type_node = self.type_spec()
-            if self.current_token.type == TokenType.LBRACKET:
+            if self.kind == TokenKind.LBRACKET:
                 return self.array_decl(type_node)
             else:
-                name = self.current_token.value
-                self.eat(TokenType.IDENTIFIER)
+                name = self.values[self.pos]
+                self.eat(TokenKind.IDENTIFIER)
                 return self.variable_decl(type_node, name)
-        elif self.current_token.type == TokenType.LBRACE:
+        elif self.kind == TokenKind.LBRACE:
             return self.block()
-        elif self.current_token.type == TokenType.IF:
+        elif self.kind == TokenKind.IF:
             return self.if_stmt()
-        elif self.current_token.type == TokenType.WHILE:
+        elif self.kind == TokenKind.WHILE:
             return self.while_stmt()
-        elif self.current_token.type == TokenType.FOR:
+        elif self.kind == TokenKind.FOR:
             return self.for_stmt()
-        elif self.current_token.type == TokenType.RETURN:
+        elif self.kind == TokenKind.RETURN:
             return self.return_stmt()
-        elif self.current_token.type == TokenType.IDENTIFIER:
+        elif self.kind == TokenKind.IDENTIFIER:
             # Assignment or Call
-            # We need to peek. But Identifier is start of expression too.
-            # Assign: id = ...
-            # Assign Array: id[expr] = ...
-            # Call: id(...)
-
-            # Since my lexer doesn't support peeking multiple tokens easily without saving state,
-            # I can parse the 'id' part, check next token.
-            # But `expr` also starts with `IDENTIFIER`.
-
-            # If I treat `assignment` as separate from `expr_stmt`, I need to distinguish.
-
-            # Assignment grammar: IDENTIFIER [ "[" expression "]" ] "=" expression ";"
-            # Expression statement: expression ";"
-
-            # Let's try to parse as assignment if it looks like one.
-            # Note: `call` is an expression.
-
-            # Implementing a simple lookahead here would be useful.
-            # Or I can just start parsing an expression. If it's just an identifier (Var node) or ArrayAccess node, check if next is `=`.
-
-            # However, `expr` parsing is complex.
-
-            # Simpler approach:
-            # Save current token state? No, Lexer is stateful.
-
-            # Let's peek the next token using a temporary lookahead if possible.
-            # My lexer has `peek()`, but that only returns one char.
-
-            # Let's rely on the fact that `assignment` must start with ID.
-
-            # I'll implement a `peek_token` in Lexer or Parser?
-            # Lexer's `peek` is for characters.
-
-            # I will modify Lexer or add a buffer to Parser.
-            # But let's try to do it without modifying Lexer if possible.
-
-            # Actually, `assignment` is NOT an expression in my grammar (it's a statement).
-            # But `call` IS an expression.
-
-            # If I see IDENTIFIER:
-            # It could be `x = 5;`
-            # It could be `x[0] = 5;`
-            # It could be `func();`
-
-            # If next is `=`, it is assignment.
-            # If next is `[`, it COULD be assignment (`x[0]=1`) or expression `x[0]`.
-            # If next is `(`, it is call (expression).
-
-            # So:
-            # Parse ID.
-            # If next `(`, it's a call. -> parse rest of call. Then expect `;`.
-            # If next `=`, it's assignment.
-            # If next `[`, parse index. Then check if next is `=`.
-
-            # BUT `x + 1;` is also a valid statement (expr stmt).
-            # `x;` is valid.
-
-            # So, really, I should parse an expression.
-            # If the resulting expression is a `Var` or `ArrayAccess`, AND the next token is `=`, then it's an assignment.
-            # Otherwise it's an expression statement.
-
-            expr_node = self.expr()
-            if self.current_token.type == TokenType.ASSIGN:
-                self.eat(TokenType.ASSIGN)
-                value = self.expr()
-                self.eat(TokenType.SEMI)
-
-                if isinstance(expr_node, Var):
-                    return Assign(expr_node.token.value, value)
-                elif isinstance(expr_node, ArrayAccess):
-                    return Assign(expr_node.name, value, expr_node.index)
-                else:
-                    self.error("Invalid assignment target")
-            else:
-                self.eat(TokenType.SEMI)
-                return ExprStmt(expr_node)
-
+            return self.assignment(TokenKind.SEMI, "Invalid assignment target")
         else:
             return self.expr_stmt()
 
     def if_stmt(self):
-        self.eat(TokenType.IF)
-        self.eat(TokenType.LPAREN)
+        self.eat(TokenKind.IF)
+        self.eat(TokenKind.LPAREN)
         condition = self.expr()
-        self.eat(TokenType.RPAREN)
+        self.eat(TokenKind.RPAREN)
         then_stmt = self.statement()
         else_stmt = None
-        if self.current_token.type == TokenType.ELSE:
-            self.eat(TokenType.ELSE)
+        if self.kind == TokenKind.ELSE:
+            self.eat(TokenKind.ELSE)
             else_stmt = self.statement()
         return If(condition, then_stmt, else_stmt)
 
     def while_stmt(self):
-        self.eat(TokenType.WHILE)
-        self.eat(TokenType.LPAREN)
+        self.eat(TokenKind.WHILE)
+        self.eat(TokenKind.LPAREN)
         condition = self.expr()
-        self.eat(TokenType.RPAREN)
+        self.eat(TokenKind.RPAREN)
         body = self.statement()
         return While(condition, body)
 
     def for_stmt(self):
-        self.eat(TokenType.FOR)
-        self.eat(TokenType.LPAREN)
+        self.eat(TokenKind.FOR)
+        self.eat(TokenKind.LPAREN)
 
         # Init: variable_decl | assignment | ;
         init = None
-        if self.current_token.type == TokenType.SEMI:
-            self.eat(TokenType.SEMI)
-        elif self.current_token.type in (TokenType.INT, TokenType.STRING, TokenType.BOOL):
+        if self.kind == TokenKind.SEMI:
+            self.eat(TokenKind.SEMI)
+        elif self.kind in (TokenKind.INT, TokenKind.STRING, TokenKind.BOOL):
              # variable decl
              type_node = self.type_spec()
-             name = self.current_token.value
-             self.eat(TokenType.IDENTIFIER)
+             name = self.values[self.pos]
+             self.eat(TokenKind.IDENTIFIER)
              init = self.variable_decl(type_node, name) # consumes semi
         else:
-             # assignment or expr?
-             # My grammar said: variable_decl | assignment | ";"
-             # Let's reuse the logic from `statement` but restrict it?
-             # Or just parse an expression/assignment.
-
-             # Re-using statement logic is hard because statement eats semicolon.
-             # Variable decl eats semicolon.
-             # Assignment logic I wrote above eats semicolon.
-
-             # So I can reuse `statement` logic if I'm careful.
-             # But `statement` parses `if`, `while`... we don't want those.
-
-             # Let's implement specific logic.
-
-             # Parse expr. Check for `=`.
-             expr_node = self.expr()
-             if self.current_token.type == TokenType.ASSIGN:
-                 self.eat(TokenType.ASSIGN)
-                 value = self.expr()
-                 self.eat(TokenType.SEMI)
-                 if isinstance(expr_node, Var):
-                     init = Assign(expr_node.token.value, value)
-                 elif isinstance(expr_node, ArrayAccess):
-                     init = Assign(expr_node.name, value, expr_node.index)
-                 else:
-                     self.error("Invalid assignment in for loop init")
-             else:
-                 # It's just an expression statement
-                 self.eat(TokenType.SEMI)
-                 init = ExprStmt(expr_node)
+            init = self.assignment(TokenKind.SEMI, "Invalid assignment in for loop init")
 
         # Condition
         condition = None
-        if self.current_token.type != TokenType.SEMI:
+        if self.kind != TokenKind.SEMI:
             condition = self.expr()
-        self.eat(TokenType.SEMI)
+        self.eat(TokenKind.SEMI)
 
         # Update
         update = None
-        if self.current_token.type != TokenType.RPAREN:
-             expr_node = self.expr()
-             if self.current_token.type == TokenType.ASSIGN:
-                 self.eat(TokenType.ASSIGN)
-                 value = self.expr()
-                 if isinstance(expr_node, Var):
-                     update = Assign(expr_node.token.value, value)
-                 elif isinstance(expr_node, ArrayAccess):
-                     update = Assign(expr_node.name, value, expr_node.index)
-                 else:
-                     self.error("Invalid assignment in for loop update")
-             else:
-                 update = ExprStmt(expr_node)
-
-        self.eat(TokenType.RPAREN)
+        if self.kind != TokenKind.RPAREN:
+            update = self.assignment(None, "Invalid assignment in for loop update")
+
+        self.eat(TokenKind.RPAREN)
         body = self.statement()
         return For(init, condition, update, body)
 
+    def assignment(self, terminator, error_msg):
+        # Assignment is a statement, not an expression, but both start with an
+        # identifier. So parse an expression: if the result is a `Var` or
+        # `ArrayAccess` and the next token is `=`, it's an assignment.
+        # Otherwise it's an expression statement. `terminator` (if any) is
+        # eaten before the target is checked.
+        expr_node = self.expr()
+        if self.kind == TokenKind.ASSIGN:
+            self.eat(TokenKind.ASSIGN)
+            value = self.expr()
+            if terminator is not None:
+                self.eat(terminator)
+            if isinstance(expr_node, Var):
+                return Assign(expr_node.value, value)
+            elif isinstance(expr_node, ArrayAccess):
+                return Assign(expr_node.name, value, expr_node.index)
+            else:
+                self.error(error_msg)
+        if terminator is not None:
+            self.eat(terminator)
+        return ExprStmt(expr_node)
+
     def return_stmt(self):
-        self.eat(TokenType.RETURN)
+        self.eat(TokenKind.RETURN)
         value = None
-        if self.current_token.type != TokenType.SEMI:
+        if self.kind != TokenKind.SEMI:
             value = self.expr()
-        self.eat(TokenType.SEMI)
+        self.eat(TokenKind.SEMI)
         return Return(value)
 
     def expr_stmt(self):
         node = self.expr()
-        self.eat(TokenType.SEMI)
+        self.eat(TokenKind.SEMI)
         return ExprStmt(node)
 
-    def expr(self):
-        return self.logic_or()
-
-    def logic_or(self):
-        node = self.logic_and()
-        while self.current_token.type == TokenType.OR:
-            token = self.current_token
-            self.eat(TokenType.OR)
-            node = BinOp(left=node, op=token, right=self.logic_and())
-        return node
-
-    def logic_and(self):
-        node = self.equality()
-        while self.current_token.type == TokenType.AND:
-            token = self.current_token
-            self.eat(TokenType.AND)
-            node = BinOp(left=node, op=token, right=self.equality())
-        return node
-
-    def equality(self):
-        node = self.relational()
-        while self.current_token.type in (TokenType.EQ, TokenType.NEQ):
-            token = self.current_token
-            self.eat(token.type)
-            node = BinOp(left=node, op=token, right=self.relational())
-        return node
-
-    def relational(self):
-        node = self.additive()
-        while self.current_token.type in (TokenType.LT, TokenType.LTE, TokenType.GT, TokenType.GTE):
-            token = self.current_token
-            self.eat(token.type)
-            node = BinOp(left=node, op=token, right=self.additive())
-        return node
-
-    def additive(self):
-        node = self.term()
-        while self.current_token.type in (TokenType.PLUS, TokenType.MINUS):
-            token = self.current_token
-            self.eat(token.type)
-            node = BinOp(left=node, op=token, right=self.term())
-        return node
-
-    def term(self):
+    def expr(self, min_prec=1):
+        # Precedence climbing: parse operators binding at least as tightly as
+        # `min_prec`; the right operand only takes tighter ones, which makes
+        # every level left-associative.
         node = self.factor()
-        while self.current_token.type in (TokenType.MUL, TokenType.DIV, TokenType.MOD):
-            token = self.current_token
-            self.eat(token.type)
-            node = BinOp(left=node, op=token, right=self.factor())
+        prec = BINARY_PRECEDENCE.get(self.kind, 0)
+        while prec >= min_prec:
+            op = OPERATOR_NODES[self.kind]
+            self.eat(self.kind)
+            node = BinOp(left=node, op=op, right=self.expr(prec + 1))
+            prec = BINARY_PRECEDENCE.get(self.kind, 0)
         return node
 
     def factor(self):
-        token = self.current_token
-        if token.type == TokenType.PLUS:
-            self.eat(TokenType.PLUS)
-            return UnaryOp(token, self.factor())
-        elif token.type == TokenType.MINUS:
-            self.eat(TokenType.MINUS)
-            return UnaryOp(token, self.factor())
-        elif token.type == TokenType.NOT:
-            self.eat(TokenType.NOT)
-            return UnaryOp(token, self.factor())
-        elif token.type == TokenType.INTEGER_LIT:
-            self.eat(TokenType.INTEGER_LIT)
-            return Literal(token.value, 'int')
-        elif token.type == TokenType.STRING_LIT:
-            self.eat(TokenType.STRING_LIT)
-            return Literal(token.value, 'string')
-        elif token.type == TokenType.TRUE:
-            self.eat(TokenType.TRUE)
+        kind = self.kind
+        if kind == TokenKind.PLUS:
+            self.eat(TokenKind.PLUS)
+            return UnaryOp(OPERATOR_NODES[TokenKind.PLUS], self.factor())
+        elif kind == TokenKind.MINUS:
+            self.eat(TokenKind.MINUS)
+            return UnaryOp(OPERATOR_NODES[TokenKind.MINUS], self.factor())
+        elif kind == TokenKind.NOT:
+            self.eat(TokenKind.NOT)
+            return UnaryOp(OPERATOR_NODES[TokenKind.NOT], self.factor())
+        elif kind == TokenKind.INTEGER_LIT:
+            value = self.values[self.pos]
+            self.eat(TokenKind.INTEGER_LIT)
+            return Literal(value, 'int')
+        elif kind == TokenKind.STRING_LIT:
+            value = self.values[self.pos]
+            self.eat(TokenKind.STRING_LIT)
+            return Literal(value, 'string')
+        elif kind == TokenKind.TRUE:
+            self.eat(TokenKind.TRUE)
             return Literal(True, 'bool')
-        elif token.type == TokenType.FALSE:
-            self.eat(TokenType.FALSE)
+        elif kind == TokenKind.FALSE:
+            self.eat(TokenKind.FALSE)
             return Literal(False, 'bool')
-        elif token.type == TokenType.LPAREN:
-            self.eat(TokenType.LPAREN)
+        elif kind == TokenKind.LPAREN:
+            self.eat(TokenKind.LPAREN)
             node = self.expr()
-            self.eat(TokenType.RPAREN)
+            self.eat(TokenKind.RPAREN)
             return node
-        elif token.type == TokenType.IDENTIFIER:
+        elif kind == TokenKind.IDENTIFIER:
             return self.variable()
         else:
             self.error("Unexpected token in factor")
 
     def variable(self):
-        node = Var(self.current_token)
-        self.eat(TokenType.IDENTIFIER)
-        if self.current_token.type == TokenType.LBRACKET:
-            self.eat(TokenType.LBRACKET)
+        name = self.values[self.pos]
+        self.eat(TokenKind.IDENTIFIER)
+        if self.kind == TokenKind.LBRACKET:
+            self.eat(TokenKind.LBRACKET)
             index = self.expr()
-            self.eat(TokenType.RBRACKET)
-            return ArrayAccess(node.value, index)
-        elif self.current_token.type == TokenType.LPAREN:
-            self.eat(TokenType.LPAREN)
+            self.eat(TokenKind.RBRACKET)
+            return ArrayAccess(name, index)
+        elif self.kind == TokenKind.LPAREN:
+            self.eat(TokenKind.LPAREN)
             args = []
-            if self.current_token.type != TokenType.RPAREN:
+            if self.kind != TokenKind.RPAREN:
                 args.append(self.expr())
-                while self.current_token.type == TokenType.COMMA:
-                    self.eat(TokenType.COMMA)
+                while self.kind == TokenKind.COMMA:
+                    self.eat(TokenKind.COMMA)
                     args.append(self.expr())
-            self.eat(TokenType.RPAREN)
-            return Call(node.value, args)
+            self.eat(TokenKind.RPAREN)
+            return Call(name, args)
         else:
-            return node
+            return Var(name)
@@ -0,0 +1,269 @@
+from pebble.ast import *
+from pebble.builtins import BUILTINS
+
+# Resolves every variable to where it lives at run time, so that engines can
+# keep a call's locals in a list (its frame) instead of a chain of
+# Environments, and reports undefined variables and functions, and calls with
+# the wrong number of arguments, before the program runs.
+#
+# A name refers to the innermost block/for/parameter scope that declares it
+# before the point of use, or else to the global of that name. All the locals
+# of a function get distinct slots in one frame. A declaration that only runs
+# on some paths (the body of an if/while/for that is not a block, e.g.
+# `if (c) int x = 1;`) gets a slot that is UNSET each time its scope is
+# entered; a name it may shadow is looked up in each candidate slot in turn,
+# falling back like Environment.get does.
+#
+# The resolver sets these annotations:
+#
+#     Var.slot, Assign.slot, ArrayAccess.slot
+#         the slot of the variable, None for the global, or a tuple of
+#         candidate slots (innermost first) ending in None when the global is
+#         the last resort
+#     VarDecl.slot, ArrayDecl.slot
+#         the slot declared, None for a global declaration
+#     Block.unset, For.unset
+#         the slots to reset to UNSET on entry
+#     FunctionDecl.varnames
+#         the name of each slot of the frame; the parameters come first
+#     Call.target
+#         the Builtin (see pebble.builtins) or else the FunctionDecl called:
+#         the last one of that name, which is the one declared once all
+#         declarations have run
+
+class Unset:
+    # The value of a slot whose conditional declaration hasn't run.
+    def __repr__(self):
+        return 'UNSET'
+
+UNSET = Unset()
+
+class Scope:
+    def __init__(self, enclosing):
+        self.enclosing = enclosing
+        self.slots = {} # Name -> slot, for names declared so far or conditionally
+        self.declared = set() # Names certainly declared at this point
+
+class Scopes:
+    # The scopes of one function, as its body is walked in execution order.
+    def __init__(self, params):
+        self.scope = Scope(None)
+        self.varnames = [] # Slot -> variable name
+        # Parameters get the first slots, in their own scope around the body.
+        for name in params:
+            self.scope.slots[name] = self.new_slot(name)
+            self.scope.declared.add(name)
+
+    def new_slot(self, name):
+        self.varnames.append(name)
+        return len(self.varnames) - 1
+
+    def enter(self, conditional):
+        # Open the scope of a block or for loop, given the declarations in it
+        # that are conditional. Returns their slots, which must be reset to
+        # UNSET each time the scope is entered.
+        self.scope = Scope(self.scope)
+        unset = []
+        for decl in conditional:
+            if decl.name not in self.scope.slots:
+                slot = self.scope.slots[decl.name] = self.new_slot(decl.name)
+                unset.append(slot)
+        return unset
+
+    def exit(self):
+        self.scope = self.scope.enclosing
+
+    def resolve(self, name):
+        # The slots that may hold `name`, innermost first, and whether the
+        # last of them is certain to (otherwise the global is the fallback).
+        slots = []
+        scope = self.scope
+        while scope:
+            slot = scope.slots.get(name)
+            if slot is not None:
+                slots.append(slot)
+                if name in scope.declared:
+                    return slots, True
+            scope = scope.enclosing
+        return slots, False
+
+    def declare(self, name, conditional=False):
+        # The slot for a declaration of `name` in the current scope.
+        slot = self.scope.slots.get(name)
+        if slot is None:
+            slot = self.scope.slots[name] = self.new_slot(name)
+        if not conditional:
+            self.scope.declared.add(name)
+        return slot
+
+def conditional_declarations(stmt):
+    # Declarations in `stmt` that define a name in the scope `stmt` runs in,
+    # but only if (and once) they are reached: if/while bodies that are not
+    # blocks, and ifs and whiles nested that way.
+    if isinstance(stmt, (VarDecl, ArrayDecl)):
+        yield stmt
+    elif isinstance(stmt, If):
+        yield from conditional_declarations(stmt.then_stmt)
+        if stmt.else_stmt:
+            yield from conditional_declarations(stmt.else_stmt)
+    elif isinstance(stmt, While):
+        yield from conditional_declarations(stmt.body)
+
+class Resolver:
+    def __init__(self, program):
+        self.program = program
+        self.globals = {decl.name for decl in program.declarations
+                        if isinstance(decl, (VarDecl, ArrayDecl))}
+        self.functions = {decl.name: decl for decl in program.declarations
+                          if isinstance(decl, FunctionDecl)}
+        self.scopes = None # None at the top level
+
+    def resolve(self):
+        # Resolves the global declarations and the functions whose bodies are
+        # parsed. Lazily parsed ones are left for resolve_function(), so that
+        # they are parsed on first call as before.
+        for decl in self.program.declarations:
+            if isinstance(decl, FunctionDecl):
+                if decl.parse_block is None:
+                    self.resolve_function(decl)
+            else:
+                self.visit(decl)
+        return self.program
+
+    def resolve_function(self, node):
+        self.scopes = Scopes([param.name for param in node.params])
+        try:
+            self.visit(node.block)
+            node.varnames = self.scopes.varnames
+        finally:
+            self.scopes = None
+
+    def visit(self, node):
+        getattr(self, 'visit_' + type(node).__name__)(node)
+
+    def lookup(self, name):
+        if self.scopes is None:
+            slots, certain = [], False
+        else:
+            slots, certain = self.scopes.resolve(name)
+        if not slots:
+            if name not in self.globals:
+                raise Exception(f"Undefined variable '{name}'")
+            return None
+        if certain and len(slots) == 1:
+            return slots[0]
+        if not certain:
+            slots.append(None)
+        return tuple(slots)
+
+    # Statements
+
+    def statement(self, node):
+        # The body of an if, while or for: a declaration here is conditional.
+        if isinstance(node, VarDecl):
+            self.visit_VarDecl(node, conditional=True)
+        elif isinstance(node, ArrayDecl):
+            self.visit_ArrayDecl(node, conditional=True)
+        else:
+            self.visit(node)
+
+    def declare(self, node, conditional):
+        if self.scopes is None:
+            node.slot = None
+        else:
+            node.slot = self.scopes.declare(node.name, conditional)
+
+    def visit_VarDecl(self, node, conditional=False):
+        if node.value:
+            self.visit(node.value)
+        self.declare(node, conditional)
+
+    def visit_ArrayDecl(self, node, conditional=False):
+        for value in node.values or ():
+            self.visit(value)
+        self.declare(node, conditional)
+
+    def visit_Block(self, node):
+        node.unset = tuple(self.scopes.enter(
+            decl for stmt in node.statements if isinstance(stmt, (If, While))
+            for decl in conditional_declarations(stmt)))
+        for stmt in node.statements:
+            self.visit(stmt)
+        self.scopes.exit()
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        if node.index:
+            self.visit(node.index)
+        node.slot = self.lookup(node.name)
+
+    def visit_If(self, node):
+        self.visit(node.condition)
+        self.statement(node.then_stmt)
+        if node.else_stmt:
+            self.statement(node.else_stmt)
+
+    def visit_While(self, node):
+        self.visit(node.condition)
+        self.statement(node.body)
+
+    def visit_For(self, node):
+        node.unset = tuple(self.scopes.enter(conditional_declarations(node.body)))
+        if node.init:
+            self.visit(node.init)
+        if node.condition:
+            self.visit(node.condition)
+        self.statement(node.body)
+        if node.update:
+            self.visit(node.update)
+        self.scopes.exit()
+
+    def visit_Return(self, node):
+        if node.value:
+            self.visit(node.value)
+
+    def visit_ExprStmt(self, node):
+        self.visit(node.expr)
+
+    # Expressions
+
+    def visit_BinOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_UnaryOp(self, node):
+        self.visit(node.expr)
+
+    def visit_Literal(self, node):
+        pass
+
+    def visit_Var(self, node):
+        node.slot = self.lookup(node.value)
+
+    def visit_ArrayAccess(self, node):
+        self.visit(node.index)
+        node.slot = self.lookup(node.name)
+
+    def visit_Call(self, node):
+        target = BUILTINS.get(node.name)
+        if target is not None:
+            arity = target.arity
+        else:
+            target = self.functions.get(node.name)
+            if target is None:
+                raise Exception(f"Undefined function '{node.name}'")
+            arity = len(target.params)
+        if len(node.args) != arity:
+            raise Exception(f"Function {node.name} expects {arity} arguments, got {len(node.args)}")
+        node.target = target
+        for arg in node.args:
+            self.visit(arg)
+
+def resolve(program):
+    # Resolve all of `program`, including lazily parsed function bodies.
+    resolver = Resolver(program)
+    resolver.resolve()
+    for decl in program.declarations:
+        if isinstance(decl, FunctionDecl) and decl.varnames is None:
+            resolver.resolve_function(decl)
+    return program
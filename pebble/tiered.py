@@ -0,0 +1,103 @@
+from pebble.interpreter import Interpreter
+from pebble.closures import ClosureCompiler
+from pebble.resolver import UNSET
+
+# Tiered execution (`pebble.py --engine tiered`): functions start out run by
+# the tree-walking Interpreter, which costs nothing up front, and one that
+# turns out to be hot is compiled to closures by pebble.closures, which run
+# several times faster. Each FunctionDecl's calls and loop iterations (back
+# edges) are counted; at a call after either reaches its threshold, the
+# function is compiled, and it and every later call runs the compiled form.
+# The functions compiled code calls are compiled in turn, when it first
+# calls them. A call in progress (say, main's loop) keeps running in the
+# tree walker.
+
+# Defaults for the thresholds
+CALL_THRESHOLD = 100
+LOOP_THRESHOLD = 1000
+
+class TierCompiler(ClosureCompiler):
+    # Records why each function was compiled in the interpreter's events.
+    def __init__(self, interpreter):
+        super().__init__(interpreter.functions, interpreter.globals)
+        self.interpreter = interpreter
+        self.reason = None # Why the next function is compiled, if promoted
+
+    def compile_function(self, func_decl):
+        reason = self.reason or "called from compiled code"
+        self.reason = None
+        function = super().compile_function(func_decl)
+        self.interpreter.tier_up(func_decl, reason)
+        return function
+
+class TieredInterpreter(Interpreter):
+    def __init__(self, parser, call_threshold=CALL_THRESHOLD, loop_threshold=LOOP_THRESHOLD, log=None):
+        super().__init__(parser)
+        self.call_threshold = call_threshold
+        self.loop_threshold = loop_threshold
+        self.log = log # Called with a message for each function compiled
+        self.events = [] # (function name, why it was compiled), in order
+        self.compiler = TierCompiler(self)
+        self.function = None # The FunctionDecl running in the tree walker
+        self.calls = {} # FunctionDecl -> calls so far
+        self.back_edges = {} # FunctionDecl -> loop iterations so far
+
+    def tier_up(self, func_decl, reason):
+        self.events.append((func_decl.name, reason))
+        if self.log:
+            self.log(f"compiled {func_decl.name} to closures: {reason}")
+
+    def invoke(self, func_decl, args):
+        function = self.compiler.compiled.get(func_decl)
+        if function is not None:
+            return function(args)
+
+        calls = self.calls[func_decl] = self.calls.get(func_decl, 0) + 1
+        back_edges = self.back_edges.get(func_decl, 0)
+        if calls >= self.call_threshold or back_edges >= self.loop_threshold:
+            if back_edges >= self.loop_threshold:
+                self.compiler.reason = f"{back_edges} loop iteration(s)"
+            else:
+                self.compiler.reason = f"{calls} call(s)"
+            self.compiler.resolver = self.resolver
+            return self.compiler.compile_function(func_decl)(args)
+        return super().invoke(func_decl, args)
+
+    def run_function(self, func_decl, args):
+        previous = self.function
+        self.function = func_decl
+        result = super().run_function(func_decl, args)
+        self.function = previous
+        return result
+
+    # Interpreter's loops, counting their iterations
+
+    def count(self, iterations):
+        self.back_edges[self.function] = self.back_edges.get(self.function, 0) + iterations
+
+    def visit_While(self, node):
+        iterations = 0
+        while self.visit(node.condition):
+            iterations += 1
+            result = self.visit(node.body)
+            if result is not None:
+                self.count(iterations)
+                return result
+        self.count(iterations)
+
+    def visit_For(self, node):
+        for slot in node.unset:
+            self.frame[slot] = UNSET
+        if node.init:
+            self.visit(node.init)
+
+        iterations = 0
+        while not node.condition or self.visit(node.condition):
+            iterations += 1
+            result = self.visit(node.body)
+            if result is not None:
+                self.count(iterations)
+                return result
+            if node.update:
+                self.visit(node.update)
+        self.count(iterations)
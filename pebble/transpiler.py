@@ -0,0 +1,464 @@
+import warnings
+
+from pebble.lexer import TokenType
+from pebble.ast import *
+from pebble.compiler import DEFAULT_VALUES
+from pebble import builtins
+from pebble.resolver import UNSET as _UNSET, resolve
+from pebble.interpreter import Interpreter
+from pebble.memo import MISSING
+
+# Translates a Program into Python source, so CPython's own eval loop runs
+# it. Pebble functions become Python functions, locals Python locals, loops
+# native loops. Where Pebble and Python differ the generated code calls the
+# helpers below or inlines the common case:
+#
+# - `+` adds ints inline and calls _add() (string coercion) otherwise;
+# - `/` is int(a / b), truncating like Interpreter;
+# - `&&`/`||` give False/True or the right operand, like Interpreter;
+# - array accesses check the index, inline when the array is a local;
+# - every declaration is renamed after its slot (see pebble.resolver), which
+#   gives block scoping inside a Python function. Names are mangled
+#   (l<slot>_x, g_x, f_x, b_x), so any identifier, including `$` temporaries,
+#   is valid and can't collide with Python names or the helpers.
+#
+# Unbound Python names are turned back into Pebble's "Undefined variable"/
+# "Undefined function" errors by PythonInterpreter.
+
+def _add(a, b):
+    # String concatenation
+    if isinstance(a, str) or isinstance(b, str):
+        return str(a) + str(b)
+    return a + b
+
+def _check_index(arr, index, name):
+    if not isinstance(arr, list):
+        raise Exception(f"Variable {name} is not an array")
+    if index < 0 or index >= len(arr):
+        raise Exception(f"Array index out of bounds: {index}")
+
+def _index(index, arr, name):
+    _check_index(arr, index, name)
+    return arr[index]
+
+def _setindex(arr, index, value, name):
+    _check_index(arr, index, name)
+    arr[index] = value
+
+def _memoized(function, memo):
+    # `function`, looking its arguments up in `memo` (see pebble.memo).
+    def call(*args):
+        key = memo.key(args)
+        if key is None:
+            return function(*args)
+        result = memo.lookup(key)
+        if result is MISSING:
+            result = function(*args)
+            memo.store(key, result)
+        return result
+    return call
+
+def _wrong_arity(function, name, *args):
+    raise Exception(f"Function {name} expects {function.__code__.co_argcount} arguments, got {len(args)}")
+
+def _call(function, name, *args):
+    # A call to a function declared more than once, with different arities.
+    if len(args) != function.__code__.co_argcount:
+        _wrong_arity(function, name, *args)
+    return function(*args)
+
+HELPERS = {
+    '_UNSET': _UNSET, '_add': _add, '_index': _index, '_setindex': _setindex,
+    '_instr': builtins.instr, '_read_int': builtins.read_int, '_read_line': builtins.read_line,
+    '_wrong_arity': _wrong_arity, '_call': _call, '_memoized': _memoized,
+}
+
+BINARY = {
+    TokenType.MINUS: '-',
+    TokenType.MUL: '*',
+    TokenType.MOD: '%',
+    TokenType.EQ: '==',
+    TokenType.NEQ: '!=',
+    TokenType.LT: '<',
+    TokenType.GT: '>',
+    TokenType.LTE: '<=',
+    TokenType.GTE: '>=',
+}
+
+UNARY = {
+    TokenType.MINUS: '-',
+    TokenType.NOT: 'not ',
+    TokenType.PLUS: '+',
+}
+
+def mangle(name):
+    # An injective map from identifiers to [A-Za-z0-9_]: `_` is doubled and
+    # any other character becomes `_` and its hex code.
+    out = []
+    for c in name:
+        if c == '_':
+            out.append('__')
+        elif c.isascii() and c.isalnum():
+            out.append(c)
+        elif ord(c) < 0x100:
+            out.append(f'_{ord(c):02x}')
+        else:
+            out.append(f'_u{ord(c):06x}')
+    return ''.join(out)
+
+def is_int_literal(node):
+    return isinstance(node, Literal) and type(node.value) is int
+
+def is_str_literal(node):
+    return isinstance(node, Literal) and type(node.value) is str
+
+class Transpiler:
+    def __init__(self):
+        self.lines = []
+        self.depth = 0
+        self.varnames = None # Of the function being translated
+        self.temps = 0
+        self.used_globals = set()
+        self.names = {} # Python global name -> Pebble name, for error messages
+        self.arities = {} # Function name -> set of declared parameter counts
+
+    def transpile(self, tree):
+        for decl in tree.declarations:
+            if isinstance(decl, FunctionDecl):
+                self.arities.setdefault(decl.name, set()).add(len(decl.params))
+        for decl in tree.declarations:
+            self.statement(decl)
+        return '\n'.join(self.lines) + '\n'
+
+    def line(self, text):
+        self.lines.append('    ' * self.depth + text)
+
+    def temp(self):
+        self.temps += 1
+        return f'_t{self.temps}'
+
+    def global_name(self, name):
+        python_name = 'g_' + mangle(name)
+        self.names[python_name] = name
+        self.used_globals.add(python_name)
+        return python_name
+
+    def function_name(self, name):
+        python_name = 'f_' + mangle(name)
+        self.names[python_name] = name
+        return python_name
+
+    def local_name(self, slot):
+        return f'l{slot}_{mangle(self.varnames[slot])}'
+
+    # Statements
+
+    def statement(self, node):
+        getattr(self, 'statement_' + type(node).__name__)(node)
+
+    def body(self, node):
+        # An indented suite: the body of an if, while, for or function.
+        self.depth += 1
+        start = len(self.lines)
+        self.statement(node)
+        if len(self.lines) == start:
+            self.line('pass')
+        self.depth -= 1
+
+    def unset(self, slots):
+        for slot in slots:
+            self.line(f'{self.local_name(slot)} = _UNSET')
+
+    def statement_FunctionDecl(self, node):
+        outer = self.lines
+        self.lines = []
+        self.used_globals = set()
+        self.varnames = node.varnames
+        self.depth = 1
+        self.statement(node.block)
+        self.depth = 0
+        params = ', '.join(self.local_name(slot) for slot in range(len(node.params)))
+        body = self.lines
+        if self.used_globals:
+            body.insert(0, '    global ' + ', '.join(sorted(self.used_globals)))
+        if not body:
+            body.append('    pass')
+        self.varnames = None
+        self.lines = outer
+        self.line(f'def {self.function_name(node.name)}({params}):')
+        self.lines.extend(body)
+        if node.memo is not None:
+            # _memos maps the names of the memoized functions to their Memo.
+            name = self.function_name(node.name)
+            self.line(f'{name} = _memoized({name}, _memos[{node.name!r}])')
+
+    def statement_Block(self, node):
+        self.unset(node.unset)
+        for stmt in node.statements:
+            self.statement(stmt)
+
+    def define(self, node, value):
+        if node.slot is None:
+            self.line(f'{self.global_name(node.name)} = {value}')
+        else:
+            self.line(f'{self.local_name(node.slot)} = {value}')
+
+    def statement_VarDecl(self, node):
+        if node.value:
+            value = self.expr(node.value)
+        else:
+            value = repr(DEFAULT_VALUES.get(node.type_node.value))
+        self.define(node, value)
+
+    def statement_ArrayDecl(self, node):
+        if node.values:
+            value = '[' + ', '.join(self.expr(value) for value in node.values) + ']'
+        else:
+            size = node.size
+            if size is None: # Should be caught by parser
+                size = 0
+            value = f'[{DEFAULT_VALUES.get(node.type_node.value, 0)!r}] * {size}'
+        self.define(node, value)
+
+    def statement_Assign(self, node):
+        value = self.expr(node.value)
+        if node.in_bounds:
+            # See pebble.bounds. The index is a local, so it can be read
+            # after the value.
+            self.line(f'{self.local_name(node.slot)}[{self.expr(node.index)}] = {value}')
+            return
+        if node.index:
+            item = self.temp()
+            index = self.temp()
+            self.line(f'{item} = {value}')
+            self.line(f'{index} = {self.expr(node.index)}')
+            arr = self.load(node.slot, node.name)
+            if not isinstance(node.slot, int):
+                self.line(f'_setindex({arr}, {index}, {item}, {node.name!r})')
+                return
+            self.line(f'if {index}.__class__ is int and {arr}.__class__ is list and -1 < {index} < len({arr}):')
+            self.line(f'    {arr}[{index}] = {item}')
+            self.line(f'else:')
+            self.line(f'    _setindex({arr}, {index}, {item}, {node.name!r})')
+            return
+
+        if isinstance(node.slot, int):
+            self.line(f'{self.local_name(node.slot)} = {value}')
+            return
+        slots = node.slot or (None,)
+        certain = slots[-1] is not None
+        temp = self.temp()
+        self.line(f'{temp} = {value}')
+        keyword = 'if'
+        for slot in slots[:-1]:
+            name = self.local_name(slot)
+            self.line(f'{keyword} {name} is not _UNSET:')
+            self.line(f'    {name} = {temp}')
+            keyword = 'elif'
+        if certain:
+            target = self.local_name(slots[-1])
+        else:
+            # Reading the global first fails if it isn't defined (yet).
+            target = self.global_name(node.name)
+        if keyword == 'elif':
+            self.line('else:')
+            self.depth += 1
+        if not certain:
+            self.line(target)
+        self.line(f'{target} = {temp}')
+        if keyword == 'elif':
+            self.depth -= 1
+
+    def statement_If(self, node):
+        self.line(f'if {self.expr(node.condition)}:')
+        self.body(node.then_stmt)
+        if node.else_stmt:
+            self.line('else:')
+            self.body(node.else_stmt)
+
+    def statement_While(self, node):
+        self.line(f'while {self.expr(node.condition)}:')
+        self.body(node.body)
+
+    def statement_For(self, node):
+        # The loop gets its own scope for variables declared in init
+        self.unset(node.unset)
+        if node.init:
+            self.statement(node.init)
+        condition = self.expr(node.condition) if node.condition else 'True'
+        self.line(f'while {condition}:')
+        self.body(node.body)
+        if node.update:
+            self.depth += 1
+            self.statement(node.update)
+            self.depth -= 1
+
+    def statement_Return(self, node):
+        if node.value:
+            self.line(f'return {self.expr(node.value)}')
+        else:
+            self.line('return None')
+
+    def statement_ExprStmt(self, node):
+        self.line(self.expr(node.expr))
+
+    # Expressions (as Python source, evaluated in Interpreter's order)
+
+    def expr(self, node):
+        return getattr(self, 'expr_' + type(node).__name__)(node)
+
+    def load(self, slot, name):
+        if isinstance(slot, int):
+            return self.local_name(slot)
+        if slot is None:
+            return self.global_name(name)
+        if slot[-1] is None:
+            value = self.global_name(name)
+        else:
+            value = self.local_name(slot[-1])
+        for slot in reversed(slot[:-1]):
+            local = self.local_name(slot)
+            value = f'({local} if {local} is not _UNSET else {value})'
+        return value
+
+    def expr_BinOp(self, node):
+        op = node.op.type
+        left = self.expr(node.left)
+        right = self.expr(node.right)
+        if op == TokenType.AND:
+            return f'({right} if {left} else False)'
+        if op == TokenType.OR:
+            return f'(True if {left} else {right})'
+        if op == TokenType.PLUS:
+            if node.spec == 'int_add' or node.spec == 'str_concat':
+                return f'({left} + {right})'
+            if is_str_literal(node.left) and is_str_literal(node.right):
+                return f'({left} + {right})'
+            if is_str_literal(node.right):
+                return f'(str({left}) + {right})'
+            if is_str_literal(node.left):
+                return f'({left} + str({right}))'
+            if is_int_literal(node.left) and is_int_literal(node.right):
+                return f'({left} + {right})'
+            if is_int_literal(node.right):
+                a = self.temp()
+                return f'({a} + {right} if ({a} := {left}).__class__ is int else _add({a}, {right}))'
+            if is_int_literal(node.left):
+                b = self.temp()
+                return f'({left} + {b} if ({b} := {right}).__class__ is int else _add({left}, {b}))'
+            a = self.temp()
+            b = self.temp()
+            return (f'({a} + {b} if ({a} := {left}).__class__ is ({b} := {right}).__class__ is int '
+                    f'else _add({a}, {b}))')
+        if op == TokenType.DIV:
+            return f'int({left} / {right})' # Integer division
+        if op not in BINARY:
+            raise Exception(f"Unknown operator {op}")
+        return f'({left} {BINARY[op]} {right})'
+
+    def expr_UnaryOp(self, node):
+        return f'({UNARY[node.op.type]}{self.expr(node.expr)})'
+
+    def expr_Literal(self, node):
+        return repr(node.value)
+
+    def expr_Var(self, node):
+        return self.load(node.slot, node.value)
+
+    def expr_ArrayAccess(self, node):
+        index = self.expr(node.index)
+        arr = self.load(node.slot, node.name)
+        if node.in_bounds:
+            return f'{arr}[{index}]'
+        if not isinstance(node.slot, int):
+            return f'_index({index}, {arr}, {node.name!r})'
+        # A local can be read at any point, so the index can go first.
+        i = self.temp()
+        return (f'({arr}[{i}] if ({i} := {index}).__class__ is int and {arr}.__class__ is list '
+                f'and -1 < {i} < len({arr}) else _index({i}, {arr}, {node.name!r}))')
+
+    def expr_Call(self, node):
+        # The resolver bound the call to its target and checked the number
+        # of arguments.
+        target = node.target
+        if isinstance(target, builtins.Builtin):
+            args = [self.expr(arg) for arg in node.args]
+            handler = target.handler
+            if handler is builtins.print_value:
+                return f'print({args[0]})'
+            elif handler is builtins.read_int:
+                return '_read_int()'
+            elif handler is builtins.read_line:
+                return '_read_line()'
+            elif handler is len:
+                return f'len({args[0]})'
+            elif handler is builtins.left:
+                return f'{args[0]}[:{args[1]}]'
+            elif handler is builtins.right:
+                return f'{args[0]}[-{args[1]}:]'
+            elif handler is builtins.mid:
+                start = self.temp()
+                return f'{args[0]}[({start} := {args[1]}):{start} + {args[2]}]'
+            elif handler is builtins.instr:
+                return f'_instr({args[0]}, {args[1]})'
+            # Registered by an embedder: PythonInterpreter defines b_<name>.
+            return f'b_{mangle(node.name)}({", ".join(args)})'
+
+        # The function is looked up (and may be undefined) before the
+        # arguments are evaluated, as in Interpreter.
+        function = self.function_name(node.name)
+        args = [self.expr(arg) for arg in node.args]
+        arities = self.arities.get(node.name, set())
+        if arities == {len(args)}:
+            return f'{function}({", ".join(args)})'
+        args = [function, repr(node.name)] + args
+        if len(args) - 2 in arities:
+            return f'_call({", ".join(args)})'
+        return f'_wrong_arity({", ".join(args)})'
+
+def transpile(tree):
+    # Returns (Python source, {Python global name: Pebble name}).
+    resolve(tree)
+    transpiler = Transpiler()
+    source = transpiler.transpile(tree)
+    return source, transpiler.names
+
+class PythonInterpreter:
+    # Runs a Program by transpiling it and executing the Python code.
+    def __init__(self, parser):
+        self.parser = parser
+
+    def interpret(self, tree=None):
+        # `tree` is an already parsed Program, e.g. one loaded from the cache.
+        if tree is None:
+            tree = self.parser.program()
+        source, names = transpile(tree)
+        try:
+            with warnings.catch_warnings():
+                # e.g. "'int' object is not subscriptable" for left(5, 1),
+                # which is a run time error in Pebble.
+                warnings.simplefilter('ignore', SyntaxWarning)
+                code = compile(source, '<pebble>', 'exec')
+        except (SyntaxError, RecursionError, MemoryError):
+            # Deeper nesting than CPython's compiler allows.
+            return Interpreter(None).interpret(tree)
+
+        namespace = dict(HELPERS)
+        namespace['_memos'] = {decl.name: decl.memo for decl in tree.declarations
+                               if isinstance(decl, FunctionDecl) and decl.memo is not None}
+        for name, builtin in builtins.BUILTINS.items():
+            namespace['b_' + mangle(name)] = builtin.handler
+        try:
+            # Defines the globals and functions in declaration order.
+            exec(code, namespace)
+            main = namespace.get('f_main')
+            if not main:
+                raise Exception("No main function found")
+            if main.__code__.co_argcount:
+                _wrong_arity(main, 'main')
+            main()
+        except NameError as e:
+            if e.name not in names:
+                raise
+            kind = 'function' if e.name.startswith('f_') else 'variable'
+            raise Exception(f"Undefined {kind} '{names[e.name]}'") from None
@@ -0,0 +1,284 @@
+from pebble.lexer import TokenType
+from pebble.ast import *
+from pebble.resolver import resolve
+from pebble.builtins import Builtin
+
+# Checks a Program against the declared types of its variables, parameters
+# and functions before it runs, and rejects it if any expression could have
+# the wrong type. Checked BinOps get a `spec` naming the operation their
+# operand types call for (see interpreter.SPECIALIZED), which lets the
+# engines skip their dynamic type tests. Opt-in: `pebble.py --typecheck`.
+#
+# Types are 'int', 'string', 'bool', 'void' and 'int[]', 'string[]',
+# 'bool[]' for arrays. The rules:
+#
+# - `+` adds two ints, or concatenates when either side is a string;
+#   -, *, /, % take ints;
+# - <, >, <=, >= compare two ints or two strings; == and != two values of
+#   the same type;
+# - &&, || and ! take bools, as do the conditions of if, while and for;
+# - initializers, assigned values, arguments and returned values must have
+#   the declared type; void values can't be used at all;
+# - a non-void function must not be able to run off the end of its body.
+
+ARITHMETIC = {
+    TokenType.MINUS: 'int_sub',
+    TokenType.MUL: 'int_mul',
+    TokenType.DIV: 'int_div',
+    TokenType.MOD: 'int_mod',
+}
+
+COMPARISONS = {
+    TokenType.LT: 'lt',
+    TokenType.GT: 'gt',
+    TokenType.LTE: 'le',
+    TokenType.GTE: 'ge',
+}
+
+def is_array(type):
+    return type.endswith('[]')
+
+def declared_type(node):
+    # The type of the variable a VarDecl, ArrayDecl or Param declares.
+    if isinstance(node, ArrayDecl) or (isinstance(node, Param) and node.is_array):
+        return node.type_node.value + '[]'
+    return node.type_node.value
+
+def always_returns(stmt):
+    # Whether running `stmt` can't complete normally.
+    if isinstance(stmt, Return):
+        return True
+    if isinstance(stmt, Block):
+        return any(always_returns(s) for s in stmt.statements)
+    if isinstance(stmt, If):
+        return stmt.else_stmt is not None and always_returns(stmt.then_stmt) and always_returns(stmt.else_stmt)
+    if isinstance(stmt, While):
+        # while (true) only ends by returning
+        return isinstance(stmt.condition, Literal) and stmt.condition.value is True
+    if isinstance(stmt, For):
+        return stmt.condition is None
+    return False
+
+class TypeChecker:
+    def __init__(self, program):
+        self.program = program
+        self.globals = {} # Name -> type
+        self.functions = {} # Name -> FunctionDecl
+        self.function = None # The FunctionDecl being checked
+        self.slot_types = None # Its slot -> type
+
+    def error(self, msg):
+        if self.function is not None:
+            msg = f"{msg} (in function {self.function.name})"
+        raise Exception(f"Type error: {msg}")
+
+    def check(self):
+        for decl in self.program.declarations:
+            if isinstance(decl, FunctionDecl):
+                self.declare_function(decl)
+            else:
+                self.declare(self.globals, decl.name, decl.name, declared_type(decl))
+        for decl in self.program.declarations:
+            self.visit(decl)
+        return self.program
+
+    def declare(self, types, key, name, type):
+        # Record that `key` (a global's name or a slot) holds a `type`.
+        if type.startswith('void'):
+            self.error(f"Variable '{name}' can't be void")
+        if types.setdefault(key, type) != type:
+            self.error(f"Variable '{name}' redeclared as {type}, was {types[key]}")
+
+    def declare_function(self, node):
+        previous = self.functions.setdefault(node.name, node)
+        if previous is not node and self.signature(previous) != self.signature(node):
+            self.error(f"Function {node.name} redeclared with a different signature")
+
+    def signature(self, node):
+        return [declared_type(param) for param in node.params], node.type_node.value
+
+    def visit(self, node):
+        return getattr(self, 'visit_' + type(node).__name__)(node)
+
+    def expect(self, node, expected, what):
+        actual = self.visit(node)
+        if actual != expected:
+            self.error(f"{what} must be {expected}, got {actual}")
+
+    def value(self, node, what):
+        # The type of `node`, which must have a value.
+        type = self.visit(node)
+        if type == 'void':
+            self.error(f"{what} has no value")
+        return type
+
+    def variable(self, slot, name):
+        # The type of the variable `name` resolved to `slot`.
+        if type(slot) is int:
+            return self.slot_types[slot]
+        if slot is None:
+            return self.globals[name]
+        types = {self.globals[name] if candidate is None else self.slot_types[candidate]
+                 for candidate in slot}
+        if len(types) > 1:
+            self.error(f"Variable '{name}' may be any of {', '.join(sorted(types))}")
+        return types.pop()
+
+    # Declarations and statements
+
+    def visit_FunctionDecl(self, node):
+        self.function = node
+        self.slot_types = {}
+        try:
+            for slot, param in enumerate(node.params):
+                self.declare(self.slot_types, slot, param.name, declared_type(param))
+            # Declarations get their types up front: a conditional one may
+            # be referred to before it in the block.
+            for child in walk(node.block):
+                if isinstance(child, (VarDecl, ArrayDecl)):
+                    self.declare(self.slot_types, child.slot, child.name, declared_type(child))
+            self.visit(node.block)
+            if node.type_node.value != 'void' and not always_returns(node.block):
+                self.error(f"Function {node.name} may end without returning a value")
+        finally:
+            self.function = None
+            self.slot_types = None
+
+    def visit_VarDecl(self, node):
+        if node.value:
+            self.expect(node.value, node.type_node.value, f"Initializer of '{node.name}'")
+
+    def visit_ArrayDecl(self, node):
+        for value in node.values or ():
+            self.expect(value, node.type_node.value, f"Element of '{node.name}'")
+
+    def visit_Block(self, node):
+        for stmt in node.statements:
+            self.visit(stmt)
+
+    def visit_Assign(self, node):
+        type = self.variable(node.slot, node.name)
+        if node.index:
+            if not is_array(type):
+                self.error(f"Variable {node.name} is not an array")
+            type = type[:-2]
+            self.expect(node.index, 'int', f"Index of '{node.name}'")
+        self.expect(node.value, type, f"Value assigned to '{node.name}'")
+
+    def visit_If(self, node):
+        self.expect(node.condition, 'bool', "Condition of if")
+        self.visit(node.then_stmt)
+        if node.else_stmt:
+            self.visit(node.else_stmt)
+
+    def visit_While(self, node):
+        self.expect(node.condition, 'bool', "Condition of while")
+        self.visit(node.body)
+
+    def visit_For(self, node):
+        if node.init:
+            self.visit(node.init)
+        if node.condition:
+            self.expect(node.condition, 'bool', "Condition of for")
+        self.visit(node.body)
+        if node.update:
+            self.visit(node.update)
+
+    def visit_Return(self, node):
+        expected = self.function.type_node.value
+        if node.value is None:
+            if expected != 'void':
+                self.error(f"Function {self.function.name} must return {expected}")
+        elif expected == 'void':
+            self.error(f"Function {self.function.name} can't return a value")
+        else:
+            self.expect(node.value, expected, "Returned value")
+
+    def visit_ExprStmt(self, node):
+        self.visit(node.expr)
+
+    # Expressions
+
+    def visit_BinOp(self, node):
+        op = node.op.type
+        left = self.value(node.left, f"Operand of {node.op.value}")
+        right = self.value(node.right, f"Operand of {node.op.value}")
+        operands = f"{left} {node.op.value} {right}"
+
+        if op == TokenType.AND or op == TokenType.OR:
+            if left != 'bool' or right != 'bool':
+                self.error(f"Can't apply {operands}")
+            return 'bool'
+        if op == TokenType.PLUS:
+            if left == right == 'int':
+                node.spec = 'int_add'
+                return 'int'
+            if left == right == 'string':
+                node.spec = 'str_concat'
+                return 'string'
+            if (left == 'string' or right == 'string') and not (is_array(left) or is_array(right)):
+                node.spec = 'concat'
+                return 'string'
+            self.error(f"Can't apply {operands}")
+        if op in ARITHMETIC:
+            if left != 'int' or right != 'int':
+                self.error(f"Can't apply {operands}")
+            node.spec = ARITHMETIC[op]
+            return 'int'
+        if op in COMPARISONS:
+            if left != right or left not in ('int', 'string'):
+                self.error(f"Can't apply {operands}")
+            node.spec = COMPARISONS[op]
+            return 'bool'
+        if op == TokenType.EQ or op == TokenType.NEQ:
+            if left != right:
+                self.error(f"Can't apply {operands}")
+            node.spec = 'eq' if op == TokenType.EQ else 'ne'
+            return 'bool'
+        self.error(f"Unknown operator {op}")
+
+    def visit_UnaryOp(self, node):
+        type = self.value(node.expr, f"Operand of {node.op.value}")
+        expected = 'bool' if node.op.type == TokenType.NOT else 'int'
+        if type != expected:
+            self.error(f"Can't apply {node.op.value} to {type}")
+        return type
+
+    def visit_Literal(self, node):
+        return node.type_name
+
+    def visit_Var(self, node):
+        return self.variable(node.slot, node.value)
+
+    def visit_ArrayAccess(self, node):
+        type = self.variable(node.slot, node.name)
+        if not is_array(type):
+            self.error(f"Variable {node.name} is not an array")
+        self.expect(node.index, 'int', f"Index of '{node.name}'")
+        return type[:-2]
+
+    def visit_Call(self, node):
+        # The resolver checked the function exists and takes this many
+        # arguments.
+        target = node.target
+        if isinstance(target, Builtin):
+            if target.types is None:
+                self.error(f"Builtin {node.name} has no declared types")
+            params, result = target.types
+            for arg, param in zip(node.args, params):
+                type = self.value(arg, f"Argument of {node.name}")
+                if target.handler is len and is_array(type):
+                    continue # length() of an array
+                if param is not None and type != param:
+                    self.error(f"Argument of {node.name} must be {param}, got {type}")
+            return result
+
+        params, result = self.signature(self.functions[node.name])
+        for arg, param in zip(node.args, params):
+            self.expect(arg, param, f"Argument of {node.name}")
+        return result
+
+def typecheck(program):
+    # Check (and annotate) `program`, resolving it first. Raises on the first
+    # type error.
+    return TypeChecker(resolve(program)).check()
@@ -0,0 +1,287 @@
+from pebble.compiler import *
+from pebble import builtins
+from pebble.resolver import UNSET as UNSET_VALUE
+from pebble.memo import MISSING
+
+# Runs the bytecode from pebble.compiler. All Pebble calls run in one loop:
+# a call pushes the caller's state onto `frames` instead of recursing in
+# Python. Values (operands, arguments) live on a single stack.
+#
+# So recursion is only limited by `max_depth`, the number of calls that may
+# be in progress at once; a call beyond it is a stack overflow. A tail call
+# (`return f(...);`, TAIL_CALL) replaces the caller's frame rather than
+# adding one, so tail recursion runs in constant space.
+#
+# A call to a memoized function (see pebble.memo) that misses the cache
+# returns through an extra frame running MEMO_RETURN, which stores the result.
+# That frame doesn't count towards max_depth.
+
+DEFAULT_MAX_DEPTH = 100000
+
+# Its locals are the Memo and the key.
+MEMO_RETURN = Code('<memo>', 0)
+MEMO_RETURN.ops.extend([STORE_MEMO, RETURN])
+MEMO_RETURN.args.extend([0, 0])
+
+class VM:
+    def __init__(self, parser=None, max_depth=DEFAULT_MAX_DEPTH):
+        self.parser = parser
+        self.max_depth = max_depth
+        self.globals = {}
+        self.functions = {} # Name -> Code, filled in as REGISTER runs
+
+    def interpret(self, tree=None):
+        # `tree` is an already parsed Program, e.g. one loaded from the cache.
+        if tree is None:
+            tree = self.parser.program()
+        self.execute(compile_program(tree))
+
+    def execute(self, program):
+        # Define the globals and functions, then run main.
+        self.run(program, [])
+        main = self.functions.get('main')
+        if not main:
+            raise Exception("No main function found")
+        self.run(main, [])
+
+    def run(self, code, args):
+        if len(args) != code.argcount:
+            raise Exception(f"Function {code.name} expects {code.argcount} arguments, got {len(args)}")
+        globals = self.globals
+        functions = self.functions
+        max_depth = self.max_depth
+        frames = []
+        depth = 0 # The calls in `frames`, which also holds MEMO_RETURN frames
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        ops = code.ops
+        opargs = code.args
+        consts = code.consts
+        locals = list(args) + [UNSET_VALUE] * (code.nlocals - code.argcount)
+        pc = 0
+
+        while True:
+            op = ops[pc]
+            arg = opargs[pc]
+            pc += 1
+
+            if op == LOAD:
+                push(locals[arg])
+            elif op == CONST:
+                push(consts[arg])
+            elif op == STORE:
+                locals[arg] = pop()
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == ADD:
+                right = pop()
+                left = stack[-1]
+                # String concatenation
+                if isinstance(left, str) or isinstance(right, str):
+                    stack[-1] = str(left) + str(right)
+                else:
+                    stack[-1] = left + right
+            elif op == LT:
+                right = pop()
+                stack[-1] = stack[-1] < right
+            elif op == SUB:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif op == MUL:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif op == INDEX:
+                arr = pop()
+                index = stack[-1]
+                if not isinstance(arr, list):
+                    raise Exception(f"Variable {consts[arg]} is not an array")
+                if index < 0 or index >= len(arr):
+                    raise Exception(f"Array index out of bounds: {index}")
+                stack[-1] = arr[index]
+            elif op == LOAD_ITEM:
+                stack[-1] = locals[arg][stack[-1]]
+            elif op == STORE_ITEM:
+                index = pop()
+                locals[arg][index] = pop()
+            elif op == LOAD_GLOBAL:
+                name = consts[arg]
+                if name not in globals:
+                    raise Exception(f"Undefined variable '{name}'")
+                push(globals[name])
+            elif op == POP:
+                pop()
+            elif op == FUNCTION:
+                function = functions.get(consts[arg])
+                if not function:
+                    raise Exception(f"Undefined function '{consts[arg]}'")
+                push(function)
+            elif op == CALL or op == TAIL_CALL:
+                if arg:
+                    call_args = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    call_args = []
+                function = pop()
+                if arg != function.argcount:
+                    raise Exception(f"Function {function.name} expects {function.argcount} arguments, got {arg}")
+                if op == CALL:
+                    if depth + 1 >= max_depth:
+                        raise Exception(f"Stack overflow: more than {max_depth} calls in progress, "
+                                        f"calling {function.name}")
+                    memo = function.memo
+                    if memo is not None:
+                        key = memo.key(call_args)
+                        if key is not None:
+                            value = memo.lookup(key)
+                            if value is not MISSING:
+                                push(value)
+                                continue
+                            frames.append((code, pc, locals))
+                            code, pc, locals = MEMO_RETURN, 0, [memo, key]
+                    frames.append((code, pc, locals))
+                    depth += 1
+                code = function
+                ops = code.ops
+                opargs = code.args
+                consts = code.consts
+                locals = call_args
+                if code.nlocals > arg:
+                    locals += [UNSET_VALUE] * (code.nlocals - arg)
+                pc = 0
+            elif op == RETURN or op == RETURN_NONE:
+                value = pop() if op == RETURN else None
+                if not frames:
+                    return value
+                if code is not MEMO_RETURN:
+                    depth -= 1
+                code, pc, locals = frames.pop()
+                ops = code.ops
+                opargs = code.args
+                consts = code.consts
+                push(value)
+            elif op == EQ:
+                right = pop()
+                stack[-1] = stack[-1] == right
+            elif op == NE:
+                right = pop()
+                stack[-1] = stack[-1] != right
+            elif op == LE:
+                right = pop()
+                stack[-1] = stack[-1] <= right
+            elif op == GT:
+                right = pop()
+                stack[-1] = stack[-1] > right
+            elif op == GE:
+                right = pop()
+                stack[-1] = stack[-1] >= right
+            elif op == DIV:
+                right = pop()
+                stack[-1] = int(stack[-1] / right) # Integer division
+            elif op == MOD:
+                right = pop()
+                stack[-1] = stack[-1] % right
+            elif op == AND:
+                if not pop():
+                    push(False)
+                    pc = arg
+            elif op == OR:
+                if pop():
+                    push(True)
+                    pc = arg
+            elif op == NOT:
+                stack[-1] = not stack[-1]
+            elif op == NEG:
+                stack[-1] = -stack[-1]
+            elif op == POS:
+                stack[-1] = +stack[-1]
+            elif op == STORE_INDEX:
+                arr = pop()
+                index = pop()
+                value = pop()
+                if not isinstance(arr, list):
+                    raise Exception(f"Variable {consts[arg]} is not an array")
+                if index < 0 or index >= len(arr):
+                    raise Exception(f"Array index out of bounds: {index}")
+                arr[index] = value
+            elif op == STORE_GLOBAL:
+                name = consts[arg]
+                if name not in globals:
+                    raise Exception(f"Undefined variable '{name}'")
+                globals[name] = pop()
+            elif op == DEFINE_GLOBAL:
+                globals[consts[arg]] = pop()
+            elif op == LOAD_CHECKED:
+                slots, name = consts[arg]
+                for slot in slots:
+                    value = locals[slot]
+                    if value is not UNSET_VALUE:
+                        break
+                else:
+                    if name not in globals:
+                        raise Exception(f"Undefined variable '{name}'")
+                    value = globals[name]
+                push(value)
+            elif op == STORE_CHECKED:
+                slots, name = consts[arg]
+                value = pop()
+                for slot in slots:
+                    if locals[slot] is not UNSET_VALUE:
+                        locals[slot] = value
+                        break
+                else:
+                    if name not in globals:
+                        raise Exception(f"Undefined variable '{name}'")
+                    globals[name] = value
+            elif op == UNSET:
+                locals[arg] = UNSET_VALUE
+            elif op == BUILD_ARRAY:
+                values = stack[-arg:]
+                del stack[-arg:]
+                push(values)
+            elif op == NEW_ARRAY:
+                default, size = consts[arg]
+                push([default] * size)
+            elif op == REGISTER:
+                function = consts[arg]
+                functions[function.name] = function
+            # The builtins the compiler gave their own opcodes (BUILTIN_OPS)
+            # run the same handlers as CALL_BUILTIN, without building an
+            # argument list.
+            elif op == PRINT:
+                stack[-1] = builtins.print_value(stack[-1])
+            elif op == LENGTH:
+                stack[-1] = len(stack[-1])
+            elif op == LEFT:
+                n = pop()
+                stack[-1] = builtins.left(stack[-1], n)
+            elif op == RIGHT:
+                n = pop()
+                stack[-1] = builtins.right(stack[-1], n)
+            elif op == MID:
+                length = pop()
+                start = pop()
+                stack[-1] = builtins.mid(stack[-1], start, length)
+            elif op == INSTR:
+                sub = pop()
+                stack[-1] = builtins.instr(stack[-1], sub)
+            elif op == READ_INT:
+                push(builtins.read_int())
+            elif op == READ_LINE:
+                push(builtins.read_line())
+            elif op == STORE_MEMO:
+                locals[0].store(locals[1], stack[-1])
+            elif op == CALL_BUILTIN:
+                builtin = consts[arg]
+                count = builtin.arity
+                if count:
+                    call_args = stack[-count:]
+                    del stack[-count:]
+                else:
+                    call_args = []
+                push(builtin.handler(*call_args))
+            else:
+                raise Exception(f"Unknown opcode {op}")
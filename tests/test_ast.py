@@ -0,0 +1,71 @@
+import unittest
+import pickle
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pebble.lexer import RegexLexer, TokenType
+from pebble.parser import Parser
+from pebble.ast import *
+
+TEXT = """
+int[] xs = {1, 2, 3};
+int sum(int a[], int n) {
+    int total = 0;
+    for (int i = 0; i < n; i = i + 1) {
+        total = total + a[i];
+    }
+    return -total;
+}
+void main() {
+    if (!(sum(xs, 3) == 6)) { print("bad"); } else { print(true); }
+}
+"""
+
+def parse(text):
+    return Parser(RegexLexer(text)).program()
+
+class TestNodes(unittest.TestCase):
+    def test_slots_and_plain_values(self):
+        program = parse(TEXT)
+        for node in walk(program):
+            self.assertFalse(hasattr(node, '__dict__'), type(node).__name__)
+        func = program.declarations[1]
+        self.assertEqual(func.type_node.value, 'int')
+        ret = func.block.statements[-1]
+        self.assertEqual(ret.value.op.type, TokenType.MINUS)
+        self.assertEqual(ret.value.expr.value, 'total')
+
+    def test_operators_are_shared(self):
+        program = parse("int x = 1 + 2 + 3;")
+        expr = program.declarations[0].value
+        self.assertIs(expr.op, expr.left.op)
+        self.assertIs(pickle.loads(pickle.dumps(expr)).op, expr.op)
+
+    def test_walk(self):
+        program = parse("int f() { return 1 + x; }")
+        names = [type(node).__name__ for node in walk(program)]
+        self.assertEqual(names, ['Program', 'FunctionDecl', 'Type', 'Block', 'Return',
+                                 'BinOp', 'Literal', 'Var'])
+        func = program.declarations[0]
+        self.assertEqual(list(iter_child_nodes(func)), [func.type_node, func.block])
+
+class TestArena(unittest.TestCase):
+    def test_round_trip(self):
+        program = parse(TEXT)
+        arena = Arena.from_tree(program)
+        self.assertEqual(len(arena), len(list(walk(program))) + arena.kinds.count(LIST))
+        self.assertEqual(dump(arena.to_tree()), dump(program))
+
+    def test_layout(self):
+        arena = Arena.from_tree(parse("int x = y;"))
+        # Type, Var, VarDecl, the declarations list, Program
+        self.assertEqual([NODE_CLASSES[kind] if kind != LIST else list for kind in arena.kinds],
+                         [Type, Var, VarDecl, list, Program])
+        start, end = arena.starts[2], arena.starts[3]
+        type_slot, name_slot, value_slot = arena.slots[start:end]
+        self.assertEqual((type_slot, value_slot), (0, 1))
+        self.assertEqual(arena.values[-2 - name_slot], 'x')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pebble.lexer import Lexer
+from pebble.parser import Parser
+from pebble.ast import ArrayAccess, Assign, walk
+from pebble.typechecker import typecheck
+from pebble.optimizer import Optimizer
+from test_interpreter import EngineTests
+
+class TestBounds(EngineTests, unittest.TestCase):
+    def unchecked(self, text, typed=False):
+        # The accesses in main found in bounds, as "a[i]" (reads) or
+        # "a[i]=" (assignments).
+        program = Parser(Lexer(text)).program()
+        if typed:
+            typecheck(program)
+        Optimizer(program, typed).optimize()
+        main = program.declarations[-1]
+        return [f"{node.name}[{node.index.value}]" + ("=" if isinstance(node, Assign) else "")
+                for node in walk(main.block)
+                if isinstance(node, (ArrayAccess, Assign)) and node.in_bounds]
+
+    def test_counted_loops(self):
+        text = """
+        int total(int xs[]) {
+            int t = 0;
+            for (int i = 0; i < length(xs); i = i + 1) t = t + xs[i];
+            return t;
+        }
+        void main() {
+            int[5] a;
+            int[] b = {1, 2, 3};
+            for (int i = 0; i < 5; i = i + 1) a[i] = i * i;
+            for (int i = 1; i < length(b) && a[i] > 0; i = i + 2) print(b[i] + a[i]);
+            for (int i = 0; i < 3; i = i + 1) {
+                for (int j = 0; j < length(a); j = j + 1) b[i] = b[i] + a[j];
+            }
+            print(b[0] + b[1] + b[2] + total(a));
+        }
+        """
+        self.assertEqual(self.unchecked(text), ['a[i]=', 'b[i]', 'b[i]=', 'b[i]', 'a[j]'])
+        self.assertSameOutput(text, "3\n126\n")
+        self.assertSameOutput(text, "3\n126\n", typed=True)
+
+    def test_not_in_bounds(self):
+        text = """
+        void main() {
+            int[] a = {1, 2, 3};
+            int[] b = {1, 2, 3, 4};
+            string s = "abcd";
+            int n = 3;
+            for (int i = 0; i < 4; i = i + 1) print(b[i]);
+            for (int i = 0; i < length(s); i = i + 1) print(left(s, i));
+            for (int i = 0; i < n; i = i + 1) print(a[i]);
+            for (int i = 0; i < 3; i = i + 1) { print(a[i]); i = i + 1; }
+            for (int i = 0; i < 2; i = i + 1) print(a[i + 1]);
+            for (int i = 0; i < length(b); i = i + 1) { a = b; print(a[i]); }
+            for (int i = 0; i < 4; i = i + 1) print(a[i]);
+        }
+        """
+        # Only b[i] in the first loop, before `a = b` made a's length unknown
+        self.assertEqual(self.unchecked(text), ['b[i]'])
+        self.assertSameOutput(text, "1\n2\n3\n4\n\na\nab\nabc\n1\n2\n3\n1\n3\n2\n3\n"
+                                    "1\n2\n3\n4\n1\n2\n3\n4\n")
+
+    def test_untyped_length(self):
+        # Without the typechecker, an array parameter might be a string.
+        text = """
+        void show(int xs[]) { for (int i = 0; i < length(xs); i = i + 1) print(xs[i]); }
+        void main() { int[] a = {7}; show(a); show("x"); }
+        """
+        program = Parser(Lexer(text)).program()
+        optimizer = Optimizer(program)
+        optimizer.optimize()
+        self.assertEqual(optimizer.bounds.removed, 0)
+        self.assertSameOutput(text, "7\nerror: Variable xs is not an array")
+
+        program = typecheck(Parser(Lexer("""
+        void show(int xs[]) { for (int i = 0; i < length(xs); i = i + 1) print(xs[i]); }
+        void main() { int[] a = {7}; show(a); }
+        """)).program())
+        optimizer = Optimizer(program, typed=True)
+        optimizer.optimize()
+        self.assertEqual(optimizer.bounds.removed, 1)
+        self.assertIn("removed 1 array bounds check(s)", optimizer.report())
+
+    def test_out_of_bounds(self):
+        self.assertSameOutput("""
+        void main() {
+            int[3] a;
+            for (int i = 0; i < 3; i = i + 1) a[i] = i;
+            for (int i = 0; i < 4; i = i + 1) print(a[i]);
+        }
+        """, "0\n1\n2\nerror: Array index out of bounds: 3")
+
+if __name__ == '__main__':
+    unittest.main()
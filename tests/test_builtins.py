@@ -0,0 +1,65 @@
+import unittest
+import pickle
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pebble.lexer import Lexer
+from pebble.parser import Parser
+from pebble.resolver import resolve
+from pebble.typechecker import typecheck
+from pebble.builtins import BUILTINS, register_builtin
+from test_interpreter import ENGINES, EngineTests
+
+class TestBuiltins(EngineTests, unittest.TestCase):
+    def setUp(self):
+        self.registered = dict(BUILTINS)
+
+    def tearDown(self):
+        BUILTINS.clear()
+        BUILTINS.update(self.registered)
+
+    def test_registered_builtin(self):
+        register_builtin('pow', 2, pow, pure=True, types=(('int', 'int'), 'int'))
+        register_builtin('twice', 1, lambda s: s + s)
+        text = """
+        int pow(int a, int b) { return 0; }
+        void main() { print(pow(2, 10)); print(twice("ab")); }
+        """
+        # Builtins take precedence over user functions of the same name.
+        self.assertEqual(self.run_all(text), ["1024\nabab\n"] * len(ENGINES))
+
+    def test_replaced_builtin(self):
+        register_builtin('print', 1, lambda value: sys.stdout.write(f"> {value}\n"))
+        self.assertEqual(self.run_all('void main() { print(1 + 2); }'), ["> 3\n"] * len(ENGINES))
+
+    def test_arity_checked_before_running(self):
+        cases = [
+            ("void main() { print(1); print(left(\"a\")); }", "Function left expects 2 arguments, got 1"),
+            ("void main() { print(1); print(length(\"a\", 2)); }", "Function length expects 1 arguments, got 2"),
+            ("int f(int a) { return a; } void main() { print(1); f(); }", "Function f expects 1 arguments, got 0"),
+            ("void main() { print(1); g(); }", "Undefined function 'g'"),
+        ]
+        for text, message in cases:
+            self.assertEqual(self.run_all(text), [f"error: {message}"] * len(ENGINES))
+
+    def test_bound_targets(self):
+        program = resolve(Parser(Lexer("int f() { return length(\"a\"); } void main() { f(); }")).program())
+        f, main = program.declarations
+        self.assertIs(f.block.statements[0].value.target, BUILTINS['length'])
+        self.assertIs(main.block.statements[0].expr.target, f)
+        # Trees refer to builtins by name.
+        copy = pickle.loads(pickle.dumps(program))
+        self.assertIs(copy.declarations[0].block.statements[0].value.target, BUILTINS['length'])
+
+    def test_typecheck_uses_declared_types(self):
+        register_builtin('pow', 2, pow, types=(('int', 'int'), 'int'))
+        register_builtin('untyped', 0, lambda: 1)
+        typecheck(Parser(Lexer("void main() { print(pow(2, 3) + 1); }")).program())
+        with self.assertRaises(Exception) as cm:
+            typecheck(Parser(Lexer("void main() { print(untyped()); }")).program())
+        self.assertEqual(str(cm.exception), "Type error: Builtin untyped has no declared types (in function main)")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import sys
+import os
+import tempfile
+import pickle
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pebble import cache
+from pebble.lexer import RegexLexer
+from pebble.parser import Parser
+from pebble.ast import *
+from pebble.resolver import resolve
+
+SOURCE = b'void main() {\n    string s = "a\nb";\n    print(s + 1);\n}\n'
+DIGEST = cache.digest(SOURCE)
+
+CALLS = []
+
+def record(value):
+    CALLS.append(value)
+
+class Crafted:
+    def __reduce__(self):
+        return (record, ("called",))
+
+def parse(source):
+    return Parser(RegexLexer(source.decode())).program()
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'prog.pebblec')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        tree = parse(SOURCE)
+        self.assertTrue(cache.store(self.path, DIGEST, tree))
+        loaded = cache.load(self.path, DIGEST)
+        self.assertIsInstance(loaded, Program)
+        self.assertEqual(dump(loaded), dump(tree))
+        # Operators stay shared after loading.
+        self.assertIs(loaded.declarations[0].block.statements[1].expr.args[0].op,
+                      tree.declarations[0].block.statements[1].expr.args[0].op)
+
+    def test_lazy_bodies_are_parsed_when_stored(self):
+        tree = Parser(RegexLexer(SOURCE.decode()), lazy=True).program()
+        cache.store(self.path, DIGEST, tree)
+        main = cache.load(self.path, DIGEST).declarations[0]
+        self.assertIsNone(main.parse_block)
+        self.assertEqual(len(main.block.statements), 2)
+
+    def test_invalidated_by_source_and_version(self):
+        cache.store(self.path, DIGEST, parse(SOURCE))
+        self.assertIsNone(cache.load(self.path, cache.digest(SOURCE + b'\n')))
+        version = cache.__version__
+        cache.__version__ = version + '-dev'
+        try:
+            self.assertIsNone(cache.load(self.path, DIGEST))
+        finally:
+            cache.__version__ = version
+        self.assertIsNotNone(cache.load(self.path, DIGEST))
+
+    def test_missing_or_damaged_entry(self):
+        self.assertIsNone(cache.load(self.path, DIGEST))
+        cache.store(self.path, DIGEST, parse(SOURCE))
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 10)
+        self.assertIsNone(cache.load(self.path, DIGEST))
+
+    def test_only_trees_are_loaded(self):
+        # A resolved tree refers to builtins by name.
+        tree = resolve(parse(SOURCE))
+        cache.store(self.path, DIGEST, tree)
+        self.assertEqual(dump(cache.load(self.path, DIGEST)), dump(tree))
+        # An entry that would call anything else is a miss.
+        with open(self.path, 'wb') as f:
+            f.write(cache.header(DIGEST) + pickle.dumps(Crafted(), pickle.HIGHEST_PROTOCOL))
+        self.assertIsNone(cache.load(self.path, DIGEST))
+        self.assertEqual(CALLS, [])
+
+    def test_digest(self):
+        # A file is hashed in chunks, from its current position.
+        with tempfile.TemporaryFile() as f:
+            f.write(b'#' * cache.CHUNK_SIZE + SOURCE)
+            f.seek(cache.CHUNK_SIZE)
+            self.assertEqual(cache.digest(f), DIGEST)
+
+    def test_cache_path(self):
+        self.assertEqual(cache.cache_path('dir/prog.pebble'), 'dir/prog.pebblec')
+        a = cache.cache_path('a/prog.pebble', self.dir.name)
+        b = cache.cache_path('b/prog.pebble', self.dir.name)
+        self.assertNotEqual(a, b)
+        self.assertEqual(os.path.dirname(a), self.dir.name)
+
+    def test_clear(self):
+        cache.store(self.path, DIGEST, parse(SOURCE))
+        cache.store(os.path.join(self.dir.name, 'other.pebblec'), DIGEST, parse(SOURCE))
+        self.assertEqual(cache.clear(self.path), 1)
+        self.assertEqual(cache.clear(cache_dir=self.dir.name), 1)
+        self.assertEqual(os.listdir(self.dir.name), [])
+
+if __name__ == '__main__':
+    unittest.main()
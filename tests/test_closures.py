@@ -0,0 +1,53 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pebble.lexer import Lexer
+from pebble.parser import Parser
+from pebble.closures import ClosureInterpreter
+import test_interpreter
+
+class TestClosureInterpreter(test_interpreter.TestInterpreter):
+    # Runs every interpreter test on the closure engine.
+    def interpret(self, text):
+        lexer = Lexer(text)
+        parser = Parser(lexer)
+        interpreter = ClosureInterpreter(parser)
+        interpreter.interpret()
+        return sys.stdout.getvalue()
+
+    def test_errors_match_interpreter(self):
+        cases = [
+            ("void main() { print(x); }", "Undefined variable 'x'"),
+            ("int g = f(); int f() { return 1; } void main() { }", "Undefined function 'f'"),
+            ("int f(int a) { return a; } void main() { f(); }", "Function f expects 1 arguments, got 0"),
+            ("void main() { int x = 1; x[0] = 2; }", "Variable x is not an array"),
+            ("void main() { print(length()); }", "Function length expects 1 arguments, got 0"),
+            ("void f() { }", "No main function found"),
+        ]
+        for text, message in cases:
+            with self.assertRaises(Exception) as cm:
+                self.interpret(text)
+            self.assertEqual(str(cm.exception), message)
+
+    def test_scoping_and_short_circuit(self):
+        text = """
+        int g = 1;
+        int bump() { g = g + 1; return g; }
+        void main() {
+            int x = 1;
+            { int x = 2; print(x); }
+            for (int x = 5; x < 6; x = x + 1) { print(x); }
+            print(x);
+            print(false && bump() > 0);
+            print(true || bump() > 0);
+            print(1 && "s");
+            print(g + "!");
+        }
+        """
+        self.assertEqual(self.interpret(text).split(), ["2", "5", "1", "False", "True", "s", "1!"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pebble.lexer import Lexer
+from pebble.parser import Parser
+from pebble.ast import Block, VarDecl, While, dump
+from pebble.typechecker import typecheck
+from pebble.optimizer import Optimizer
+from pebble.builtins import BUILTINS, register_builtin
+from test_interpreter import ENGINES, EngineTests
+
+class TestHoister(EngineTests, unittest.TestCase):
+    def optimize(self, text, typed=False):
+        program = Parser(Lexer(text)).program()
+        if typed:
+            typecheck(program)
+        optimizer = Optimizer(program, typed)
+        optimizer.optimize()
+        return program, optimizer.hoister.hoisted
+
+    def hoisted(self, text, typed=False):
+        # The initializers of the temporaries in main.
+        program, _ = self.optimize(text, typed)
+        main = program.declarations[-1]
+        return [dump(stmt.value) for block in main.block.statements if isinstance(block, Block)
+                for stmt in block.statements if isinstance(stmt, VarDecl) and stmt.name.startswith('$')]
+
+    def test_condition(self):
+        program, hoisted = self.optimize("""
+        void main() {
+            string s = "abc";
+            int i = 0;
+            while (i < length(s) * 2) i = i + 1;
+            print(i);
+        }
+        """)
+        self.assertEqual(hoisted, 1)
+        block = program.declarations[0].block.statements[2]
+        temporary, loop = block.statements
+        self.assertEqual(temporary.name, '$1')
+        self.assertIsInstance(loop, While)
+        self.assertEqual(loop.condition.right.value, '$1')
+
+    def test_body_needs_types(self):
+        text = """
+        string s = "hello";
+        void main() {
+            string t = "";
+            for (int i = 0; i < 3; i = i + 1) {
+                t = t + mid(s, 1, 2) + (length(s) - 1);
+            }
+            print(t);
+        }
+        """
+        self.assertEqual(self.hoisted(text), [])
+        self.assertEqual(len(self.hoisted(text, typed=True)), 2)
+        self.assertEqual(self.run_all(text, True, typed=True), ["el4el4el4\n"] * len(ENGINES))
+
+    def test_variant_expressions(self):
+        self.assertEqual(self.hoisted("""
+        int f(int k) { if (k > 0) return f(k - 1); return 1; }
+        void main() {
+            string s = "ab";
+            int n = 0;
+            while (n < length(s)) { s = s + "c"; n = n + 1; }
+            while (n < length(s) + 5) n = n + f(1);
+            for (int i = 0; i < 2; i = i + 1) { int k = i; print(left(s, k + 1)); }
+        }
+        """, typed=True), [])
+
+    def test_length_of_assigned_array(self):
+        text = """
+        void main() {
+            int[4] a;
+            for (int i = 0; i < length(a); i = i + 1) a[i] = i * i;
+            print(a[3]);
+        }
+        """
+        self.assertEqual(len(self.hoisted(text)), 1)
+        self.assertEqual(self.run_all(text, True), ["9\n"] * len(ENGINES))
+
+    def test_failures_stay_put(self):
+        text = """
+        void main() {
+            int z = 0;
+            int i = 0;
+            while (i < 0) { print(10 / z); i = i + 1; }
+            print("ran");
+            while (i < 10 / z) i = i + 1;
+        }
+        """
+        # Only the division in the second condition moves: it runs before
+        # the first iteration anyway.
+        self.assertEqual(self.hoisted(text, typed=True),
+                         ["BinOp(left=Literal(value=10, type_name='int'), op=Operator(DIV, '/'), right=Var(value='z'))"])
+        self.assertEqual(self.run_all(text, True, typed=True), self.run_all(text, False))
+        self.assertEqual(self.run_all(text, True), ["ran\nerror: division by zero"] * len(ENGINES))
+
+    def test_partial_builtins(self):
+        # A pure builtin that isn't total may fail, so it stays in a loop
+        # that doesn't run.
+        registered = dict(BUILTINS)
+        register_builtin('inv', 1, lambda x: 100 // x, pure=True, types=(('int',), 'int'))
+        try:
+            text = """
+            void main() {
+                int z = 0;
+                int n = 0;
+                for (int i = 0; i < n; i = i + 1) print(inv(z));
+                print("done");
+            }
+            """
+            self.assertEqual(self.hoisted(text, typed=True), [])
+            self.assertEqual(self.run_all(text, True, typed=True), ["done\n"] * len(ENGINES))
+        finally:
+            BUILTINS.clear()
+            BUILTINS.update(registered)
+
+    def test_globals_before_initialization(self):
+        text = """
+        int f() {
+            int n = 0;
+            for (int i = 0; i < 0; i = i + 1) n = n + length(s);
+            return n;
+        }
+        int x = f();
+        string s = "abc";
+        void main() { print(x + f()); }
+        """
+        program, _ = self.optimize(text, typed=True)
+        # The loop in f stays as it is; in main, where f is inlined, the
+        # global is defined.
+        loop = program.declarations[0].block.statements[1]
+        self.assertEqual(loop.body.value.right.name, 'length')
+        self.assertEqual(self.run_all(text, True, typed=True), ["0\n"] * len(ENGINES))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pebble.lexer import Lexer
+from pebble.parser import Parser
+from pebble.ast import Call, VarDecl, walk
+from pebble.typechecker import typecheck
+from pebble.optimizer import Optimizer
+from pebble import inliner
+from pebble.builtins import BUILTINS, register_builtin
+from test_interpreter import EngineTests
+
+class TestInliner(EngineTests, unittest.TestCase):
+    def optimize(self, text, typed=False):
+        program = Parser(Lexer(text)).program()
+        if typed:
+            typecheck(program)
+        optimizer = Optimizer(program, typed)
+        optimizer.optimize()
+        return program, optimizer
+
+    def calls(self, program):
+        # The names of the user functions still called.
+        return sorted(node.name for node in walk(program)
+                      if isinstance(node, Call) and node.name not in ('print', 'length'))
+
+    def test_inlined(self):
+        text = """
+        int g = 2;
+        int sq(int x) { return x * x; }
+        int max(int a, int b) { if (a > b) return a; return b; }
+        int clamp(int v, int lo) { int m = max(v, lo); if (m > 9) return 9; else return m; }
+        void show(string s) { if (s == "") return; print("> " + s); }
+        int sum(int xs[], int n) { int t = 0; for (int i = 0; i < n; i = i + 1) t = t + xs[i]; return t; }
+        void main() {
+            int[] a = {1, 2, 3};
+            int x = sq(3) + sq(g + 1);
+            show("x=" + x);
+            show("");
+            if (x > 5) print(clamp(x, 0) + clamp(-x, 1));
+            print(sum(a, 3) + max(sq(2), 3));
+        }
+        """
+        program, optimizer = self.optimize(text, typed=True)
+        self.assertEqual(self.calls(program), [])
+        self.assertEqual(optimizer.inlined, 10)
+        # Unless it is typechecked, indexing xs could fail with an error
+        # that names it, and what follows sum() in its statement can't move
+        # ahead of it.
+        program, optimizer = self.optimize(text)
+        self.assertEqual(self.calls(program), ['max', 'sq', 'sum'])
+        self.assertSameOutput(text, "> x=18\n10\n10\n")
+        self.assertSameOutput(text, "> x=18\n10\n10\n", typed=True)
+
+    def test_not_inlined(self):
+        program, _ = self.optimize("""
+        int fib(int n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+        int even(int n) { if (n == 0) return 1; return odd(n - 1); }
+        int odd(int n) { if (n == 0) return 0; return even(n - 1); }
+        int first(int n) { while (true) { if (n > 3) return n; n = n + 1; } }
+        int s = 1;
+        int shadowed() { return s; }
+        int one() { return 1; }
+        void main() {
+            int s = 2;
+            int i = 0;
+            print(fib(5) + even(3) + first(1) + shadowed());
+            while (i < one()) i = i + 1;
+            int z = 0;
+            print(i / z + one());
+        }
+        """)
+        self.assertEqual(self.calls(program), ['even', 'even', 'fib', 'fib', 'fib', 'first', 'odd',
+                                               'one', 'one', 'shadowed'])
+
+    def test_array_parameters(self):
+        # The inlined body indexes the caller's array itself.
+        text = """
+        void swap(int xs[], int i, int j) { int t = xs[i]; xs[i] = xs[j]; xs[j] = t; }
+        void main() {
+            int[] a = {1, 2, 3};
+            swap(a, 0, 2);
+            swap(a, 1, 1);
+            print(a[0] + " " + a[1] + " " + a[2]);
+            swap(a, 0, 3);
+        }
+        """
+        program, optimizer = self.optimize(text, typed=True)
+        self.assertEqual(self.calls(program), [])
+        self.assertFalse(any(isinstance(node, VarDecl) and node.name.endswith('.xs')
+                             for node in walk(program)))
+        self.assertSameOutput(text, "3 2 1\nerror: Array index out of bounds: 3", typed=True)
+
+    def test_order_of_effects(self):
+        text = """
+        int noisy(int x) { print(x); return x; }
+        int twice(int x) { return x + x; }
+        void main() {
+            print(noisy(1) + twice(noisy(2)) + noisy(3));
+            int[] a = {1};
+            a[noisy(4)] = noisy(5);
+        }
+        """
+        self.assertSameOutput(text, "1\n2\n3\n8\n5\n4\nerror: Array index out of bounds: 4")
+
+    def test_reads_before_calls(self):
+        # A global read before an inlined call must not see what the callee
+        # assigns.
+        text = """
+        int g = 3;
+        int f() { g = 10; return 1; }
+        void main() { print(g - f()); print(g); }
+        """
+        self.assertSameOutput(text, "2\n10\n")
+        self.assertSameOutput(text, "2\n10\n", typed=True)
+
+        # Nor may the callee run before a builtin call that fails.
+        registered = dict(BUILTINS)
+        register_builtin('inv', 1, lambda x: 100 // x, pure=True, types=(('int',), 'int'))
+        try:
+            text = """
+            int f(int x) { print("side"); return x; }
+            void main() { int z = 0; print(inv(z) + f(1)); }
+            """
+            self.assertSameOutput(text, "error: integer division or modulo by zero", typed=True)
+        finally:
+            BUILTINS.clear()
+            BUILTINS.update(registered)
+
+    def test_growth_cap(self):
+        text = """
+        int sq(int x) { return x * x; }
+        void main() { print(sq(1) + sq(2) + sq(3) + sq(4)); }
+        """
+        held = inliner.MAX_GROWTH
+        try:
+            inliner.MAX_GROWTH = 0
+            _, optimizer = self.optimize(text)
+            self.assertEqual(optimizer.inlined, 0)
+            inliner.MAX_GROWTH = 0.5
+            _, optimizer = self.optimize(text)
+            self.assertEqual(optimizer.inlined, 2)
+        finally:
+            inliner.MAX_GROWTH = held
+
+if __name__ == '__main__':
+    unittest.main()
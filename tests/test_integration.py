@@ -2,9 +2,10 @@ import unittest
 import subprocess
 import os
 import sys
+import tempfile
 
 class TestIntegration(unittest.TestCase):
-    def run_pebble(self, filename):
+    def run_pebble(self, filename, *args):
         # We assume tests are run from repo root or tests dir.
         # Let's find pebble.py relative to this file.
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -15,7 +16,7 @@ class TestIntegration(unittest.TestCase):
         env['PYTHONPATH'] = base_dir # Ensure pebble package is found
 
         result = subprocess.run(
-            [sys.executable, pebble_cli, filepath],
+            [sys.executable, pebble_cli, filepath, *args],
             capture_output=True,
             text=True,
             env=env
@@ -37,5 +38,53 @@ class TestIntegration(unittest.TestCase):
         self.assertEqual(res.returncode, 0, f"Error: {res.stderr}")
         self.assertEqual(res.stdout.strip(), "60")
 
+    def test_engines(self):
+        for engine in ('closure', 'vm', 'python', 'tiered'):
+            res = self.run_pebble('fib.pebble', '--no-cache', '--engine', engine)
+            self.assertEqual(res.returncode, 0, f"Error: {res.stderr}")
+            self.assertEqual(res.stdout.strip(), "55")
+
+    def test_max_depth(self):
+        res = self.run_pebble('fib.pebble', '--no-cache', '--engine', 'vm', '--max-depth', '5')
+        self.assertEqual(res.returncode, 1)
+        self.assertEqual(res.stdout.strip(), "Runtime Error: Stack overflow: more than 5 calls in progress, calling fib")
+        res = self.run_pebble('fib.pebble', '--no-cache', '--max-depth', '5')
+        self.assertNotEqual(res.returncode, 0)
+        self.assertIn("--max-depth requires --engine vm", res.stderr)
+
+    def test_tier_log(self):
+        res = self.run_pebble('fib.pebble', '--no-cache', '--engine', 'tiered', '--tier-calls', '5', '--tier-log')
+        self.assertEqual(res.returncode, 0, f"Error: {res.stderr}")
+        self.assertEqual(res.stdout.strip(), "55")
+        self.assertEqual(res.stderr, "tier-up: compiled fib to closures: 5 call(s)\n")
+        res = self.run_pebble('fib.pebble', '--no-cache', '--tier-log')
+        self.assertNotEqual(res.returncode, 0)
+        self.assertIn("require --engine tiered", res.stderr)
+
+    def test_ast_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first = self.run_pebble('fib.pebble', '--cache-dir', cache_dir)
+            entries = os.listdir(cache_dir)
+            self.assertEqual(len(entries), 1)
+            self.assertTrue(entries[0].endswith('.pebblec'))
+            second = self.run_pebble('fib.pebble', '--cache-dir', cache_dir)
+            self.assertEqual((second.returncode, second.stdout), (first.returncode, first.stdout))
+
+            # A damaged entry is ignored and rewritten.
+            path = os.path.join(cache_dir, entries[0])
+            with open(path, 'r+b') as f:
+                f.truncate(60)
+            res = self.run_pebble('fib.pebble', '--cache-dir', cache_dir)
+            self.assertEqual(res.stdout.strip(), "55")
+            self.assertGreater(os.path.getsize(path), 60)
+
+            res = self.run_pebble('fib.pebble', '--cache-dir', cache_dir, '--clear-cache')
+            self.assertEqual(res.returncode, 0)
+            self.assertEqual(os.listdir(cache_dir), [])
+
+            res = self.run_pebble('fib.pebble', '--cache-dir', cache_dir, '--no-cache')
+            self.assertEqual(res.stdout.strip(), "55")
+            self.assertEqual(os.listdir(cache_dir), [])
+
 if __name__ == '__main__':
     unittest.main()
@@ -7,6 +7,43 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from pebble.lexer import Lexer
 from pebble.parser import Parser
 from pebble.interpreter import Interpreter
+from pebble.closures import ClosureInterpreter
+from pebble.vm import VM
+from pebble.transpiler import PythonInterpreter
+from pebble.typechecker import typecheck
+from pebble.optimizer import Optimizer
+
+ENGINES = (Interpreter, ClosureInterpreter, VM, PythonInterpreter)
+
+class EngineTests:
+    # Mixin for tests that run the same program on every engine.
+    def run_all(self, text, optimize=False, typed=False, prepare=None):
+        # The output of `text` on each of ENGINES, ending in "error: ..." if
+        # it fails. Each engine gets a freshly parsed program, typechecked,
+        # optimized and passed to prepare() as requested.
+        outputs = []
+        for engine in ENGINES:
+            program = Parser(Lexer(text)).program()
+            if typed:
+                typecheck(program)
+            if optimize:
+                Optimizer(program, typed).optimize()
+            if prepare:
+                prepare(program)
+            held, sys.stdout = sys.stdout, StringIO()
+            try:
+                engine(None).interpret(program)
+                outputs.append(sys.stdout.getvalue())
+            except Exception as e:
+                outputs.append(sys.stdout.getvalue() + f"error: {e}")
+            finally:
+                sys.stdout = held
+        return outputs
+
+    def assertSameOutput(self, text, expected, typed=False):
+        # Every engine prints `expected`, with and without the optimizer.
+        self.assertEqual(self.run_all(text, False, typed), [expected] * len(ENGINES))
+        self.assertEqual(self.run_all(text, True, typed), [expected] * len(ENGINES))
 
 class TestInterpreter(unittest.TestCase):
     def setUp(self):
@@ -58,6 +95,33 @@ class TestInterpreter(unittest.TestCase):
         output = self.interpret(text)
         self.assertEqual(output.strip(), "55")
 
+    def test_return_from_loops(self):
+        text = """
+        int[] a = {1, 10, 20};
+        int find(int x) {
+            for (int i = 0; i < 3; i = i + 1) {
+                int j = 0;
+                while (true) {
+                    if (a[i] + j == x) return i * 10 + j;
+                    else if (j == 2) j = 5;
+                    j = j + 1;
+                    if (j > 2) print(j);
+                    if (j > 5) return -1;
+                }
+            }
+            return -2;
+        }
+        int twice(int x) { return x * 2; }
+        void nothing() { twice(1); if (true) twice(2); }
+        void main() {
+            print(find(2));
+            print(nothing());
+            print(find(50));
+        }
+        """
+        output = self.interpret(text)
+        self.assertEqual(output.split(), ["1", "None", "6", "-1"])
+
     def test_array(self):
         text = """
         void main() {
@@ -1,9 +1,12 @@
 import unittest
+import io
+import mmap
 import sys
 import os
+import tempfile
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from pebble.lexer import Lexer, TokenType, Token, LexerError
+from pebble.lexer import Lexer, RegexLexer, StreamLexer, TokenType, TokenKind, Token, LexerError, LineIndex, relex
 
 class TestLexer(unittest.TestCase):
     def test_keywords_and_identifiers(self):
@@ -101,5 +104,172 @@ class TestLexer(unittest.TestCase):
         with self.assertRaises(LexerError):
             lexer.get_next_token()
 
+class TestRegexLexer(unittest.TestCase):
+    def tokens(self, lexer_class, text):
+        lexer = lexer_class(text)
+        result = []
+        while True:
+            token = lexer.get_next_token()
+            result.append((token.type, token.value, token.line, token.column))
+            if token.type == TokenType.EOF:
+                return result
+
+    def error(self, lexer_class, text):
+        lexer = lexer_class(text)
+        with self.assertRaises(LexerError) as cm:
+            while lexer.get_next_token().type != TokenType.EOF:
+                pass
+        return str(cm.exception)
+
+    def test_same_tokens_as_lexer(self):
+        text = '''
+        // header comment
+        int[] nums = {1, 22, 333};
+        string s = "multi
+line"; bool flag = true && !false || x_1 <= 2;
+        café = nums[0] >= 10 != (3 % 2 == 1) - -4 / 5 * 6;//trailing'''
+        self.assertEqual(self.tokens(RegexLexer, text), self.tokens(Lexer, text))
+
+    def test_eof_position(self):
+        for text in ["", "x", "x\n", "x // c", "x\n// c\n"]:
+            self.assertEqual(self.tokens(RegexLexer, text), self.tokens(Lexer, text))
+
+    def test_same_errors_as_lexer(self):
+        for text in ["x\n  @", "a & b", "a | b", 'x = "open\nstring']:
+            self.assertEqual(self.error(RegexLexer, text), self.error(Lexer, text))
+
+class TestTokenStream(unittest.TestCase):
+    text = '''
+    int add(int a, int b) { return a + b; } // sum
+    void main() { string s = "two
+lines"; bool ok = true; print(add(1, 22) >= 3 && !ok); }
+    '''
+
+    def test_matches_get_next_token(self):
+        for lexer_class in (Lexer, RegexLexer):
+            stream = lexer_class(self.text).tokenize()
+            lexer = lexer_class(self.text)
+            for index in range(len(stream)):
+                token = lexer.get_next_token()
+                streamed = stream.token(index)
+                self.assertEqual(
+                    (streamed.type, streamed.value, streamed.line, streamed.column, streamed.pos),
+                    (token.type, token.value, token.line, token.column, token.pos))
+            self.assertEqual(token.type, TokenType.EOF)
+
+    def test_integer_kinds_and_side_table(self):
+        stream = RegexLexer('x = 42 + "s";').tokenize()
+        self.assertEqual(list(stream.kinds), [
+            TokenKind.IDENTIFIER, TokenKind.ASSIGN, TokenKind.INTEGER_LIT,
+            TokenKind.PLUS, TokenKind.STRING_LIT, TokenKind.SEMI, TokenKind.EOF])
+        self.assertEqual(list(stream.offsets), [0, 2, 4, 7, 9, 12, 13])
+        self.assertEqual(stream.values, ['x', None, 42, None, 's', None, None])
+
+class TestLineIndex(unittest.TestCase):
+    def test_positions(self):
+        index = LineIndex("ab\ncd\n\nx")
+        self.assertEqual(index.position(0), (1, 1))
+        self.assertEqual(index.position(1), (1, 2))
+        self.assertEqual(index.position(3), (2, 1))
+        self.assertEqual(index.position(6), (3, 1))
+        self.assertEqual(index.position(7), (4, 1))
+
+    def test_end_of_input(self):
+        self.assertEqual(LineIndex("").position(0), (1, 1))
+        self.assertEqual(LineIndex("ab").position(2), (1, 2))
+        self.assertEqual(LineIndex("ab\n").position(3), (2, 0))
+
+    def test_tokens_resolve_positions_lazily(self):
+        lexer = RegexLexer('x\n  "a\nb" y')
+        lexer.get_next_token()
+        string = lexer.get_next_token()
+        name = lexer.get_next_token()
+        self.assertIsNone(lexer.line_index.starts)
+        self.assertEqual((string.pos, string.line, string.column), (4, 3, 3))
+        self.assertEqual((name.pos, name.line, name.column), (10, 3, 4))
+
+class TestStreamLexer(unittest.TestCase):
+    text = '''// a comment that is longer than a chunk
+    int main() {
+        string s = "a string that
+spans lines"; int total = 12345 + café;
+        return total >= 10 && s != "";
+    }
+    '''
+
+    def tokens(self, lexer):
+        stream = lexer.tokenize()
+        return [(t.type, t.value, t.line, t.column, t.pos) for t in map(stream.token, range(len(stream)))]
+
+    def test_tokens_straddling_chunks(self):
+        expected = self.tokens(RegexLexer(self.text))
+        for chunk_size in (1, 2, 3, 5, 8, 64):
+            self.assertEqual(self.tokens(StreamLexer(io.StringIO(self.text), chunk_size)), expected)
+            self.assertEqual(self.tokens(StreamLexer(io.BytesIO(self.text.encode()), chunk_size)), expected)
+
+    def test_mmap(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(self.text.encode())
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                tokens = self.tokens(StreamLexer(source, 16))
+        self.assertEqual(tokens, self.tokens(RegexLexer(self.text)))
+
+    def test_errors(self):
+        for text in ["x\n  @", "a & b", 'x = "open\nstring', "12 \n// only a comment"]:
+            try:
+                expected = self.tokens(RegexLexer(text))
+            except LexerError as e:
+                with self.assertRaises(LexerError) as cm:
+                    self.tokens(StreamLexer(io.StringIO(text), 2))
+                self.assertEqual(str(cm.exception), str(e))
+            else:
+                self.assertEqual(self.tokens(StreamLexer(io.StringIO(text), 2)), expected)
+
+    def test_buffer_is_bounded(self):
+        text = "int x = 1;\n" * 2000
+        lexer = StreamLexer(io.StringIO(text), 64)
+        largest = 0
+        fill = lexer.fill
+        def tracking_fill():
+            nonlocal largest
+            fill()
+            largest = max(largest, len(lexer.text))
+        lexer.fill = tracking_fill
+        self.assertEqual(len(lexer.tokenize()), 5 * 2000 + 1)
+        self.assertLess(largest, 128)
+
+class TestRelex(unittest.TestCase):
+    text = 'func int add(int a, int b) {\n    return a + b; // sum\n}\nstring s = "x y";\nprint(add(1, 2));\n'
+
+    def tokens(self, stream):
+        return [stream.token(i) for i in range(len(stream))]
+
+    def edit(self, stream, text, offset, deleted, inserted):
+        text = text[:offset] + inserted + text[offset + deleted:]
+        result = relex(stream, text, offset, deleted, inserted)
+        self.assertEqual(self.tokens(stream), self.tokens(RegexLexer(text).tokenize()))
+        return text, result
+
+    def test_matches_full_tokenize(self):
+        edits = [(0, 0, ' '), (4, 1, 'ction'), (13, 0, 'x'), (37, 2, ''), (40, 0, '\n'),
+                 (50, 3, '"'), (53, 0, '// '), (60, 5, '42'), (len(self.text), 0, 'x;')]
+        for offset, deleted, inserted in edits:
+            stream = RegexLexer(self.text).tokenize()
+            self.edit(stream, self.text, offset, deleted, inserted)
+
+    def test_successive_edits(self):
+        text = self.text
+        stream = RegexLexer(text).tokenize()
+        for offset, deleted, inserted in [(60, 0, 'a'), (61, 0, 'b'), (5, 3, 'x'), (70, 1, ''), (2, 0, 'x')]:
+            text, _ = self.edit(stream, text, offset, deleted, inserted)
+
+    def test_only_edited_tokens_change(self):
+        stream = RegexLexer(self.text).tokenize()
+        offset = self.text.index('add(1')
+        _, (_, start, old_stop, new_stop) = self.edit(stream, self.text, offset + 1, 0, 'x')
+        self.assertEqual(stream.token(start).value, 'axdd')
+        self.assertEqual((old_stop - start, new_stop - start), (1, 1))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pebble.lexer import Lexer
+from pebble.parser import Parser
+from pebble.memo import Memo, MISSING, memoize
+from test_interpreter import ENGINES, EngineTests
+
+class TestMemo(EngineTests, unittest.TestCase):
+    def run_memoized(self, text, names=None):
+        # The output of each engine, and the (hits, misses) of each
+        # memoized function.
+        programs = []
+        def prepare(program):
+            memoize(program, names)
+            programs.append(program)
+        outputs = self.run_all(text, prepare=prepare)
+        return [(output, {decl.name: (decl.memo.hits, decl.memo.misses)
+                          for decl in program.declarations if getattr(decl, 'memo', None)})
+                for output, program in zip(outputs, programs)]
+
+    def test_purity(self):
+        program = Parser(Lexer("""
+        int n = 10;
+        int g = 1;
+        int[] a = {1, 2};
+        int fib(int k) { if (k < 2) return k; return fib(k - 1) + fib(k - 2); }
+        int scaled(int k) { return fib(k) * n + length("ab"); }
+        int local(int k) { int[3] b; b[0] = k; return b[0]; }
+        int sum(int xs[]) { return xs[0]; }
+        int bump() { g = g + 1; return g; }
+        int uses(int k) { return k + g; }
+        int element(int k) { return a[k]; }
+        int shout(int k) { print(k); return k; }
+        int indirect(int k) { return shout(k) + fib(k); }
+        int twice(int k) { return k; }
+        int twice(int k) { return k * 2; }
+        void nothing(int k) { }
+        void main() { }
+        """)).program()
+        self.assertEqual(memoize(program), {
+            'fib': None,
+            'scaled': None,
+            'local': None,
+            'sum': "it has an array parameter",
+            'bump': "it assigns the global g",
+            'uses': "it reads the global g, which may change",
+            'element': "it indexes a, which may be shared",
+            'shout': "it calls print",
+            'indirect': "it calls shout, which isn't pure",
+            'twice': "it is declared more than once",
+            'nothing': "it returns nothing",
+            'main': "it is main",
+        })
+        memoized = [decl.name for decl in program.declarations if getattr(decl, 'memo', None)]
+        self.assertEqual(memoized, ['fib', 'scaled', 'local'])
+
+    def test_memoized(self):
+        text = """
+        int fib(int n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+        int sq(int n) { return n * n; }
+        void main() { print(fib(20)); print(sq(3) + sq(4) + sq(3)); print(fib(20)); }
+        """
+        self.assertEqual(self.run_memoized(text), [("6765\n34\n6765\n", {'fib': (19, 21), 'sq': (1, 2)})] * len(ENGINES))
+        self.assertEqual(self.run_memoized(text, {'sq'}), [("6765\n34\n6765\n", {'sq': (1, 2)})] * len(ENGINES))
+
+    def test_not_cached(self):
+        # Without the typechecker, values of another type may be passed or
+        # returned.
+        text = """
+        string show(int x) { return "" + x; }
+        int first(int x) { return x[0]; }
+        int fresh(int x) { int[] a = {x}; return a; }
+        void main() {
+            print(show(1) + show(true) + show(1));
+            int[] a = {5};
+            print(first(a));
+            a[0] = 6;
+            print(first(a));
+            int b = fresh(1);
+            b[0] = 2;
+            int c = fresh(1);
+            print(c[0]);
+        }
+        """
+        program = Parser(Lexer(text)).program()
+        self.assertEqual(memoize(program)['first'], "it indexes x, which may be shared")
+        self.assertEqual(self.run_memoized(text), [("1True1\n5\n6\n1\n", {'show': (1, 2), 'fresh': (0, 2)})] * len(ENGINES))
+
+    def test_errors(self):
+        text = """
+        int inverse(int n) { return 100 / n; }
+        void main() { print(inverse(4)); print(inverse(0)); }
+        """
+        self.assertEqual(self.run_memoized(text), [("25\nerror: division by zero", {'inverse': (0, 2)})] * len(ENGINES))
+
+    def test_eviction(self):
+        memo = Memo('f', size=2)
+        calls = []
+        def f(args):
+            calls.append(args[0])
+            return args[0] * 2
+        for n in (1, 2, 1, 3, 2, 1):
+            self.assertEqual(memo.call(f, [n]), n * 2)
+        # 3 evicted 2, the least recently used, then 2 evicted 1.
+        self.assertEqual(calls, [1, 2, 3, 2, 1])
+        self.assertEqual((memo.hits, memo.misses), (1, 5))
+        self.assertIs(memo.lookup(memo.key([3])), MISSING)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pebble.lexer import Lexer
+from pebble.parser import Parser
+from pebble.ast import Block, ExprStmt, For, If, Literal, VarDecl, While, walk
+from pebble.optimizer import Optimizer
+from test_interpreter import ENGINES, EngineTests
+
+class TestOptimizer(EngineTests, unittest.TestCase):
+    def optimize(self, text):
+        optimizer = Optimizer(Parser(Lexer(text)).program())
+        return optimizer.optimize(), optimizer
+
+    def main_body(self, text):
+        program, optimizer = self.optimize(f"void main() {{ {text} }}")
+        return program.declarations[-1].block.statements, optimizer
+
+    def test_folding(self):
+        statements, optimizer = self.main_body(
+            'int x = 60 * 60 * 24; string s = "n=" + (7 / -2) + !false; int y = -7 % 2;')
+        self.assertEqual([stmt.value.value for stmt in statements], [86400, "n=-3True", 1])
+        self.assertEqual(optimizer.report(), ["folded 9 constant expression(s)"])
+
+    def test_failing_operations_are_not_folded(self):
+        statements, optimizer = self.main_body('print(1 / 0); print("a" - 1);')
+        self.assertFalse(any(isinstance(stmt.expr.args[0], Literal) for stmt in statements))
+        self.assertEqual(optimizer.report(), [])
+
+    def test_short_circuits(self):
+        statements, _ = self.main_body(
+            'int f = 1; print(false && f / 0 == 1); print(true || f / 0 == 1); print(true && f > 0);')
+        args = [stmt.expr.args[0] for stmt in statements[1:]]
+        self.assertEqual([arg.value for arg in args[:2]], [False, True])
+        self.assertEqual(args[2].op.value, '>')
+
+    def test_dead_branches_and_loops(self):
+        statements, optimizer = self.main_body("""
+            if (false) print(1); else print(2);
+            if (1 > 2) print(3);
+            while (1 == 2) print(4);
+            for (int i = 5; false && i > 10; i = i + 1) print(i);
+            if (true) { print(6); }
+        """)
+        self.assertFalse(any(isinstance(node, (If, While, For)) for stmt in statements for node in walk(stmt)))
+        # The for's initializer still runs.
+        self.assertIsInstance(statements[1], Block)
+        self.assertIsInstance(statements[1].statements[0], VarDecl)
+        self.assertEqual(optimizer.branches, 2)
+        self.assertEqual(optimizer.loops, 2)
+
+    def test_declaring_branches_are_kept(self):
+        program, _ = self.optimize("int x = 1; void main() { if (false) int x = 2; print(x); }")
+        self.assertIsInstance(program.declarations[-1].block.statements[0], If)
+
+    def test_unreachable_statements(self):
+        program, optimizer = self.optimize("""
+            int f(int n) { while (true) { return n; print(1); } print(2); }
+            void main() { print(f(1)); return; print(3); }
+        """)
+        f, main = program.declarations
+        self.assertEqual(len(f.block.statements[0].body.statements), 1)
+        self.assertEqual(len(main.block.statements), 2)
+        self.assertEqual(optimizer.statements, 2)
+
+    def test_unused_functions(self):
+        program, optimizer = self.optimize("""
+            int a() { return b(); }
+            int b() { return 1; }
+            int c() { return d(); }
+            int d() { return c(); }
+            int e() { return 2; }
+            int g = e();
+            void main() { print(a() + g); }
+        """)
+        names = [decl.name for decl in program.declarations]
+        self.assertEqual(names, ['e', 'g', 'main'])
+        self.assertEqual(optimizer.report(), ["inlined 2 call(s)",
+                                              "removed function c, which is never called",
+                                              "removed function d, which is never called",
+                                              "removed function a, which is inlined wherever it was called",
+                                              "removed function b, which is inlined wherever it was called"])
+
+    def test_errors_in_removed_code(self):
+        with self.assertRaises(Exception) as cm:
+            self.optimize("void f() { g(); } void main() { if (false) print(x); }")
+        self.assertEqual(str(cm.exception), "Undefined function 'g'")
+
+    def test_optimized_programs_run_the_same(self):
+        text = """
+        int[] a = {3, 1, 2};
+        int unused() { return 0; }
+        int sum(int xs[], int n) {
+            int total = 0 * 5;
+            for (int i = 0; i < n && true; i = i + 1) total = total + xs[i];
+            return total;
+            print("never");
+        }
+        void main() {
+            string s = "n=" + sum(a, 3) + " " + (7 / -2) + " " + (2 * 3 > 5);
+            if (length("ab") == 2 || false) print(s); else print("no");
+            while (false) print(1);
+            int i = 0;
+            while (true) { i = i + 1; if (i > 2 * 2) return; }
+        }
+        """
+        self.assertEqual(self.run_all(text, True), self.run_all(text, False))
+        self.assertEqual(self.run_all(text, True), ["n=6 -3 True\n"] * len(ENGINES))
+
+if __name__ == '__main__':
+    unittest.main()
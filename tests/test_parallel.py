@@ -0,0 +1,53 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pebble.lexer import RegexLexer
+from pebble.parser import Parser, declaration_spans
+from pebble.parallel import parse_parallel
+from pebble.ast import *
+
+TEXT = """int x = 1; // a comment with ; and {
+int[] xs = {1, 2, 3};
+string s = "} ; {";
+int f(int a) {
+    if (a > 0) { return xs[a]; }
+    return a;
+}
+void main() {
+    print(f(x) + s);
+}
+"""
+
+class TestDeclarationSpans(unittest.TestCase):
+    def test_spans(self):
+        spans = declaration_spans(TEXT)
+        self.assertEqual(spans[0][0], 0)
+        self.assertEqual(spans[-1][1], len(TEXT))
+        pieces = [TEXT[start:end].strip() for start, end in spans]
+        self.assertEqual(pieces[0], "int x = 1;")
+        self.assertTrue(pieces[1].endswith("int[] xs = {1, 2, 3};"))
+        self.assertEqual(pieces[2], 'string s = "} ; {";')
+        self.assertTrue(pieces[3].startswith("int f(int a) {"))
+        self.assertTrue(pieces[4].startswith("void main()"))
+        self.assertEqual(pieces[5:], [''])
+
+class TestParseParallel(unittest.TestCase):
+    def test_same_program(self):
+        text = TEXT * 20
+        serial = Parser(RegexLexer(text)).program()
+        parallel = parse_parallel(text, 2, min_size=0)
+        self.assertEqual(len(parallel.declarations), 6 * 20 - 20)
+        self.assertEqual(dump(parallel), dump(serial))
+
+    def test_errors_as_serial(self):
+        for text in [TEXT + "int y = ;\n" + TEXT, TEXT + "void g() {", TEXT + "@"]:
+            with self.assertRaises(Exception) as serial:
+                Parser(RegexLexer(text)).program()
+            with self.assertRaises(Exception) as parallel:
+                parse_parallel(text, 2, min_size=0)
+            self.assertEqual(str(parallel.exception), str(serial.exception))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,8 +3,8 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from pebble.lexer import Lexer, TokenType
-from pebble.parser import Parser
+from pebble.lexer import Lexer, RegexLexer, TokenType
+from pebble.parser import Parser, reparse
 from pebble.ast import *
 
 class TestParser(unittest.TestCase):
@@ -70,6 +70,53 @@ class TestParser(unittest.TestCase):
         self.assertEqual(expr.right.left.value, 2)
         self.assertEqual(expr.right.right.value, 3)
 
+    def test_left_associativity_and_levels(self):
+        text = "int x = a - b - c * d || !e && f == g < h;"
+        lexer = Lexer(text)
+        parser = Parser(lexer)
+        program = parser.program()
+
+        # ((a - b) - (c * d)) || ((!e) && (f == (g < h)))
+        expr = program.declarations[0].value
+        self.assertEqual(expr.op.type, TokenType.OR)
+        left, right = expr.left, expr.right
+        self.assertEqual(left.op.type, TokenType.MINUS)
+        self.assertEqual(left.left.op.type, TokenType.MINUS)
+        self.assertEqual(left.left.left.value, 'a')
+        self.assertEqual(left.right.op.type, TokenType.MUL)
+        self.assertEqual(right.op.type, TokenType.AND)
+        self.assertIsInstance(right.left, UnaryOp)
+        self.assertEqual(right.right.op.type, TokenType.EQ)
+        self.assertEqual(right.right.right.op.type, TokenType.LT)
+
+    def test_assignment_forms(self):
+        text = """
+        void main() {
+            x = 1;
+            arr[0] = 2;
+            for (i = 0; i < 3; arr[i] = i) f(i);
+        }
+        """
+        program = Parser(Lexer(text)).program()
+        assign, array_assign, loop = program.declarations[0].block.statements
+        self.assertEqual((assign.name, assign.index), ('x', None))
+        self.assertEqual(array_assign.name, 'arr')
+        self.assertIsInstance(array_assign.index, Literal)
+        self.assertIsInstance(loop.init, Assign)
+        self.assertIsInstance(loop.update, Assign)
+        self.assertEqual(loop.update.name, 'arr')
+
+    def test_invalid_assignment_targets(self):
+        cases = [
+            ("void main() { f() = 1; }", "Invalid assignment target"),
+            ("void main() { for (1 = 2; ;) {} }", "Invalid assignment in for loop init"),
+            ("void main() { for (; ; x + 1 = 2) {} }", "Invalid assignment in for loop update"),
+        ]
+        for text, message in cases:
+            with self.assertRaises(Exception) as cm:
+                Parser(Lexer(text)).program()
+            self.assertEqual(str(cm.exception), message)
+
     def test_if_stmt(self):
         text = """
         void test() {
@@ -108,5 +155,89 @@ class TestParser(unittest.TestCase):
         self.assertEqual(stmt.expr.name, 'print')
         self.assertEqual(len(stmt.expr.args), 1)
 
+class TestLazyParser(unittest.TestCase):
+    text = """
+    int unused(int a) {
+        int[] xs = {1, 2};
+        if (a > 0) { return xs[0]; }
+        return a;
+    }
+    void main() { print(unused(1)); }
+    """
+
+    def test_bodies_parsed_on_first_use(self):
+        program = Parser(Lexer(self.text), lazy=True).program()
+        unused, main = program.declarations
+        self.assertIsNotNone(unused.parse_block)
+        self.assertEqual(main.name, 'main')
+        self.assertEqual(len(unused.block.statements), 3)
+        self.assertIsNone(unused.parse_block)
+        self.assertIsInstance(unused.block.statements[1].then_stmt, Block)
+
+    def test_syntax_error_deferred(self):
+        text = "int broken() { return 1 +; }\nvoid main() { }"
+        program = Parser(Lexer(text), lazy=True).program()
+        broken, main = program.declarations
+        self.assertEqual(main.block.statements, [])
+        with self.assertRaises(Exception) as eager:
+            Parser(Lexer(text)).program()
+        with self.assertRaises(Exception) as lazy:
+            broken.block
+        self.assertEqual(str(lazy.exception), str(eager.exception))
+
+    def test_parse_bodies(self):
+        parser = Parser(Lexer("void main() { x = ; }"), lazy=True)
+        program = parser.program()
+        with self.assertRaises(Exception) as cm:
+            parser.parse_bodies(program)
+        self.assertEqual(str(cm.exception), "Unexpected token in factor")
+
+    def test_unbalanced_body_fails_at_parse(self):
+        with self.assertRaises(Exception) as cm:
+            Parser(Lexer("void main() { if (x) {"), lazy=True).program()
+        self.assertEqual(str(cm.exception), "Expected RBRACE, got Token(EOF, None, line=1, col=22)")
+
+class TestReparse(unittest.TestCase):
+    text = """int g = 1;
+int twice(int a) {
+    return a * 2;
+}
+int[] xs = {1, 2};
+void main() {
+    print(twice(g));
+}
+"""
+
+    def test_unchanged_declarations_are_reused(self):
+        program = reparse(None, self.text)
+        g, twice, xs, main = program.declarations
+        text = self.text.replace("a * 2", "a * 2 + 0")
+        updated = reparse(program, text)
+        self.assertIs(updated.declarations[0], g)
+        self.assertIsNot(updated.declarations[1], twice)
+        self.assertIs(updated.declarations[2], xs)
+        self.assertIs(updated.declarations[3], main)
+        self.assertEqual(updated.declarations[1].block.statements[0].value.op.type, TokenType.PLUS)
+
+    def test_declarations_added_and_moved(self):
+        program = reparse(None, self.text)
+        g, twice, xs, main = program.declarations
+        text = "// header\n\n" + self.text.replace("int g = 1;", "int g = 1; int h = 2;")
+        updated = reparse(program, text)
+        self.assertEqual([decl.name for decl in updated.declarations], ['g', 'h', 'twice', 'xs', 'main'])
+        self.assertIsNot(updated.declarations[0], g) # The comment is part of its span
+        self.assertIs(updated.declarations[2], twice)
+        self.assertIs(updated.declarations[4], main)
+        self.assertEqual(dump(updated), dump(Parser(RegexLexer(text)).program()))
+
+    def test_errors(self):
+        program = reparse(None, self.text)
+        text = self.text.replace("return a * 2;", "return a * ;")
+        with self.assertRaises(Exception) as cm:
+            reparse(program, text)
+        self.assertEqual(str(cm.exception), "Unexpected token in factor")
+        main = program.declarations[3]
+        self.assertIs(reparse(program, self.text).declarations[3], main)
+
 if __name__ == '__main__':
     unittest.main()
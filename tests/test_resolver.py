@@ -0,0 +1,88 @@
+import unittest
+from io import StringIO
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pebble.lexer import Lexer
+from pebble.parser import Parser
+from pebble.interpreter import Interpreter
+from pebble.resolver import Resolver, resolve
+
+class TestResolver(unittest.TestCase):
+    def resolve(self, text):
+        return resolve(Parser(Lexer(text)).program())
+
+    def test_slots(self):
+        program = self.resolve("""
+        int g = 1;
+        int f(int a, int b) {
+            int c = a;
+            { int d = b; c = d + g; }
+            for (int i = 0; i < c; i = i + 1) { int d = i; }
+            return c;
+        }
+        """)
+        g, f = program.declarations
+        self.assertIsNone(g.slot)
+        self.assertEqual(f.varnames, ['a', 'b', 'c', 'd', 'i', 'd'])
+        decl, block, loop, ret = f.block.statements
+        self.assertEqual((decl.slot, decl.value.slot), (2, 0))
+        assign = block.statements[1]
+        self.assertEqual(assign.slot, 2)
+        self.assertEqual((assign.value.left.slot, assign.value.right.slot), (3, None))
+        self.assertEqual(loop.body.statements[0].slot, 5)
+        self.assertEqual(ret.value.slot, 2)
+
+    def test_conditional_declarations(self):
+        program = self.resolve("""
+        int x = 1;
+        void main() {
+            if (x == 1) int x = 2;
+            print(x);
+        }
+        """)
+        main = program.declarations[1]
+        cond, call = main.block.statements
+        self.assertEqual(main.block.unset, (0,))
+        self.assertEqual(cond.condition.left.slot, (0, None))
+        self.assertEqual(cond.then_stmt.slot, 0)
+        self.assertEqual(call.expr.args[0].slot, (0, None))
+
+    def test_undefined_variable(self):
+        # Reported before the program runs, even in code that never runs.
+        text = """
+        void f() { print(y); }
+        void main() { print("started"); }
+        """
+        with self.assertRaises(Exception) as cm:
+            self.resolve(text)
+        self.assertEqual(str(cm.exception), "Undefined variable 'y'")
+
+        held, sys.stdout = sys.stdout, StringIO()
+        try:
+            with self.assertRaises(Exception) as cm:
+                Interpreter(Parser(Lexer(text))).interpret()
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = held
+        self.assertEqual(str(cm.exception), "Undefined variable 'y'")
+        self.assertEqual(output, "")
+
+    def test_out_of_scope(self):
+        with self.assertRaises(Exception) as cm:
+            self.resolve("void main() { { int x = 1; } print(x); }")
+        self.assertEqual(str(cm.exception), "Undefined variable 'x'")
+
+    def test_lazy_bodies(self):
+        # Bodies that aren't parsed yet are resolved on their first call.
+        program = Parser(Lexer("void f() { int x = 1; } void main() { }"), lazy=True).program()
+        Resolver(program).resolve()
+        f = program.declarations[0]
+        self.assertIsNone(f.varnames)
+        self.assertIsNotNone(f.parse_block)
+        resolve(program)
+        self.assertEqual(f.varnames, ['x'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pebble.lexer import Lexer
+from pebble.parser import Parser
+from pebble.tiered import TieredInterpreter
+from pebble.memo import memoize
+import test_interpreter
+
+class TestTieredInterpreter(test_interpreter.TestInterpreter):
+    # Runs every interpreter test with low thresholds, so functions switch
+    # to closures partway through.
+    def interpret(self, text):
+        interpreter = TieredInterpreter(Parser(Lexer(text)), call_threshold=2, loop_threshold=3)
+        interpreter.interpret()
+        return sys.stdout.getvalue()
+
+    def test_tier_up(self):
+        text = """
+        int fib(int n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+        int sum(int n) { int t = 0; int i = 0; while (i < n) { t = t + i; i = i + 1; } return t; }
+        int twice(int n) { return n * 2; }
+        int quad(int n) { return twice(twice(n)); }
+        void main() {
+            print(sum(20));
+            print(sum(3));
+            print(fib(10));
+            print(quad(1) + quad(2));
+        }
+        """
+        log = []
+        interpreter = TieredInterpreter(Parser(Lexer(text)), call_threshold=10, loop_threshold=20, log=log.append)
+        interpreter.interpret()
+        self.assertEqual(sys.stdout.getvalue().split(), ["190", "3", "55", "12"])
+        # quad is only called twice, but the twice calls in it are counted
+        # until it is.
+        self.assertEqual(interpreter.events, [
+            ('sum', "20 loop iteration(s)"),
+            ('fib', "10 call(s)"),
+        ])
+        self.assertEqual(log, [
+            "compiled sum to closures: 20 loop iteration(s)",
+            "compiled fib to closures: 10 call(s)",
+        ])
+
+    def test_callees_compiled(self):
+        text = """
+        int inc(int n) { return n + 1; }
+        int count(int n) { int t = 0; for (int i = 0; i < n; i = i + 1) t = inc(t); return t; }
+        void main() { print(count(3)); print(count(4)); }
+        """
+        interpreter = TieredInterpreter(Parser(Lexer(text)), call_threshold=2, loop_threshold=100)
+        interpreter.interpret()
+        self.assertEqual(sys.stdout.getvalue().split(), ["3", "4"])
+        self.assertEqual(interpreter.events, [
+            ('inc', "2 call(s)"),
+            ('count', "2 call(s)"),
+        ])
+
+    def test_memoized(self):
+        text = """
+        int fib(int n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+        void main() { print(fib(20)); print(fib(20)); }
+        """
+        program = Parser(Lexer(text)).program()
+        memoize(program)
+        interpreter = TieredInterpreter(None, call_threshold=5)
+        interpreter.interpret(program)
+        self.assertEqual(sys.stdout.getvalue().split(), ["6765", "6765"])
+        fib = program.declarations[0]
+        self.assertEqual((fib.memo.hits, fib.memo.misses), (19, 21))
+        self.assertEqual(interpreter.events, [('fib', "5 call(s)")])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pebble.lexer import Lexer
+from pebble.parser import Parser
+from pebble.transpiler import PythonInterpreter, transpile, mangle
+import test_interpreter
+
+class TestPythonInterpreter(test_interpreter.TestInterpreter):
+    # Runs every interpreter test on the Python backend.
+    def interpret(self, text):
+        lexer = Lexer(text)
+        parser = Parser(lexer)
+        interpreter = PythonInterpreter(parser)
+        interpreter.interpret()
+        return sys.stdout.getvalue()
+
+    def test_errors_match_interpreter(self):
+        cases = [
+            ("void main() { print(x); }", "Undefined variable 'x'"),
+            ("void main() { x = 1; }", "Undefined variable 'x'"),
+            ("int f() { late = 1; return 1; } int g = f(); int late = 0; void main() { }",
+             "Undefined variable 'late'"),
+            ("int g = f(); int f() { return 1; } void main() { }", "Undefined function 'f'"),
+            ("int f(int a) { return a; } void main() { f(); }", "Function f expects 1 arguments, got 0"),
+            ("void main(int a) { }", "Function main expects 1 arguments, got 0"),
+            ("void main() { int x = 1; x[0] = 2; }", "Variable x is not an array"),
+            ("void main() { int[] a = {1}; print(a[-1]); }", "Array index out of bounds: -1"),
+            ("void main() { print(length()); }", "Function length expects 1 arguments, got 0"),
+            ("void f() { }", "No main function found"),
+        ]
+        for text, message in cases:
+            with self.assertRaises(Exception) as cm:
+                self.interpret(text)
+            self.assertEqual(str(cm.exception), message)
+
+    def test_semantics(self):
+        text = """
+        int x = 1;
+        void main() {
+            print(7 / -2);
+            print(1 + "a" + true);
+            print(0 && 1);
+            print(2 || 0);
+            print(1 && "s");
+            int i = 0;
+            while (i < 2) {
+                if (i == 1) int x = 10;
+                print(x);
+                i = i + 1;
+            }
+            { int x = 3; print(x); }
+            print(x);
+        }
+        """
+        self.assertEqual(self.interpret(text).split(),
+                         ["-3", "1aTrue", "False", "True", "s", "1", "10", "3", "1"])
+
+    def test_mangle(self):
+        names = ['x', '_x', 'x_', '__', 'x$1', 'x_241', 'class', 'print']
+        mangled = [mangle(name) for name in names]
+        self.assertEqual(len(set(mangled)), len(names))
+        for name in mangled:
+            self.assertRegex(name, r'^[A-Za-z0-9_]*$')
+        source, _ = transpile(Parser(Lexer("int class = 1; void main() { print(class); }")).program())
+        self.assertIn("g_class = 1", source)
+
+if __name__ == '__main__':
+    unittest.main()
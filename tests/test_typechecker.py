@@ -0,0 +1,95 @@
+import unittest
+from io import StringIO
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pebble.lexer import Lexer
+from pebble.parser import Parser
+from pebble.ast import BinOp, walk
+from pebble.interpreter import Interpreter
+from pebble.closures import ClosureInterpreter
+from pebble.vm import VM
+from pebble.transpiler import PythonInterpreter
+from pebble.typechecker import typecheck
+
+class TestTypeChecker(unittest.TestCase):
+    def check(self, text):
+        return typecheck(Parser(Lexer(text)).program())
+
+    def assertTypeError(self, text, message):
+        with self.assertRaises(Exception) as cm:
+            self.check(text)
+        self.assertEqual(str(cm.exception), "Type error: " + message)
+
+    def test_specs(self):
+        program = self.check("""
+        string s = "a";
+        int f(int a, int b) {
+            if (a < b && s == "a") return a + b;
+            return a / b - a % b * 2;
+        }
+        void main() { print(s + f(1, 2)); print(s + s); print(s < "b"); }
+        """)
+        specs = [node.spec for node in walk(program) if isinstance(node, BinOp)]
+        self.assertEqual(specs, [None, 'lt', 'eq', 'int_add', 'int_sub', 'int_div', 'int_mul',
+                                 'int_mod', 'concat', 'str_concat', 'lt'])
+
+    def test_specialized_programs_run_the_same(self):
+        text = """
+        int[] a = {3, 1, 2};
+        int sum(int xs[], int n) {
+            int total = 0;
+            for (int i = 0; i < n; i = i + 1) total = total + xs[i];
+            return total;
+        }
+        void main() {
+            string s = "n=" + sum(a, 3) + " " + (7 / -2) + " " + true;
+            print(s);
+            print("b" > "a" || 1 / 0 == 0);
+            print(!(length(s) >= 3));
+        }
+        """
+        expected = "n=6 -3 True\nTrue\nFalse\n"
+        for engine in (Interpreter, ClosureInterpreter, VM, PythonInterpreter):
+            held, sys.stdout = sys.stdout, StringIO()
+            try:
+                engine(None).interpret(self.check(text))
+                output = sys.stdout.getvalue()
+            finally:
+                sys.stdout = held
+            self.assertEqual(output, expected, engine.__name__)
+
+    def test_errors(self):
+        self.assertTypeError("void main() { int x = true; }",
+                             "Initializer of 'x' must be int, got bool (in function main)")
+        self.assertTypeError("void main() { print(1 + true); }",
+                             "Can't apply int + bool (in function main)")
+        self.assertTypeError("void main() { print(1 < \"a\"); }",
+                             "Can't apply int < string (in function main)")
+        self.assertTypeError("void main() { if (1) print(1); }",
+                             "Condition of if must be bool, got int (in function main)")
+        self.assertTypeError("void main() { string s = \"a\"; print(s[0]); }",
+                             "Variable s is not an array (in function main)")
+        self.assertTypeError("int f() { } void main() { }",
+                             "Function f may end without returning a value (in function f)")
+        self.assertTypeError("void f() { } void main() { print(f()); }",
+                             "Argument of print has no value (in function main)")
+        self.assertTypeError("int f(int x) { return x; } void main() { f(\"a\"); }",
+                             "Argument of f must be int, got string (in function main)")
+        self.assertTypeError("void main() { print(read_line() < 1); }",
+                             "Can't apply string < int (in function main)")
+        self.assertTypeError("int x = 1; void main() { if (true) string x = \"a\"; x = 2; }",
+                             "Variable 'x' may be any of int, string (in function main)")
+        self.assertTypeError("void main() { int x = 1; string x = \"a\"; }",
+                             "Variable 'x' redeclared as string, was int (in function main)")
+
+    def test_loops_that_only_return(self):
+        self.check("""
+        int f(int n) { while (true) { if (n > 3) return n; n = n + 1; } }
+        int g() { for (;;) return 1; }
+        void main() { print(f(0) + g()); }
+        """)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pebble.lexer import Lexer
+from pebble.parser import Parser
+from pebble.compiler import compile_program, disassemble
+from pebble.vm import VM
+from pebble.memo import memoize
+import test_interpreter
+
+class TestVM(test_interpreter.TestInterpreter):
+    # Runs every interpreter test on the bytecode VM.
+    def interpret(self, text):
+        lexer = Lexer(text)
+        parser = Parser(lexer)
+        vm = VM(parser)
+        vm.interpret()
+        return sys.stdout.getvalue()
+
+    def test_errors_match_interpreter(self):
+        cases = [
+            ("void main() { print(x); }", "Undefined variable 'x'"),
+            ("void main() { x = 1; }", "Undefined variable 'x'"),
+            ("int g = f(); int f() { return 1; } void main() { }", "Undefined function 'f'"),
+            ("int f(int a) { return a; } void main() { f(); }", "Function f expects 1 arguments, got 0"),
+            ("void main() { int x = 1; x[0] = 2; }", "Variable x is not an array"),
+            ("void main() { int[] a = {1}; print(a[1]); }", "Array index out of bounds: 1"),
+            ("void main() { print(length()); }", "Function length expects 1 arguments, got 0"),
+            ("void f() { }", "No main function found"),
+        ]
+        for text, message in cases:
+            with self.assertRaises(Exception) as cm:
+                self.interpret(text)
+            self.assertEqual(str(cm.exception), message)
+
+    def test_scopes(self):
+        text = """
+        int x = 1;
+        void main() {
+            print(x);
+            int x = 2;
+            { print(x); int x = 3; print(x); }
+            for (int x = 5; x < 6; x = x + 1) { print(x); }
+            print(x);
+        }
+        """
+        self.assertEqual(self.interpret(text).split(), ["1", "2", "3", "5", "2"])
+
+    def test_conditional_declarations(self):
+        # A declaration that is the whole body of an if/while/for only
+        # shadows the outer variable once it has run; in the same scope it
+        # redefines it.
+        text = """
+        int x = 1;
+        void main() {
+            int i = 0;
+            while (i < 2) {
+                if (i == 1) int x = 10;
+                print(x);
+                i = i + 1;
+            }
+            int y = 0;
+            while (y < 3) int y = y + 5;
+            print(y);
+        }
+        """
+        self.assertEqual(self.interpret(text).split(), ["1", "10", "5"])
+
+    def test_deep_recursion(self):
+        # Pebble calls don't nest Python frames.
+        text = """
+        int down(int n) { if (n == 0) return 0; return down(n - 1) + 1; }
+        void main() { print(down(5000)); }
+        """
+        self.assertEqual(self.interpret(text).strip(), "5000")
+
+    def test_max_depth(self):
+        text = """
+        int down(int n) { if (n == 0) return 0; return down(n - 1) + 1; }
+        void main() { print(down(10)); print(down(100)); }
+        """
+        vm = VM(Parser(Lexer(text)), max_depth=50)
+        with self.assertRaises(Exception) as cm:
+            vm.interpret()
+        self.assertEqual(str(cm.exception), "Stack overflow: more than 50 calls in progress, calling down")
+        self.assertEqual(sys.stdout.getvalue(), "10\n")
+
+    def test_max_depth_memoized(self):
+        # The frames storing memoized results don't count as calls.
+        def run(n):
+            text = f"""
+            int down(int n) {{ if (n == 0) return 0; int r = down(n - 1); return r + 1; }}
+            void main() {{ print(down({n})); }}
+            """
+            program = Parser(Lexer(text)).program()
+            memoize(program)
+            VM(None, max_depth=50).interpret(program)
+        run(48)
+        self.assertEqual(sys.stdout.getvalue(), "48\n")
+        with self.assertRaises(Exception) as cm:
+            run(49)
+        self.assertEqual(str(cm.exception), "Stack overflow: more than 50 calls in progress, calling down")
+
+    def test_tail_calls(self):
+        # A tail call replaces the caller's frame, so the depth limit
+        # doesn't apply to tail recursion.
+        text = """
+        int sum(int n, int total) { if (n == 0) return total; return sum(n - 1, total + n); }
+        int even(int n) { if (n == 0) return 1; return odd(n - 1); }
+        int odd(int n) { if (n == 0) return 0; return even(n - 1); }
+        void main() { print(sum(100000, 0)); print(even(7) + even(10)); }
+        """
+        vm = VM(Parser(Lexer(text)), max_depth=3)
+        vm.interpret()
+        self.assertEqual(sys.stdout.getvalue().split(), ["5000050000", "1"])
+        listing = disassemble(compile_program(Parser(Lexer(text)).program()))
+        self.assertEqual(listing.count("TAIL_CALL"), 3)
+
+    def test_disassemble(self):
+        text = "int g = 2; int twice(int n) { return n * g; } void main() { print(twice(3)); }"
+        listing = disassemble(compile_program(Parser(Lexer(text)).program()))
+        self.assertIn("DEFINE_GLOBAL 1     ('g')", listing)
+        self.assertIn("twice (args=1, locals=1):", listing)
+        self.assertIn("LOAD          0     (n)", listing)
+        self.assertIn("LOAD_GLOBAL   0     ('g')", listing)
+        self.assertIn("CALL          1", listing)
+
+if __name__ == '__main__':
+    unittest.main()